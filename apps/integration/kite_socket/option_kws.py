@@ -1,16 +1,20 @@
 import datetime as dt
 from datetime import date
 
-import numpy as np
 import pandas as pd
 from asgiref.sync import async_to_sync
 from dateutil.parser import parse
+from django.conf import settings
 from django.core.cache import cache
 from django.utils import timezone
 
+from apps.integration.kite_socket.tick_pipeline import TickPipeline
 from apps.integration.models import ZerodhaApi
 from trading.settings import env
+from utils.archive import TickRecorder
 from utils.broker.kiteext import KiteExt
+from utils.option_chain import OptionChainStore
+from utils.telegram import send_message
 
 
 def on_connect(ws, response):
@@ -19,68 +23,34 @@ def on_connect(ws, response):
 
 
 def on_ticks(ws, ticks):
-    instruments = cache.get("OPTION_INSTRUMENTS")
-    df = pd.DataFrame(ticks)
-    if not df.empty:
-        set_instrument_cache(df, instruments)
+    ws.pipeline.put(ticks)
     if timezone.localtime().time() > dt.time(15, 30):
         ws.unsubscribe(ws.instrument_tokens)
         ws.close()
 
 
-def set_instrument_cache(df, instruments):
-    df = df[
-        [
-            "instrument_token",
-            "last_price",
-            "exchange_timestamp",
-            "last_trade_time",
-            "oi",
-        ]
-    ].copy()
-    df.rename(columns={"instrument_token": "kite_instrument_token"}, inplace=True)
-    instruments = instruments.merge(df, how="left", on="kite_instrument_token")
-    instruments["last_price"] = instruments["last_price_y"].fillna(instruments["last_price_x"])
-    instruments["exchange_timestamp"] = instruments["exchange_timestamp_y"].fillna(instruments["exchange_timestamp_x"])
-    instruments["last_trade_time"] = instruments["last_trade_time_y"].fillna(instruments["last_trade_time_x"])
-    instruments["oi"] = instruments["oi_y"].fillna(instruments["oi_x"])
-    instruments.drop(
-        columns=[
-            "last_price_x",
-            "last_price_y",
-            "exchange_timestamp_x",
-            "exchange_timestamp_y",
-            "last_trade_time_x",
-            "last_trade_time_y",
-            "oi_x",
-            "oi_y",
-        ],
-        inplace=True,
-    )
-    cache.set("OPTION_INSTRUMENTS", instruments)
-
-
 def on_close(ws, code, reason):
     if not code and not reason:
+        ws.pipeline.stop()
         ws.stop()
 
 
-def get_instruments(kite: KiteExt, exchange=None, name=None, expiry=None):
+def get_instruments(kite: KiteExt, exchange=None, names=None, expiry=None):
     try:
         instrument = pd.DataFrame(async_to_sync(kite.instruments)(exchange=exchange))
         if expiry:
-            instrument = instrument[(instrument["name"] == name) & (instrument["expiry"] == expiry)].reset_index(
+            instrument = instrument[(instrument["name"].isin(names)) & (instrument["expiry"] == expiry)].reset_index(
                 drop=True
             )
         else:
-            instrument = instrument[(instrument["name"] == name)].reset_index(drop=True)
+            instrument = instrument[(instrument["name"].isin(names))].reset_index(drop=True)
     except Exception:
-        return get_instruments(kite, exchange, name, expiry)
+        return get_instruments(kite, exchange, names, expiry)
     else:
         return instrument[instrument["instrument_type"].isin(["CE", "PE"])]
 
 
-def get_kotak_neo_instruments():
+def get_kotak_neo_instruments(names):
     kotak_neo_columns = [
         "pSymbol",
         "pGroup",
@@ -167,9 +137,9 @@ def get_kotak_neo_instruments():
         header=0,
         names=kotak_neo_columns,
     )
-    kotak_neo_instruments = kotak_neo_instruments[
-        kotak_neo_instruments["pSymbolName"].isin(["NIFTY", "BANKNIFTY"])
-    ].reset_index(drop=True)
+    kotak_neo_instruments = kotak_neo_instruments[kotak_neo_instruments["pSymbolName"].isin(names)].reset_index(
+        drop=True
+    )
     kotak_neo_instruments = kotak_neo_instruments[["pSymbol", "pTrdSymbol", "lFreezeQty"]].copy()
     kotak_neo_instruments.columns = ["kotak_neo_instrument_token", "tradingsymbol", "freeze_qty"]
     kotak_neo_instruments["freeze_qty"] = kotak_neo_instruments["freeze_qty"] - 1
@@ -180,17 +150,17 @@ def get_kotak_neo_instruments():
     return kotak_neo_instruments
 
 
-def get_kite_instruments():
+def get_kite_instruments(names):
     user = env("ZERODHA_WEBSOCKET_USER")
     zerodha = ZerodhaApi.objects.get(broker_api__user__username=user)
     kite = async_to_sync(KiteExt)(user_id=zerodha.userid, token=zerodha.session_token)
-    kite_instruments = get_instruments(kite, exchange="NFO", name="BANKNIFTY")
+    kite_instruments = get_instruments(kite, exchange="NFO", names=names)
     kite_instruments.rename(columns={"instrument_token": "kite_instrument_token"}, inplace=True)
 
     return kite, kite_instruments
 
 
-def get_kotak_sec_instruments():
+def get_kotak_sec_instruments(names):
     kotak_sec_instruments = pd.read_csv(
         "https://preferred.kotaksecurities.com/security/production/TradeApiInstruments_FNO_"
         + str(date.today().strftime("%d_%m_%Y"))
@@ -199,7 +169,7 @@ def get_kotak_sec_instruments():
     )
     kotak_sec_instruments = kotak_sec_instruments[
         (kotak_sec_instruments["segment"] == "FO")
-        & (kotak_sec_instruments["instrumentName"] == "BANKNIFTY")
+        & (kotak_sec_instruments["instrumentName"].isin(names))
         & (kotak_sec_instruments["optionType"].isin(["CE", "PE"]))
     ].reset_index(drop=True)
     kotak_sec_instruments = kotak_sec_instruments.rename(
@@ -210,31 +180,19 @@ def get_kotak_sec_instruments():
     )
     expiry_map = {row: parse(row).date() for row in kotak_sec_instruments["expiry"].unique()}
     kotak_sec_instruments = kotak_sec_instruments[
-        ["kotak_sec_instrument_token", "instrument_type", "expiry", "strike"]
-    ]
+        ["kotak_sec_instrument_token", "instrumentName", "instrument_type", "expiry", "strike"]
+    ].rename(columns={"instrumentName": "name"})
     kotak_sec_instruments["expiry"] = kotak_sec_instruments["expiry"].apply(lambda x: expiry_map[x])
 
     return kotak_sec_instruments
 
 
-def option_connect_kws():
+def get_chain_instruments(instruments, name, expiries):
     tz = timezone.get_current_timezone()
-    # Zerodha Instruments
-    kite, kite_instruments = get_kite_instruments()
-
-    # Kotak Neo Instruments
-    kotak_neo_instruments = get_kotak_neo_instruments()
-
-    # Kotak Securities Instruments
-    kotak_sec_instruments = get_kotak_sec_instruments()
-
-    # Merge Instruments
-    instruments = pd.merge(kotak_neo_instruments, kite_instruments, on=["tradingsymbol"])
-    instruments = pd.merge(instruments, kotak_sec_instruments, on=["expiry", "strike", "instrument_type"])
-
-    expiry = sorted(instruments["expiry"].unique())[0]
-    instruments = instruments[instruments["expiry"] == expiry].reset_index(drop=True)
-    cache.set("EXPIRY", expiry)
+    instruments = instruments[instruments["name"] == name]
+    expiry = sorted(instruments["expiry"].unique())[:expiries]
+    instruments = instruments[instruments["expiry"].isin(expiry)].reset_index(drop=True)
+    cache.set(f"{name}_EXPIRY", expiry[0])
     instruments = instruments[
         [
             "kotak_neo_instrument_token",
@@ -248,22 +206,61 @@ def option_connect_kws():
             "freeze_qty",
         ]
     ].copy()
-    instruments["last_price"] = np.nan
-    instruments["exchange_timestamp"] = np.nan
-    instruments["last_trade_time"] = np.nan
-    instruments["oi"] = np.nan
     instruments["expiry"] = instruments["expiry"].apply(lambda x: parse(f"{x} 15:30:00").replace(tzinfo=tz))
     instruments["str_expiry"] = instruments["expiry"].apply(lambda y: y.strftime("%d-%b-%Y").upper())
 
-    kite_instrument_tokens = instruments["kite_instrument_token"].to_list()
-    cache.set("OPTION_INSTRUMENTS", instruments)
+    return instruments
+
+
+def option_connect_kws(underlyings=None, expiries=None):
+    """
+    Stream every configured underlying over one kite websocket.
+
+    Option ticks are routed by token into the underlying's OptionChainStore, spot ticks are written
+    to ``<NAME>_LTP``. Defaults come from ``OPTION_CHAIN_UNDERLYINGS`` and ``OPTION_CHAIN_EXPIRIES``.
+    """
+    underlyings = underlyings or settings.OPTION_CHAIN_UNDERLYINGS
+    expiries = expiries or settings.OPTION_CHAIN_EXPIRIES
+    send_message(f"{timezone.localtime().replace(microsecond=0)} OPTION KWS {', '.join(underlyings)}")
+
+    # Zerodha Instruments
+    kite, kite_instruments = get_kite_instruments(underlyings)
+
+    # Kotak Neo Instruments
+    kotak_neo_instruments = get_kotak_neo_instruments(underlyings)
+
+    # Kotak Securities Instruments
+    kotak_sec_instruments = get_kotak_sec_instruments(underlyings)
+
+    # Merge Instruments
+    instruments = pd.merge(kotak_neo_instruments, kite_instruments, on=["tradingsymbol"])
+    instruments = pd.merge(instruments, kotak_sec_instruments, on=["name", "expiry", "strike", "instrument_type"])
 
     kws = kite.kws()
-    kws.instrument_tokens = kite_instrument_tokens
+    kws.chains = {}
+    kws.spot_tokens = {settings.SPOT_INSTRUMENT_TOKENS[name]: name for name in underlyings}
+
+    for name in underlyings:
+        chain = OptionChainStore.create(name, get_chain_instruments(instruments, name, expiries))
+        kws.chains.update({token: chain for token in chain.token_index})
+
+    # strategies trade BANKNIFTY and still read the unprefixed key
+    cache.set("EXPIRY", cache.get("BANKNIFTY_EXPIRY"))
+
+    kws.instrument_tokens = list(kws.spot_tokens) + list(kws.chains)
+    recorder = None
+    if settings.ARCHIVE_RECORD_TICKS:
+        recorder = TickRecorder(settings.ARCHIVE_TICK_FLUSH_ROWS, settings.ARCHIVE_TICK_FLUSH_SECONDS)
+    kws.pipeline = TickPipeline(
+        kws.chains,
+        kws.spot_tokens,
+        maxlen=settings.TICK_PIPELINE_MAXLEN,
+        batch_ms=settings.TICK_PIPELINE_BATCH_MS,
+        recorder=recorder,
+    ).start()
 
     kws.on_ticks = on_ticks
     kws.on_connect = on_connect
     kws.on_close = on_close
-    print('yahan')
 
     kws.connect()
@@ -0,0 +1,119 @@
+import threading
+import time
+from collections import deque
+
+from django.core.cache import cache
+
+
+class TickPipeline:
+    """
+    Moves tick handling off the KiteTicker reactor thread.
+
+    `put` only appends to a bounded ring buffer, when it is full the oldest tick is dropped. A worker
+    thread wakes every `batch_ms`, keeps the latest tick per token and publishes the batch to the chain
+    stores and the spot LTP keys in one go. Raw ticks, before coalescing, are handed to `recorder` when
+    one is given.
+    """
+
+    def __init__(self, chains: dict, spot_tokens: dict, maxlen=10000, batch_ms=50, recorder=None):
+        self.chains = chains
+        self.spot_tokens = spot_tokens
+        self.maxlen = maxlen
+        self.batch_ms = batch_ms
+        self.recorder = recorder
+
+        self.buffer = deque(maxlen=maxlen)
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.worker = threading.Thread(target=self.run, name="tick-pipeline", daemon=True)
+
+        self.received = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.published = 0
+        self.batches = 0
+        self.max_depth = 0
+        self.last_latency_ms = 0.0
+        self.max_latency_ms = 0.0
+        self.total_latency_ms = 0.0
+
+    def start(self):
+        self.worker.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.worker.is_alive():
+            self.worker.join()
+
+    def put(self, ticks):
+        received_at = time.perf_counter()
+        with self.lock:
+            overflow = len(self.buffer) + len(ticks) - self.maxlen
+            if overflow > 0:
+                self.dropped += min(overflow, self.maxlen)
+            self.buffer.extend((received_at, tick) for tick in ticks)
+            self.received += len(ticks)
+            self.max_depth = max(self.max_depth, len(self.buffer))
+
+    def drain(self):
+        with self.lock:
+            items = list(self.buffer)
+            self.buffer.clear()
+        return items
+
+    def run(self):
+        next_stats = 0
+        while not self.stopped.wait(self.batch_ms / 1000):
+            self.publish(self.drain())
+            if time.monotonic() >= next_stats:
+                cache.set("TICK_PIPELINE_STATS", self.stats())
+                next_stats = time.monotonic() + 1
+        self.publish(self.drain())
+        if self.recorder is not None:
+            self.recorder.flush()
+
+    def publish(self, items):
+        if not items:
+            return
+
+        latest = {}
+        for received_at, tick in items:
+            latest[tick["instrument_token"]] = (received_at, tick)
+        self.coalesced += len(items) - len(latest)
+
+        routed, spot = {}, {}
+        for token, (_, tick) in latest.items():
+            if token in self.spot_tokens:
+                spot[f"{self.spot_tokens[token]}_LTP"] = tick["last_price"]
+            elif token in self.chains:
+                routed.setdefault(self.chains[token], []).append(tick)
+
+        for chain, ticks in routed.items():
+            chain.update_ticks(ticks)
+        if spot:
+            cache.set_many(spot)
+        if self.recorder is not None:
+            self.recorder.record(items)
+
+        # oldest tick in the batch waited the longest
+        latency_ms = (time.perf_counter() - items[0][0]) * 1000
+        self.last_latency_ms = latency_ms
+        self.max_latency_ms = max(self.max_latency_ms, latency_ms)
+        self.total_latency_ms += latency_ms
+        self.published += len(latest)
+        self.batches += 1
+
+    def stats(self):
+        return {
+            "queue_depth": len(self.buffer),
+            "max_queue_depth": self.max_depth,
+            "received": self.received,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "published": self.published,
+            "batches": self.batches,
+            "last_latency_ms": round(self.last_latency_ms, 3),
+            "max_latency_ms": round(self.max_latency_ms, 3),
+            "avg_latency_ms": round(self.total_latency_ms / self.batches, 3) if self.batches else 0.0,
+        }
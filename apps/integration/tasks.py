@@ -7,14 +7,16 @@ import pandas as pd
 from django.core.cache import cache
 from django.utils import timezone
 
-from apps.integration.kite_socket.bnf_option_kws import option_connect_kws
-from apps.integration.kite_socket.finnifty_option import fn_option_connect_kws
-from apps.integration.kite_socket.nifty_option import nifty_option_connect_kws
-from apps.integration.kite_socket.spot_kws import spot_connect_kws
+from apps.integration.kite_socket.option_kws import option_connect_kws
 from apps.integration.models import KotakNeoApi, KotakSecuritiesApi, ZerodhaApi
 from trading.celery import app
-from utils.bs_greeks import find_greeks
+from utils import chain_events
+from utils.archive import archive_day
+from utils.bs_greeks import chain_greeks
+from utils.option_chain import get_option_chain
+from utils.strike_ladder import LADDERS_KEY, ChainLadders
 from utils.telegram import send_message
+from utils.timeseries import BNF_SNAPSHOT_5SEC, LIVE_BNF_PCR
 
 
 @app.task(name="Save Zerodha", bind=True)
@@ -59,37 +61,27 @@ def update_neo_token(self):
             send_message(f"{ct} - {neo.broker_api.user.username} Update Kotak Neo Error {e}")
 
 
-@app.task(name="Spot Data", bind=True)
-def spot_data(self):
-    spot_connect_kws()
-
-
-@app.task(name="Bank Nifty Option Data", bind=True)
-def banknifty_option_data(self):
+@app.task(name="Option Chain Data", bind=True)
+def option_chain_data(self):
     option_connect_kws()
 
 
-@app.task(name="Fin Nifty Option Data", bind=True)
-def finnifty_option_data(self):
-    fn_option_connect_kws()
-
-
-@app.task(name="Nifty Option Data", bind=True)
-def nifty_option_data(self):
-    nifty_option_connect_kws()
-
-
 @app.task(name="Bank Nifty Live Greeks", bind=True)
 def banknifty_live_greeks(self):
     if timezone.localtime().time() < dt.time(9, 15, 2):
         ct = timezone.localtime()
         time.sleep((ct.replace(hour=9, minute=15, second=2, microsecond=0) - ct).total_seconds())
 
+    chain, seen, sigma = None, 0, None
     while True:
         ct = timezone.localtime().replace(microsecond=0)
         if ct.time() >= dt.time(15, 30):
             break
-        instruments = cache.get("OPTION_INSTRUMENTS")
+        if chain is not get_option_chain():
+            # new layout from the ingester, rows moved so solve everything again
+            chain, seen, sigma = get_option_chain(), 0, None
+        seq = chain.seq
+        instruments = chain.frame()
         instruments["bnf_ltp"] = cache.get("BANKNIFTY_LTP")
         instruments["time_left"] = ((instruments["expiry"] - ct).dt.total_seconds() / 86400) / 365
         instruments["timestamp"] = ct
@@ -99,15 +91,20 @@ def banknifty_live_greeks(self):
             instruments["theta"],
             instruments["gamma"],
             instruments["vega"],
-        ) = np.vectorize(find_greeks)(
-            instruments["last_price"],
-            instruments["bnf_ltp"],
-            instruments["strike"],
-            instruments["time_left"],
+        ) = chain_greeks(
+            instruments["last_price"].to_numpy(),
+            instruments["bnf_ltp"].to_numpy(),
+            instruments["strike"].to_numpy(),
+            instruments["time_left"].to_numpy(),
             0.10,
-            instruments["instrument_type"],
+            (instruments["instrument_type"] == "CE").to_numpy(),
+            sigma0=sigma,
+            solve=chain.changed_since(seen),
         )
+        seen, sigma = seq, instruments["sigma"].to_numpy()
         cache.set("OPTION_GREEKS_INSTRUMENTS", instruments)
+        cache.set(LADDERS_KEY, ChainLadders.from_frame(instruments))
+        chain_events.publish(chain_events.GREEKS, spot=float(instruments["bnf_ltp"].iloc[0] or 0))
 
         with contextlib.suppress(Exception):
             diff = (ct.replace(microsecond=0) + dt.timedelta(seconds=1) - timezone.localtime()).total_seconds()
@@ -116,44 +113,6 @@ def banknifty_live_greeks(self):
 
 @app.task(name="Bank Nifty Save Snapshot Every 5 Second", bind=True)
 def bank_nifty_save_snapshot_every_five_second(self):
-    columns = [
-        "timestamp",
-        "kotak_neo_instrument_token",
-        "kotak_sec_instrument_token",
-        "kite_instrument_token",
-        "tradingsymbol",
-        "expiry",
-        "strike",
-        "instrument_type",
-        "last_price",
-        "exchange_timestamp",
-        "last_trade_time",
-        "oi",
-        "bnf_ltp",
-        "atm",
-        "sigma",
-        "delta",
-    ]
-    cache.set("BNF_SNAPSHOT_5SEC", pd.DataFrame(columns=columns))
-    cache.set(
-        "LIVE_BNF_PCR",
-        pd.DataFrame(
-            columns=[
-                "timestamp",
-                "pe_total_oi",
-                "ce_total_oi",
-                "pcr",
-                "strike",
-                "ce_iv",
-                "pe_iv",
-                "total_iv",
-                "ce_premium",
-                "pe_premium",
-                "total_premium",
-            ]
-        ),
-    )
-
     if timezone.localtime().time() < dt.time(9, 15, 4):
         ct = timezone.localtime()
         time.sleep((ct.replace(hour=9, minute=15, second=4, microsecond=0) - ct).total_seconds())
@@ -174,7 +133,7 @@ def bank_nifty_save_snapshot_every_five_second(self):
         ct = timezone.localtime().replace(microsecond=0)
         if ct.time() >= dt.time(15, 30):
             break
-        instruments = cache.get("OPTION_INSTRUMENTS")
+        instruments = get_option_chain().frame()
         ltp = cache.get("BANKNIFTY_LTP")
         instruments["bnf_ltp"] = ltp
         instruments["timestamp"] = ct.replace(microsecond=0)
@@ -187,27 +146,19 @@ def bank_nifty_save_snapshot_every_five_second(self):
             instruments["theta"],
             instruments["gamma"],
             instruments["vega"],
-        ) = np.vectorize(find_greeks)(
-            instruments["last_price"],
-            instruments["bnf_ltp"],
-            instruments["strike"],
-            instruments["time_left"],
+        ) = chain_greeks(
+            instruments["last_price"].to_numpy(),
+            instruments["bnf_ltp"].to_numpy(),
+            instruments["strike"].to_numpy(),
+            instruments["time_left"].to_numpy(),
             0.10,
-            instruments["instrument_type"],
+            (instruments["instrument_type"] == "CE").to_numpy(),
         )
         instruments["atm"] = (instruments["bnf_ltp"] / 100).round(0) * 100
-        bnf_snapshot_5sec = cache.get("BNF_SNAPSHOT_5SEC", pd.DataFrame(columns=columns))
-        print(instruments)
-        bnf_snapshot_5sec = pd.concat([bnf_snapshot_5sec, instruments[columns]], ignore_index=True)
 
         pe_total_oi = int(instruments[instruments["instrument_type"] == "PE"].oi.sum())
         ce_total_oi = int(instruments[instruments["instrument_type"] == "CE"].oi.sum())
 
-        live_pcr = cache.get(
-            "LIVE_BNF_PCR",
-            pd.DataFrame(columns=["timestamp", "pe_total_oi", "ce_total_oi", "pcr"]),
-        )
-
         atm = float(round(ltp / 100) * 100)
         ce = instruments[(instruments["instrument_type"] == "CE") & (instruments["strike"] == atm)].iloc[0]
         pe = instruments[(instruments["instrument_type"] == "PE") & (instruments["strike"] == atm)].iloc[0]
@@ -234,8 +185,9 @@ def bank_nifty_save_snapshot_every_five_second(self):
             ]
         )
 
-        cache.set("BNF_SNAPSHOT_5SEC", bnf_snapshot_5sec)
-        cache.set("LIVE_BNF_PCR", pd.concat([live_pcr, df], ignore_index=True))
+        BNF_SNAPSHOT_5SEC.append(ct, instruments)
+        LIVE_BNF_PCR.append(ct, df)
+        chain_events.publish(chain_events.PCR)
 
         if (ct + dt.timedelta(seconds=1)).second % 5 == 0:
             diff = (
@@ -252,3 +204,8 @@ def bank_nifty_save_snapshot_every_five_second(self):
 
         with contextlib.suppress(Exception):
             time.sleep(diff)
+
+
+@app.task(name="Archive Market Data", bind=True)
+def archive_market_data(self):
+    return archive_day()
@@ -1,6 +1,5 @@
 from asgiref.sync import async_to_sync
 from django.contrib.auth import get_user_model
-from django.core.cache import cache
 from django.utils.module_loading import import_string
 from rest_framework import authentication, permissions
 from rest_framework.permissions import IsAuthenticated
@@ -9,13 +8,14 @@ from rest_framework.views import APIView
 
 from apps.trade.consumers import adjust_positions
 from apps.trade.models import DeployedOptionStrategy
+from apps.trade.runner import run_action
 from apps.trade.square_off_all import square_off_all, square_off_all_user
 from apps.trade.strategy.dynamic_shifting_with_exit_one_side import (
     Strategy as OneSideExitStrategy,
 )
 from apps.trade.strategy.straddles_with_sl import Strategy as StraddleWithSL
 from apps.trade.tasks import get_all_user_open_positions
-from utils import divide_and_list, send_notifications
+from utils import divide_and_list, send_notifications, strategy_state
 from utils.multi_broker import Broker as MultiBroker
 
 User = get_user_model()
@@ -41,19 +41,8 @@ class RebalanceView(APIView):
 
         opt_strategy = DeployedOptionStrategy.objects.filter(pk=strategy).first()
 
-        user_params = cache.get("deployed_strategies", {}).get(str(strategy), {}).get("user_params", [])
-
-        if opt_strategy and user_params:
-            parameters = [p.parameters for p in opt_strategy.parameters.filter(is_active=True).order_by("name")]
-            Strategy = import_string(f"apps.trade.strategy.{opt_strategy.strategy.file_name}.Strategy")
-
-            strategy: OneSideExitStrategy = Strategy(
-                user_params=user_params,
-                parameters=parameters,
-                opt_strategy=opt_strategy,
-            )
-
-            async_to_sync(strategy.manual_shifting)(idx)
+        if opt_strategy and strategy_state.accounts(strategy):
+            async_to_sync(run_action)(strategy, "manual_shifting", idx)
 
             async_to_sync(send_notifications)(
                 opt_strategy.strategy_name.upper(), f"{idx} - REBALANCE!", "alert-secondary"
@@ -75,19 +64,8 @@ class ShiftSingleStrike(APIView):
 
         opt_strategy = DeployedOptionStrategy.objects.filter(pk=strategy).first()
 
-        user_params = cache.get("deployed_strategies", {}).get(str(strategy), {}).get("user_params", [])
-
-        if opt_strategy and user_params:
-            parameters = [p.parameters for p in opt_strategy.parameters.filter(is_active=True).order_by("name")]
-            Strategy = import_string(f"apps.trade.strategy.{opt_strategy.strategy.file_name}.Strategy")
-
-            strategy: OneSideExitStrategy = Strategy(
-                user_params=user_params,
-                parameters=parameters,
-                opt_strategy=opt_strategy,
-            )
-
-            async_to_sync(strategy.manual_shift_single_strike)(idx, option_type, points)
+        if opt_strategy and strategy_state.accounts(strategy):
+            async_to_sync(run_action)(strategy, "manual_shift_single_strike", idx, option_type, points)
 
             async_to_sync(send_notifications)(
                 opt_strategy.strategy_name.upper(),
@@ -108,19 +86,8 @@ class ReentryOneSide(APIView):
 
         opt_strategy = DeployedOptionStrategy.objects.filter(pk=strategy).first()
 
-        user_params = cache.get("deployed_strategies", {}).get(str(strategy), {}).get("user_params", [])
-
-        if opt_strategy and user_params:
-            parameters = [p.parameters for p in opt_strategy.parameters.filter(is_active=True).order_by("name")]
-            Strategy = import_string(f"apps.trade.strategy.{opt_strategy.strategy.file_name}.Strategy")
-
-            strategy: OneSideExitStrategy = Strategy(
-                user_params=user_params,
-                parameters=parameters,
-                opt_strategy=opt_strategy,
-            )
-
-            async_to_sync(strategy.manual_reentry)(idx)
+        if opt_strategy and strategy_state.accounts(strategy):
+            async_to_sync(run_action)(strategy, "manual_reentry", idx)
 
             async_to_sync(send_notifications)(
                 opt_strategy.strategy_name.upper(), f"{idx} - MANUAL REENTRY!", "alert-success"
@@ -141,19 +108,8 @@ class ExitOneSide(APIView):
 
         opt_strategy = DeployedOptionStrategy.objects.filter(pk=strategy).first()
 
-        user_params = cache.get("deployed_strategies", {}).get(str(strategy), {}).get("user_params", [])
-
-        if opt_strategy and user_params:
-            parameters = [p.parameters for p in opt_strategy.parameters.filter(is_active=True).order_by("name")]
-            Strategy = import_string(f"apps.trade.strategy.{opt_strategy.strategy.file_name}.Strategy")
-
-            strategy: OneSideExitStrategy = Strategy(
-                user_params=user_params,
-                parameters=parameters,
-                opt_strategy=opt_strategy,
-            )
-
-            async_to_sync(strategy.manual_exit)(idx, option_type)
+        if opt_strategy and strategy_state.accounts(strategy):
+            async_to_sync(run_action)(strategy, "manual_exit", idx, option_type)
 
             async_to_sync(send_notifications)(
                 opt_strategy.strategy_name.upper(), f"{idx} - {option_type} - MANUAL ONE SIDE EXIT!", "alert-danger"
@@ -173,19 +129,8 @@ class OneSideExitHold(APIView):
 
         opt_strategy = DeployedOptionStrategy.objects.filter(pk=strategy).first()
 
-        user_params = cache.get("deployed_strategies", {}).get(str(strategy), {}).get("user_params", [])
-
-        if opt_strategy and user_params:
-            parameters = [p.parameters for p in opt_strategy.parameters.filter(is_active=True).order_by("name")]
-            Strategy = import_string(f"apps.trade.strategy.{opt_strategy.strategy.file_name}.Strategy")
-
-            strategy: OneSideExitStrategy = Strategy(
-                user_params=user_params,
-                parameters=parameters,
-                opt_strategy=opt_strategy,
-            )
-
-            async_to_sync(strategy.one_side_exit_hold)(idx)
+        if opt_strategy and strategy_state.accounts(strategy):
+            async_to_sync(run_action)(strategy, "one_side_exit_hold", idx)
 
             async_to_sync(send_notifications)(
                 opt_strategy.strategy_name.upper(), f"{idx} - ONE SIDE EXIT HOLD MARKED!", "alert-warning"
@@ -205,19 +150,8 @@ class ReleaseOneSideExitHold(APIView):
 
         opt_strategy = DeployedOptionStrategy.objects.filter(pk=strategy).first()
 
-        user_params = cache.get("deployed_strategies", {}).get(str(strategy), {}).get("user_params", [])
-
-        if opt_strategy and user_params:
-            parameters = [p.parameters for p in opt_strategy.parameters.filter(is_active=True).order_by("name")]
-            Strategy = import_string(f"apps.trade.strategy.{opt_strategy.strategy.file_name}.Strategy")
-
-            strategy: OneSideExitStrategy = Strategy(
-                user_params=user_params,
-                parameters=parameters,
-                opt_strategy=opt_strategy,
-            )
-
-            async_to_sync(strategy.release_one_side_exit_hold)(idx)
+        if opt_strategy and strategy_state.accounts(strategy):
+            async_to_sync(run_action)(strategy, "release_one_side_exit_hold", idx)
 
             async_to_sync(send_notifications)(
                 opt_strategy.strategy_name.upper(), f"{idx} - ONE SIDE EXIT HOLD RELEASED!"
@@ -272,18 +206,9 @@ class PlaceStraddle(APIView):
 
         opt_strategy: DeployedOptionStrategy | None = DeployedOptionStrategy.objects.filter(pk=strategy).first()
 
-        user_params = cache.get("deployed_strategies", {}).get(str(strategy), {}).get("user_params", [])
-
-        if opt_strategy and user_params:
+        if opt_strategy and strategy_state.accounts(strategy):
             parameters = opt_strategy.parameters.get(name=idx, is_active=True).parameters
-            Strategy = import_string(f"apps.trade.strategy.{opt_strategy.strategy.file_name}.Strategy")
-
-            strategy: StraddleWithSL = Strategy(
-                user_params=user_params,
-                opt_strategy=opt_strategy,
-            )
-
-            async_to_sync(strategy.place_straddle)(idx, parameters["sl_pct"])
+            async_to_sync(run_action)(strategy, "place_straddle", idx, parameters["sl_pct"])
 
         return Response({"message": "success"})
 
@@ -300,17 +225,8 @@ class ModifySlToCost(APIView):
 
         opt_strategy: DeployedOptionStrategy | None = DeployedOptionStrategy.objects.filter(pk=strategy).first()
 
-        user_params = cache.get("deployed_strategies", {}).get(str(strategy), {}).get("user_params", [])
-
-        if opt_strategy and user_params:
-            Strategy = import_string(f"apps.trade.strategy.{opt_strategy.strategy.file_name}.Strategy")
-
-            strategy: StraddleWithSL = Strategy(
-                user_params=user_params,
-                opt_strategy=opt_strategy,
-            )
-
-            async_to_sync(strategy.modify_to_cost)(idx=idx)
+        if opt_strategy and strategy_state.accounts(strategy):
+            async_to_sync(run_action)(strategy, "modify_to_cost", idx=idx)
 
         return Response({"message": "success"})
 
@@ -327,17 +243,8 @@ class ExitStraddleOrder(APIView):
 
         opt_strategy: DeployedOptionStrategy | None = DeployedOptionStrategy.objects.filter(pk=strategy).first()
 
-        user_params = cache.get("deployed_strategies", {}).get(str(strategy), {}).get("user_params", [])
-
-        if opt_strategy and user_params:
-            Strategy = import_string(f"apps.trade.strategy.{opt_strategy.strategy.file_name}.Strategy")
-
-            strategy: StraddleWithSL = Strategy(
-                user_params=user_params,
-                opt_strategy=opt_strategy,
-            )
-
-            async_to_sync(strategy.exit_order)(idx=idx)
+        if opt_strategy and strategy_state.accounts(strategy):
+            async_to_sync(run_action)(strategy, "exit_order", idx=idx)
 
         return Response({"message": "success"})
 
@@ -352,17 +259,8 @@ class UpdateStraddleStrategyPosition(APIView):
 
         opt_strategy: DeployedOptionStrategy | None = DeployedOptionStrategy.objects.filter(pk=strategy).first()
 
-        user_params = cache.get("deployed_strategies", {}).get(str(strategy), {}).get("user_params", [])
-
-        if opt_strategy and user_params:
-            Strategy = import_string(f"apps.trade.strategy.{opt_strategy.strategy.file_name}.Strategy")
-
-            strategy: StraddleWithSL = Strategy(
-                user_params=user_params,
-                opt_strategy=opt_strategy,
-            )
-
-            async_to_sync(strategy.update_position)()
+        if opt_strategy and strategy_state.accounts(strategy):
+            async_to_sync(run_action)(strategy, "update_position")
 
         return Response({"message": "success"})
 
@@ -377,19 +275,8 @@ class ExitAlgo(APIView):
 
         opt_strategy: DeployedOptionStrategy | None = DeployedOptionStrategy.objects.filter(pk=strategy).first()
 
-        user_params = cache.get("deployed_strategies", {}).get(str(strategy), {}).get("user_params", [])
-
-        if opt_strategy and user_params:
-            parameters = [p.parameters for p in opt_strategy.parameters.filter(is_active=True).order_by("name")]
-            Strategy = import_string(f"apps.trade.strategy.{opt_strategy.strategy.file_name}.Strategy")
-
-            strategy: OneSideExitStrategy = Strategy(
-                user_params=user_params,
-                parameters=parameters,
-                opt_strategy=opt_strategy,
-            )
-
-            async_to_sync(strategy.exit_algo)()
+        if opt_strategy and strategy_state.accounts(strategy):
+            async_to_sync(run_action)(strategy, "exit_algo")
 
             async_to_sync(send_notifications)(opt_strategy.strategy_name.upper(), "EXITED ALGO!", "alert-danger")
 
@@ -406,7 +293,7 @@ class ExitUserAlgo(APIView):
 
         opt_strategy: DeployedOptionStrategy | None = DeployedOptionStrategy.objects.filter(pk=strategy).first()
 
-        user_params = cache.get("deployed_strategies", {}).get(str(strategy), {}).get("user_params", [])
+        user_params = async_to_sync(strategy_state.user_params)(strategy)
 
         username = row["username"]
 
@@ -434,16 +321,7 @@ class SquareOffUser(APIView):
 
     def post(self, request, format=None):
         row = request.data
-        deployed_strategies = cache.get("deployed_strategies", {}).copy()
-
-        for _, strategy in deployed_strategies.items():
-            user_params = strategy["user_params"]
-            updated_user_params = [
-                user_param for user_param in user_params if user_param["user"].username != row["username"]
-            ]
-            strategy["user_params"] = updated_user_params
-
-        cache.set("deployed_strategies", deployed_strategies)
+        strategy_state.remove_accounts(lambda account: account["username"] != row["username"])
 
         async_to_sync(square_off_all)(row["username"], row["broker"])
 
@@ -460,7 +338,7 @@ class EnterUserAlgo(APIView):
 
         opt_strategy: DeployedOptionStrategy | None = DeployedOptionStrategy.objects.filter(pk=strategy).first()
 
-        user_params = cache.get("deployed_strategies", {}).get(str(strategy), {}).get("user_params", [])
+        user_params = async_to_sync(strategy_state.user_params)(strategy)
 
         username = row["username"]
 
@@ -543,7 +421,7 @@ class UserEntry(APIView):
 
         opt_strategy: DeployedOptionStrategy | None = DeployedOptionStrategy.objects.filter(pk=strategy).first()
 
-        user_params = cache.get("deployed_strategies", {}).get(str(strategy), {}).get("user_params", [])
+        user_params = async_to_sync(strategy_state.user_params)(strategy)
 
         username = row["username"]
 
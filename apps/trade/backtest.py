@@ -0,0 +1,470 @@
+import asyncio
+import bisect
+import contextlib
+import datetime as dt
+import importlib
+import io
+import itertools
+
+import pandas as pd
+
+from apps.trade.models import DeployedOptionStrategy
+from utils import archive, chain_events, divide_and_list
+from utils.strike_ladder import LADDERS_KEY, ChainLadders
+
+
+class SimulatedCache:
+    """In-memory stand-in for the django cache, values are shared, not pickled."""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def set(self, key, value, timeout=None):
+        self.data[key] = value
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+    def get_many(self, keys):
+        return {key: self.data[key] for key in keys if key in self.data}
+
+    def set_many(self, data, timeout=None):
+        self.data.update(data)
+
+
+class SimulatedUser:
+    """Stands in for the django user of a user_params entry, the strategies only use its username."""
+
+    def __init__(self, username):
+        self.username = username
+
+    def __str__(self):
+        return self.username
+
+
+class SimulatedStrategyState:
+    """In-memory stand-in for ``utils.strategy_state``, the live user_params are kept as they are."""
+
+    def __init__(self):
+        self.states = {}
+        self.versions = {}
+
+    def bump(self, pk):
+        self.versions[str(pk)] = self.versions.get(str(pk), 0) + 1
+        state = self.states.get(str(pk))
+        return None if state is None else {"version": self.versions[str(pk)], "accounts": state}
+
+    def version(self, pk):
+        return self.versions.get(str(pk), 0)
+
+    def is_deployed(self, pk):
+        return str(pk) in self.states
+
+    def deploy(self, pk, user_params, no_of_strategy=None):
+        self.states[str(pk)] = list(user_params)
+        return self.bump(pk)
+
+    def add_account(self, pk, user_param):
+        if str(pk) in self.states:
+            self.states[str(pk)].append(user_param)
+        return self.bump(pk)
+
+    def remove_account(self, pk, username):
+        if str(pk) in self.states:
+            self.states[str(pk)] = [row for row in self.states[str(pk)] if row["user"].username != username]
+            if not self.states[str(pk)]:
+                del self.states[str(pk)]
+        return self.bump(pk)
+
+    def remove(self, pk):
+        self.states.pop(str(pk), None)
+        self.bump(pk)
+
+    async def user_params(self, pk, current=()):
+        return list(self.states.get(str(pk), []))
+
+
+class SimulatedClock:
+    """
+    Stands in for ``django.utils.timezone`` and ``asyncio`` inside a replayed strategy module.
+
+    `sleep` moves the clock forward at once and lets the market catch up, which is exact while one
+    coroutine drives time, as the run loops of the strategies do. Tasks the strategy creates are kept
+    so whatever drives time can `settle` them first.
+    """
+
+    def __init__(self, now, market):
+        self.now = now
+        self.market = market
+        self.market.advance(now)
+        self.tasks = set()
+
+    def localtime(self, value=None):
+        return self.now
+
+    def localdate(self):
+        return self.now.date()
+
+    def get_current_timezone(self):
+        return self.now.tzinfo
+
+    async def sleep(self, seconds, result=None):
+        self.now = self.now + dt.timedelta(seconds=max(seconds, 0))
+        self.market.advance(self.now)
+        await asyncio.sleep(0)
+        return result
+
+    def create_task(self, coro, **kwargs):
+        task = asyncio.create_task(coro, **kwargs)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    async def settle(self):
+        """Wait for the tasks of the strategy to finish at the current time."""
+        while self.tasks:
+            await asyncio.wait(set(self.tasks))
+
+    def __getattr__(self, name):
+        # everything else of the asyncio module, gather mostly
+        return getattr(asyncio, name)
+
+
+class SimulatedChainEvents:
+    """
+    Stands in for ``utils.chain_events`` inside a replayed strategy module. Waiting for events moves the
+    clock to the next archived snapshot, announced as new greeks along with the PCR rows up to it.
+    """
+
+    GREEKS = chain_events.GREEKS
+    PCR = chain_events.PCR
+    EvaluationGate = chain_events.EvaluationGate
+
+    def __init__(self, clock, market):
+        self.clock = clock
+        self.market = market
+
+    def ChainEvents(self):
+        return self
+
+    async def next(self, timeout=1.0):
+        # evaluations still running see the snapshot they started on, as they would live within a tick
+        await self.clock.settle()
+        before = self.clock.now
+        idx = bisect.bisect_right(self.market.timestamps, before)
+        if idx == len(self.market.timestamps) or self.market.timestamps[idx] > before + dt.timedelta(seconds=timeout):
+            await self.clock.sleep(timeout)
+            return []
+
+        await self.clock.sleep((self.market.timestamps[idx] - before).total_seconds())
+        events = [{"kind": self.GREEKS, "spot": str(float(self.market.current["bnf_ltp"].iloc[0]))}]
+        pcr = self.market.pcr["timestamp"]
+        if ((pcr > before) & (pcr <= self.clock.now)).any():
+            events.append({"kind": self.PCR})
+        return events
+
+
+class MarketReplay:
+    """
+    Archived 5 second greeks snapshots and PCR rows of one day, published to the simulated cache as
+    the clock moves, the same keys the live tasks write.
+    """
+
+    def __init__(self, snapshots: pd.DataFrame, pcr: pd.DataFrame, cache: SimulatedCache):
+        snapshots = snapshots.copy()
+        for column in snapshots.select_dtypes("category").columns:
+            snapshots[column] = snapshots[column].astype(object)
+
+        self.frames = {timestamp: frame.reset_index(drop=True) for timestamp, frame in snapshots.groupby("timestamp")}
+        self.timestamps = sorted(self.frames)
+        self.pcr = pcr.sort_values("timestamp").reset_index(drop=True)
+        self.cache = cache
+        self.current = None
+        self.brokers = []
+
+        expiry = snapshots["expiry"].min()
+        cache.set("EXPIRY", expiry.date())
+        cache.set("BANKNIFTY_EXPIRY", expiry.date())
+
+    @classmethod
+    def from_archive(cls, day, cache):
+        snapshots = archive.mapped("snapshots", day)
+        if snapshots.empty:
+            raise FileNotFoundError(f"No archived snapshots for {day}")
+        return cls(snapshots, archive.mapped("pcr", day), cache)
+
+    @property
+    def start(self):
+        return self.timestamps[0]
+
+    def advance(self, now):
+        idx = bisect.bisect_right(self.timestamps, now) - 1
+        frame = self.frames[self.timestamps[max(idx, 0)]]
+        if frame is self.current:
+            return
+
+        self.current = frame
+        self.cache.set("OPTION_GREEKS_INSTRUMENTS", frame)
+        self.cache.set(LADDERS_KEY, ChainLadders.from_frame(frame))
+        self.cache.set("BANKNIFTY_LTP", float(frame["bnf_ltp"].iloc[0]))
+        for broker in self.brokers:
+            broker.on_market()
+
+    def ltp(self, strike=None, option_type=None, tradingsymbol=None):
+        frame = self.current
+        if tradingsymbol is not None:
+            row = frame[frame["tradingsymbol"] == tradingsymbol]
+        else:
+            row = frame[(frame["strike"] == float(strike)) & (frame["instrument_type"] == option_type)]
+        return float(row["last_price"].iloc[0]), row["tradingsymbol"].iloc[0]
+
+    def latest(self, count=1, day=None):
+        """Same as ``TimeSeries.latest`` for the PCR series, rows up to the clock only."""
+        timestamp = self.current["timestamp"].iloc[0]
+        return self.pcr[self.pcr["timestamp"] <= timestamp].tail(count).reset_index(drop=True)
+
+
+class SimulatedBroker:
+    """
+    DummyApi style fills against the replayed chain, for the calls strategies make on ``order_obj``.
+
+    Limit and chased orders fill at the last price of the current snapshot, stop loss orders stay
+    pending until the last price crosses their trigger.
+    """
+
+    broker_name = "backtest"
+
+    def __init__(self, username, market: MarketReplay, clock: SimulatedClock):
+        self.username = username
+        self.market = market
+        self.clock = clock
+        self.orders = {}
+        self.ids = itertools.count(1)
+        market.brokers.append(self)
+
+    async def initiate_session(self):
+        pass
+
+    def fill(self, order, price):
+        order.update(status="COMPLETED", average_price=price, filled_at=self.clock.now)
+
+    def new_order(self, strike, option_type, transaction_type, quantity, trigger_price=0.0):
+        price, tradingsymbol = self.market.ltp(strike, option_type)
+        order_id = f"BT{next(self.ids):08d}"
+        self.orders[order_id] = {
+            "order_id": order_id,
+            "tradingsymbol": tradingsymbol,
+            "transaction_type": transaction_type,
+            "quantity": int(quantity),
+            "trigger_price": trigger_price,
+            "average_price": 0.0,
+            "status": "OPEN",
+            "placed_at": self.clock.now,
+            "filled_at": None,
+        }
+        return self.orders[order_id], price
+
+    def response(self, order):
+        return {
+            "order_number": order["order_id"],
+            "order_status": order["status"],
+            "order_entry_time": order["placed_at"],
+            "error_message": None,
+            "trade_history": [],
+        }
+
+    async def place_and_chase_order(self, instrument_name, strike, option_type, transaction_type, quantity, **kwargs):
+        order, price = self.new_order(strike, option_type, transaction_type, quantity)
+        self.fill(order, price)
+        return self.response(order)
+
+    async def place_stop_loss_order(
+        self, instrument_name, strike, option_type, transaction_type, quantity, expected_price, **kwargs
+    ):
+        order, _ = self.new_order(strike, option_type, transaction_type, quantity, trigger_price=expected_price)
+        order["status"] = "TRIGGER PENDING"
+        self.on_market()
+        return self.response(order)
+
+    async def modify_stop_loss_order(self, order_id, expected_price, **kwargs):
+        order = self.orders[order_id]
+        if order["status"] != "COMPLETED":
+            order["trigger_price"] = expected_price
+            self.on_market()
+
+    async def modify_and_chase_order(self, order_number, **kwargs):
+        order = self.orders[order_number]
+        if order["status"] != "COMPLETED":
+            self.fill(order, self.market.ltp(tradingsymbol=order["tradingsymbol"])[0])
+
+    async def single_order_report(self, order_id, is_fno=True, error_message=None):
+        order = self.orders[order_id]
+        return {
+            **order,
+            # Kotak Neo field names, the straddle strategy reads these
+            "nOrdNo": order["order_id"],
+            "ordSt": "complete" if order["status"] == "COMPLETED" else order["status"].lower(),
+            "avgPrc": order["average_price"],
+            "trgPrc": order["trigger_price"],
+        }
+
+    def on_market(self):
+        for order in self.orders.values():
+            if order["status"] != "TRIGGER PENDING":
+                continue
+            price = self.market.ltp(tradingsymbol=order["tradingsymbol"])[0]
+            if order["transaction_type"] == "BUY" and price >= order["trigger_price"]:
+                self.fill(order, price)
+            elif order["transaction_type"] == "SELL" and price <= order["trigger_price"]:
+                self.fill(order, price)
+
+    def trades(self):
+        trades = pd.DataFrame(
+            [order for order in self.orders.values() if order["status"] == "COMPLETED"],
+            columns=["order_id", "tradingsymbol", "transaction_type", "quantity", "average_price", "filled_at"],
+        )
+        trades["username"] = self.username
+        return trades
+
+
+def positions(trades: pd.DataFrame, market: MarketReplay):
+    """Net position and pnl per user and tradingsymbol, marked at the last replayed price."""
+    df = trades.copy()
+    buy = df["transaction_type"] == "BUY"
+    df["buy_qty"] = df["quantity"].where(buy, 0)
+    df["sell_qty"] = df["quantity"].where(~buy, 0)
+    df["buy_value"] = (df["quantity"] * df["average_price"]).where(buy, 0)
+    df["sell_value"] = (df["quantity"] * df["average_price"]).where(~buy, 0)
+    df = (
+        df.groupby(["username", "tradingsymbol"])
+        .agg({"buy_qty": "sum", "sell_qty": "sum", "buy_value": "sum", "sell_value": "sum"})
+        .reset_index()
+    )
+    last_price = market.current.set_index("tradingsymbol")["last_price"]
+    df["net_qty"] = df["buy_qty"] - df["sell_qty"]
+    df["last_price"] = df["tradingsymbol"].map(last_price)
+    df["pnl"] = df["sell_value"] - df["buy_value"] + (df["net_qty"] * df["last_price"])
+    return df
+
+
+@contextlib.contextmanager
+def patched(module, **attrs):
+    """Swap module globals for the duration of a replay."""
+    saved = {name: getattr(module, name) for name in attrs if hasattr(module, name)}
+    for name, value in attrs.items():
+        if name in saved:
+            setattr(module, name, value)
+    try:
+        yield module
+    finally:
+        for name, value in saved.items():
+            setattr(module, name, value)
+
+
+def parse_time(value):
+    return value if isinstance(value, dt.time) else dt.time.fromisoformat(str(value))
+
+
+async def drive_straddles(strategy, parameters, clock, cache, exit_time=dt.time(15, 25, 59)):
+    """
+    Replays what the strategy page does for ce_pe_with_sl: a straddle per parameter set at its
+    entry time, position updates every second, SL to cost on `trail`, exit at its exit time.
+    """
+    await strategy.run()
+    entries = {idx: parse_time(row["entry_time"]) for idx, row in enumerate(parameters)}
+    exits = {idx: parse_time(row.get("exit_time", exit_time)) for idx, row in enumerate(parameters)}
+    entered, exited = set(), set()
+
+    while clock.now.time() <= exit_time and len(exited) < len(parameters):
+        for idx, row in enumerate(parameters):
+            if idx not in entered and clock.now.time() >= entries[idx]:
+                await strategy.place_straddle(idx, row["sl_pct"])
+                entered.add(idx)
+
+        if entered:
+            await strategy.update_position()
+
+        tradingsymbol = cache.get(f"{strategy.strategy}_tradingsymbol", {})
+        for idx in entered - exited:
+            symbol = tradingsymbol[idx]
+            if symbol["exited"]:
+                exited.add(idx)
+            elif clock.now.time() >= exits[idx]:
+                await strategy.exit_order(idx)
+                exited.add(idx)
+            elif parameters[idx].get("trail") and not symbol.get("modified_sl_to_cost"):
+                if symbol["ce_exited"] or symbol["pe_exited"]:
+                    await strategy.modify_to_cost(idx)
+
+        await clock.sleep(1)
+
+    for idx in entered - exited:
+        await strategy.exit_order(idx)
+
+
+async def backtest(opt_strategy, day, lots=1, parameters=None, quiet=True, **strategy_kwargs):
+    """
+    Replay one archived day through the deployed strategy's own ``Strategy`` class, with a simulated
+    clock, cache and broker. Returns the fills and the resulting positions.
+
+    The strategy module's globals are swapped while it runs, so run backtests in their own worker,
+    never next to live strategies.
+    """
+    module = importlib.import_module(f"apps.trade.strategy.{opt_strategy.strategy.file_name}")
+    Strategy = module.Strategy
+
+    if parameters is None:
+        parameters = [p.parameters async for p in opt_strategy.parameters.filter(is_active=True).order_by("name")]
+
+    cache = SimulatedCache()
+    market = MarketReplay.from_archive(day, cache)
+    clock = SimulatedClock(market.start, market)
+    broker = SimulatedBroker("backtest", market, clock)
+    straddle = opt_strategy.strategy.strategy_type == "ce_pe_with_sl"
+
+    user_params = [
+        {
+            "user": SimulatedUser(broker.username),
+            "quantity": lots * opt_strategy.lot_size,
+            "quantity_multiple": [item * opt_strategy.lot_size for item in divide_and_list(len(parameters), lots)],
+            "order_obj": broker,
+        }
+    ]
+
+    output = io.StringIO()
+    with patched(
+        module,
+        cache=cache,
+        timezone=clock,
+        asyncio=clock,
+        LIVE_BNF_PCR=market,
+        strategy_state=SimulatedStrategyState(),
+        chain_events=SimulatedChainEvents(clock, market),
+    ):
+        with contextlib.redirect_stdout(output) if quiet else contextlib.nullcontext():
+            if straddle:
+                strategy = Strategy(user_params=user_params, opt_strategy=opt_strategy, **strategy_kwargs)
+                await drive_straddles(strategy, parameters, clock, cache)
+            else:
+                strategy = Strategy(
+                    user_params=user_params, parameters=parameters, opt_strategy=opt_strategy, **strategy_kwargs
+                )
+                await strategy.run()
+
+    trades = broker.trades()
+    book = positions(trades, market)
+    return {
+        "day": day,
+        "trades": trades,
+        "positions": book,
+        "pnl": round(float(book["pnl"].sum()), 2),
+        "log": output.getvalue(),
+    }
+
+
+async def run_backtest(pk, day, lots=1, parameters=None, **strategy_kwargs):
+    opt_strategy = await DeployedOptionStrategy.objects.select_related("strategy").aget(pk=pk)
+    return await backtest(opt_strategy, day, lots, parameters, **strategy_kwargs)
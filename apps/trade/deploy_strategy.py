@@ -1,226 +1,80 @@
+import asyncio
+
 from django.utils.module_loading import import_string
 
 from apps.trade.models import DeployedOptionStrategy
+from apps.trade.runner import run_action
 from utils import divide_and_list
+from utils.latency import start_metrics_server
 from utils.multi_broker import Broker as MultiBroker
 
 option_strategy = DeployedOptionStrategy.objects.get(strategy_name="Banknifty One Side Exit")
 
 
+async def build_strategy(opt_strategy, **kwargs):
+    """
+    Strategy of `opt_strategy` with a broker session for each of its active users, None when it is not
+    active. Everything is read with the async ORM, so the loop never waits on the database.
+    """
+    opt_strategy = await DeployedOptionStrategy.objects.select_related("strategy").aget(pk=opt_strategy.pk)
+    if not opt_strategy.is_active:
+        return None
+
+    Strategy = import_string(f"apps.trade.strategy.{opt_strategy.strategy.file_name}.Strategy")
+    parameters = [p.parameters async for p in opt_strategy.parameters.filter(is_active=True).order_by("name")]
+    users = [user async for user in opt_strategy.users.filter(is_active=True).select_related("user")]
+    order_objs = await asyncio.gather(*(MultiBroker(user.user.username, user.broker) for user in users))
+
+    user_params = [
+        {
+            "user": user.user,
+            "quantity_multiple": [item * 25 for item in divide_and_list(len(parameters), user.lots)],
+            "order_obj": order_obj,
+        }
+        for user, order_obj in zip(users, order_objs)
+    ]
+    return Strategy(user_params=user_params, parameters=parameters, opt_strategy=opt_strategy, **kwargs)
+
+
 async def run_strategy(min_delta=None, opt_strategy=option_strategy):
     if min_delta is None:
         min_delta = [45]
-    Strategy = import_string(f"apps.trade.strategy.{opt_strategy.strategy.file_name}.Strategy")
-
-    if opt_strategy.is_active:
-        parameters = [p.parameters for p in opt_strategy.parameters.filter(is_active=True).order_by("name")]
-        user_params = []
-        for user in opt_strategy.users.filter(is_active=True):
-            order_obj = await MultiBroker(user.user.username, user.broker)
-            user_params.append(
-                {
-                    "user": user.user,
-                    "quantity_multiple": [item * 25 for item in divide_and_list(len(parameters), user.lots)],
-                    "order_obj": order_obj,
-                }
-            )
-
-        strategy = Strategy(
-            user_params=user_params,
-            parameters=parameters,
-            opt_strategy=opt_strategy,
-            min_delta=min_delta,
-        )
+    start_metrics_server()
+    strategy = await build_strategy(opt_strategy, min_delta=min_delta)
+    if strategy:
         await strategy.run()
 
 
 async def run_true_strategy(data=None, opt_strategy=option_strategy):
-    Strategy = import_string(f"apps.trade.strategy.{opt_strategy.strategy.file_name}.Strategy")
-
-    if opt_strategy.is_active:
-        parameters = [p.parameters for p in opt_strategy.parameters.filter(is_active=True).order_by("name")]
-        user_params = []
-        for user in opt_strategy.users.filter(is_active=True):
-            order_obj = await MultiBroker(user.user.username, user.broker)
-            user_params.append(
-                {
-                    "user": user.user,
-                    "quantity_multiple": [item * 25 for item in divide_and_list(len(parameters), user.lots)],
-                    "order_obj": order_obj,
-                }
-            )
-
-        strategy = Strategy(
-            user_params=user_params,
-            parameters=parameters,
-            opt_strategy=opt_strategy,
-        )
+    start_metrics_server()
+    strategy = await build_strategy(opt_strategy)
+    if strategy:
         await strategy.run(entered=True, data=data)
 
 
 async def manual_reentry(idx, opt_strategy=option_strategy):
-    Strategy = import_string(f"apps.trade.strategy.{opt_strategy.strategy.file_name}.Strategy")
-
-    if opt_strategy.is_active:
-        parameters = [p.parameters for p in opt_strategy.parameters.filter(is_active=True).order_by("name")]
-        user_params = []
-        for user in opt_strategy.users.filter(is_active=True):
-            order_obj = await MultiBroker(user.user.username, user.broker)
-            user_params.append(
-                {
-                    "user": user.user,
-                    "quantity_multiple": [item * 25 for item in divide_and_list(len(parameters), user.lots)],
-                    "order_obj": order_obj,
-                }
-            )
-
-        strategy = Strategy(
-            user_params=user_params,
-            parameters=parameters,
-            opt_strategy=opt_strategy,
-        )
-        await strategy.manual_reentry(idx)
+    await run_action(opt_strategy.pk, "manual_reentry", idx)
 
 
 async def manual_exit(idx, option_type, opt_strategy=option_strategy):
-    Strategy = import_string(f"apps.trade.strategy.{opt_strategy.strategy.file_name}.Strategy")
-
-    if opt_strategy.is_active:
-        parameters = [p.parameters for p in opt_strategy.parameters.filter(is_active=True).order_by("name")]
-        user_params = []
-        for user in opt_strategy.users.filter(is_active=True):
-            order_obj = await MultiBroker(user.user.username, user.broker)
-            user_params.append(
-                {
-                    "user": user.user,
-                    "quantity_multiple": [item * 25 for item in divide_and_list(len(parameters), user.lots)],
-                    "order_obj": order_obj,
-                }
-            )
-
-        strategy = Strategy(
-            user_params=user_params,
-            parameters=parameters,
-            opt_strategy=opt_strategy,
-        )
-        await strategy.manual_exit(idx, option_type)
+    await run_action(opt_strategy.pk, "manual_exit", idx, option_type)
 
 
 async def manual_shifting(idx, opt_strategy=option_strategy):
-    Strategy = import_string(f"apps.trade.strategy.{opt_strategy.strategy.file_name}.Strategy")
-
-    if opt_strategy.is_active:
-        parameters = [p.parameters for p in opt_strategy.parameters.filter(is_active=True).order_by("name")]
-        user_params = []
-        for user in opt_strategy.users.filter(is_active=True):
-            order_obj = await MultiBroker(user.user.username, user.broker)
-            user_params.append(
-                {
-                    "user": user.user,
-                    "quantity_multiple": [item * 25 for item in divide_and_list(len(parameters), user.lots)],
-                    "order_obj": order_obj,
-                }
-            )
-
-        strategy = Strategy(
-            user_params=user_params,
-            parameters=parameters,
-            opt_strategy=opt_strategy,
-        )
-        await strategy.manual_shifting(idx)
+    await run_action(opt_strategy.pk, "manual_shifting", idx)
 
 
 async def exit_algo(opt_strategy=option_strategy):
-    Strategy = import_string(f"apps.trade.strategy.{opt_strategy.strategy.file_name}.Strategy")
-
-    if opt_strategy.is_active:
-        parameters = [p.parameters for p in opt_strategy.parameters.filter(is_active=True).order_by("name")]
-        user_params = []
-        for user in opt_strategy.users.filter(is_active=True):
-            order_obj = await MultiBroker(user.user.username, user.broker)
-            user_params.append(
-                {
-                    "user": user.user,
-                    "quantity_multiple": [item * 25 for item in divide_and_list(len(parameters), user.lots)],
-                    "order_obj": order_obj,
-                }
-            )
-
-        strategy = Strategy(
-            user_params=user_params,
-            parameters=parameters,
-            opt_strategy=opt_strategy,
-        )
-        await strategy.exit_algo()
+    await run_action(opt_strategy.pk, "exit_algo")
 
 
 async def manual_shift_single_strike(idx, option_type, points, opt_strategy=option_strategy):
-    Strategy = import_string(f"apps.trade.strategy.{opt_strategy.strategy.file_name}.Strategy")
-
-    if opt_strategy.is_active:
-        parameters = [p.parameters for p in opt_strategy.parameters.filter(is_active=True).order_by("name")]
-        user_params = []
-        for user in opt_strategy.users.filter(is_active=True):
-            order_obj = await MultiBroker(user.user.username, user.broker)
-            user_params.append(
-                {
-                    "user": user.user,
-                    "quantity_multiple": [item * 25 for item in divide_and_list(len(parameters), user.lots)],
-                    "order_obj": order_obj,
-                }
-            )
-
-        strategy = Strategy(
-            user_params=user_params,
-            parameters=parameters,
-            opt_strategy=opt_strategy,
-        )
-        await strategy.manual_shift_single_strike(idx, option_type, points)
+    await run_action(opt_strategy.pk, "manual_shift_single_strike", idx, option_type, points)
 
 
 async def release_one_side_exit_hold(idx, opt_strategy=option_strategy):
-    Strategy = import_string(f"apps.trade.strategy.{opt_strategy.strategy.file_name}.Strategy")
-
-    if opt_strategy.is_active:
-        parameters = [p.parameters for p in opt_strategy.parameters.filter(is_active=True).order_by("name")]
-        user_params = []
-        for user in opt_strategy.users.filter(is_active=True):
-            order_obj = await MultiBroker(user.user.username, user.broker)
-            user_params.append(
-                {
-                    "user": user.user,
-                    "quantity_multiple": [item * 25 for item in divide_and_list(len(parameters), user.lots)],
-                    "order_obj": order_obj,
-                }
-            )
-
-        strategy = Strategy(
-            user_params=user_params,
-            parameters=parameters,
-            opt_strategy=opt_strategy,
-        )
-        await strategy.release_one_side_exit_hold(idx)
+    await run_action(opt_strategy.pk, "release_one_side_exit_hold", idx)
 
 
 async def one_side_exit_hold(idx, opt_strategy=option_strategy):
-    Strategy = import_string(f"apps.trade.strategy.{opt_strategy.strategy.file_name}.Strategy")
-
-    if opt_strategy.is_active:
-        parameters = [p.parameters for p in opt_strategy.parameters.filter(is_active=True).order_by("name")]
-        user_params = []
-        for user in opt_strategy.users.filter(is_active=True):
-            order_obj = await MultiBroker(user.user.username, user.broker)
-            user_params.append(
-                {
-                    "user": user.user,
-                    "quantity_multiple": [item * 25 for item in divide_and_list(len(parameters), user.lots)],
-                    "order_obj": order_obj,
-                }
-            )
-
-        strategy = Strategy(
-            user_params=user_params,
-            parameters=parameters,
-            opt_strategy=opt_strategy,
-        )
-        await strategy.one_side_exit_hold(idx)
+    await run_action(opt_strategy.pk, "one_side_exit_hold", idx)
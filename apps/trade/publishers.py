@@ -0,0 +1,467 @@
+import asyncio
+import contextlib
+import datetime as dt
+import traceback
+
+import numpy as np
+import pandas as pd
+from channels.layers import get_channel_layer
+from django.core.cache import cache
+from django.utils import timezone
+
+from apps.trade.models import DeployedOptionStrategy, DeployedOptionStrategyUser
+from utils import strategy_state
+from utils.option_chain import get_option_chain
+from utils.position_book import open_positions
+from utils.risk import ACCOUNT_COLUMNS, RiskAggregator
+from utils.timeseries import LIVE_BNF_PCR
+
+PCR_GROUP = "bnf_pcr"
+LIVE_POSITIONS_GROUP = "live_positions"
+LIVE_PNL_GROUP = "live_pnl"
+STOP_LOSS_DIFFERENCE_GROUP = "stop_loss_difference"
+RISK_GROUP = "risk"
+
+# how often the strategy, user and parameter rows are read again from the database
+CONTEXT_REFRESH_SECONDS = 60
+
+
+def live_pnl_group(pk):
+    return f"live_pnl_{pk}"
+
+
+def strategy_symbol_group(pk):
+    return f"deployed_option_strategy_symbol_{pk}"
+
+
+async def publish(group, data):
+    """Send `data` to every consumer of `group`, the consumers forward it as is."""
+    await get_channel_layer().group_send(group, {"type": "publish", "data": data})
+
+
+@contextlib.contextmanager
+def topic(group):
+    """Log a failure building or sending `group` and carry on, one bad payload never blanks every dashboard."""
+    try:
+        yield
+    except Exception:
+        print(f"PUBLISH {group} FAILED")
+        traceback.print_exc()
+
+
+async def quantity_mistmatch(df=None):
+    if df is None:
+        df = await calculate_live_pnl()
+    accounts = strategy_state.accounts("1")
+    user_in_cache = [x["username"] for x in accounts]
+    user_in_cache_quantity = {x["username"]: [x["quantity_multiple"], x["broker"]] for x in accounts}
+    quantity_map = (
+        df.groupby(["username", "tradingsymbol"]).agg({"net_qty": "sum", "broker_name": "first"}).reset_index()
+    )
+
+    tradingsymbols = cache.get("1_tradingsymbol", {})
+
+    tradingsymbol_map = []
+    broker_map = {}
+    for key, row in tradingsymbols.items():
+        for user in user_in_cache:
+            data = []
+            qty = user_in_cache_quantity[user][0][key]
+            broker = user_in_cache_quantity[user][1]
+            broker_map[broker] = broker
+            if row["pe_tradingsymbol"]:
+                data.append(
+                    {
+                        "username": user,
+                        "broker_name": broker,
+                        "expected_qty": -qty,
+                        "tradingsymbol": row["pe_tradingsymbol"],
+                    }
+                )
+
+            if row["ce_tradingsymbol"]:
+                data.append(
+                    {
+                        "username": user,
+                        "broker_name": broker,
+                        "expected_qty": -qty,
+                        "tradingsymbol": row["ce_tradingsymbol"],
+                    }
+                )
+
+            tradingsymbol_map.extend(data)
+
+    expected_qty_df = pd.DataFrame(
+        tradingsymbol_map, columns=["username", "broker_name", "expected_qty", "tradingsymbol"]
+    )
+    expected_qty_df = (
+        expected_qty_df.groupby(["username", "broker_name", "tradingsymbol"])
+        .agg({"expected_qty": "sum"})
+        .reset_index()
+    )
+    quantity_map_df = pd.merge(
+        quantity_map, expected_qty_df, on=["username", "broker_name", "tradingsymbol"], how="outer"
+    ).fillna(0)
+
+    return quantity_map_df
+
+
+async def calculate_live_pnl():
+    """Every book's positions marked at the chain's last price, one row per account and symbol."""
+    df = open_positions()
+    try:
+        chain = get_option_chain()
+    except FileNotFoundError:
+        return df.iloc[:0].assign(last_price=0.0, pnl=0.0)
+
+    rows = df["tradingsymbol"].map(chain.tradingsymbol_index)
+    df = df[rows.notna()].copy()
+    df["last_price"] = chain.column("last_price")[rows.dropna().astype(int).to_numpy()]
+    df["pnl"] = df["sell_value"] - df["buy_value"] + (df["net_qty"] * df["last_price"])
+    return df
+
+
+def live_positions(df):
+    df = df[
+        ["username", "broker_name", "tradingsymbol", "sell_value", "buy_value", "net_qty", "pnl", "last_price"]
+    ].copy()
+    df_square_of_positions = df[df["net_qty"] == 0].sort_values(["username", "net_qty", "tradingsymbol"])
+    df_open_positions = df[df["net_qty"] != 0].sort_values(["username", "net_qty", "tradingsymbol"])
+    return pd.concat([df_open_positions, df_square_of_positions], ignore_index=True)
+
+
+async def get_dummy_points(df=None):
+    if df is None:
+        df = await calculate_live_pnl()
+    df = live_positions(df)
+
+    return round(df[df["username"] == "dummy"].pnl.sum() / 75, 2)
+
+
+def pcr_rows(df, short_periods):
+    df["ce_oi_change"] = df["ce_total_oi"].pct_change(periods=72).fillna(0.0).replace(np.inf, -1.0)
+    df["pe_oi_change"] = df["pe_total_oi"].pct_change(periods=72).fillna(0.0).replace(np.inf, -1.0)
+    df["ce_oi_change_3min"] = df["ce_total_oi"].pct_change(periods=short_periods).fillna(0.0).replace(np.inf, -1.0)
+    df["pe_oi_change_3min"] = df["pe_total_oi"].pct_change(periods=short_periods).fillna(0.0).replace(np.inf, -1.0)
+
+    return [
+        {
+            "timestamp": row.timestamp.isoformat(),
+            "pe_total_oi": row.pe_total_oi,
+            "ce_total_oi": row.ce_total_oi,
+            "pcr": row.pe_total_oi / row.ce_total_oi,
+            "ce_oi_change": row.ce_oi_change,
+            "pe_oi_change": row.pe_oi_change,
+            "ce_oi_change_3min": row.ce_oi_change_3min,
+            "pe_oi_change_3min": row.pe_oi_change_3min,
+            "ce_pe_oi_change": row.ce_oi_change - row.pe_oi_change,
+            "pe_ce_oi_change": row.pe_oi_change - row.ce_oi_change,
+            "ce_pe_oi_change_3min": row.ce_oi_change_3min - row.pe_oi_change_3min,
+            "pe_ce_oi_change_3min": row.pe_oi_change_3min - row.ce_oi_change_3min,
+            "strike": row.strike,
+            "ce_iv": row.ce_iv,
+            "pe_iv": row.pe_iv,
+            "total_iv": row.ce_iv + row.pe_iv,
+            "ce_premium": row.ce_premium,
+            "pe_premium": row.pe_premium,
+            "total_premium": row.ce_premium + row.pe_premium,
+        }
+        for _, row in df.iterrows()
+    ]
+
+
+def pcr_history():
+    """Whole day of PCR rows, newest first, sent once when a chart connects."""
+    return {"data": pcr_rows(LIVE_BNF_PCR.range(), 36)[::-1]}
+
+
+def pcr_latest():
+    # the latest row only looks 72 rows back, no need to read the whole day
+    return {"data": pcr_rows(LIVE_BNF_PCR.latest(73), 24)[-1:]}
+
+
+def strategy_points(parameters, tradingsymbol, instruments):
+    """Copies of `parameters` with the entry, exit and points of every entered set, and their total points."""
+    rows, pts = [], 0
+    for row in parameters:
+        row = dict(row)
+        rows.append(row)
+        symbol = tradingsymbol.get(row["name"], {})
+        if symbol:
+            row["entered"] = symbol["entered"]
+            row["exited"] = symbol["exited"]
+            row["ce_exited"] = symbol["ce_exited"]
+            row["pe_exited"] = symbol["pe_exited"]
+            row["pe_entry_price"] = symbol["pe_entry_price"]
+            row["ce_entry_price"] = symbol["ce_entry_price"]
+            row["ce_sl"] = symbol["ce_sl"]
+            row["pe_sl"] = symbol["pe_sl"]
+            row["pts"] = 0
+
+            row["modified_sl_to_cost"] = symbol.get("modified_sl_to_cost", False)
+
+            if symbol["ce_tradingsymbol"]:
+                ce = instruments.loc[symbol["ce_tradingsymbol"]]
+                if symbol.get("ce_exit_price"):
+                    row["ce_exit_price"] = symbol["ce_exit_price"]
+                    row["pts"] += float(row["ce_entry_price"]) - float(row["ce_exit_price"])
+                else:
+                    row["pts"] += float(row["ce_entry_price"]) - float(ce["last_price"])
+                row["ce_strike"] = ce.strike
+
+            if symbol["pe_tradingsymbol"]:
+                pe = instruments.loc[symbol["pe_tradingsymbol"]]
+                if symbol.get("pe_exit_price"):
+                    row["pe_exit_price"] = symbol["pe_exit_price"]
+                    row["pts"] += float(row["pe_entry_price"]) - float(row["pe_exit_price"])
+                else:
+                    row["pts"] += float(row["pe_entry_price"]) - float(pe["last_price"])
+                row["pe_strike"] = pe.strike
+
+            row["pts"] = round(row["pts"], 2)
+            pts += row["pts"]
+
+    return rows, pts
+
+
+def open_position_data(pk, instruments):
+    position_data = []
+    if strategy_state.is_deployed(pk):
+        trading_symbols = cache.get(f"{pk}_tradingsymbol", dict())
+        for idx in sorted(trading_symbols.keys()):
+            row = trading_symbols[idx]
+            ce_strike = pe_strike = None
+            ce_delta = pe_delta = 0
+            ce_price = pe_price = 0
+            if row["ce_tradingsymbol"]:
+                ce = instruments.loc[row["ce_tradingsymbol"]]
+                ce_strike = ce.strike
+                ce_delta = ce["delta"]
+                ce_price = ce["last_price"]
+
+            if row["pe_tradingsymbol"]:
+                pe = instruments.loc[row["pe_tradingsymbol"]]
+                pe_strike = pe.strike
+                pe_delta = pe["delta"]
+                pe_price = pe["last_price"]
+
+            position_data.append(
+                {
+                    "idx": idx,
+                    "one_side_exit_hold": cache.get(f"{pk}_{idx}_one_side_exit_hold", 0),
+                    "ce_strike": ce_strike,
+                    "ce_delta": ce_delta,
+                    "ce_price": ce_price,
+                    "pe_strike": pe_strike,
+                    "pe_delta": pe_delta,
+                    "pe_price": pe_price,
+                    "exited_one_side": row["exited_one_side"],
+                    "ce_exit_one_side": row["ce_exit_one_side"],
+                    "pe_exit_one_side": row["pe_exit_one_side"],
+                }
+            )
+
+    return position_data
+
+
+def live_pnl(df, quantity_df, jegan_map, jegan_pts):
+    broker_id_map = {"dummy": 0, "kotak_neo": 1, "kotak": 1}
+    df = df.copy()
+    df["broker_id"] = df["broker_name"].map(lambda x: broker_id_map.get(x, 1))
+    df = (
+        df.groupby(["broker_id", "username"])
+        .agg(
+            {
+                "broker_name": "first",
+                "pnl": "sum",
+                "ce_buy_qty": "sum",
+                "ce_sell_qty": "sum",
+                "pe_buy_qty": "sum",
+                "pe_sell_qty": "sum",
+            }
+        )
+        .reset_index()
+    )
+    df = pd.merge(df, quantity_df, on="username")
+    df["jegan_pnl"] = df["username"].apply(lambda x: jegan_map.get(x, 0) * jegan_pts * 25)
+    df["jegan_pts"] = df["jegan_pnl"] / df["quantity"]
+    df["pnl_points"] = (df["pnl"] / df["quantity"]) - df["jegan_pts"]
+    df = df.reset_index()
+    df["index"] = df["index"] + 1
+    return df.to_dict("records")
+
+
+def strategy_live_pnl(df, quantity_df, quantity_mismatch_df, user_in_cache, jegan_map, jegan_pts):
+    df = (
+        df.groupby(["username"])
+        .agg(
+            {
+                "broker_name": "first",
+                "pnl": "sum",
+                "ce_buy_qty": "sum",
+                "ce_sell_qty": "sum",
+                "pe_buy_qty": "sum",
+                "pe_sell_qty": "sum",
+                "margin": "first",
+            }
+        )
+        .reset_index()
+    )
+    df = pd.merge(quantity_df, df, on=["username", "broker_name"], how="left")
+    df.fillna(0, inplace=True)
+    df["jegan_pnl"] = df["username"].apply(lambda x: jegan_map.get(x, 0) * jegan_pts * 25)
+    df["jegan_pts"] = df["jegan_pnl"] / df["quantity"]
+    df["pnl_points"] = (df["pnl"] / df["quantity"]) - df["jegan_pts"]
+    df = df.reset_index()
+    df.fillna(0, inplace=True)
+    df["index"] = df["index"] + 1
+    df["in_cache"] = df["username"].apply(lambda x: True if x in user_in_cache else False)
+    df = pd.merge(df, quantity_mismatch_df, on="username", how="left").fillna(0)
+    return df.to_dict("records")
+
+
+def strategy_parameters(deployed_option_strategy):
+    return sorted(
+        [
+            {
+                "name": row.name,
+                "entry_time": row.parameters["entry_time"],
+                "exit_time": row.parameters["exit_time"],
+                "trail": row.parameters["trail"],
+                "sl_pct": row.parameters["sl_pct"],
+            }
+            for row in deployed_option_strategy.parameters.all()
+        ],
+        key=lambda x: int(x["name"]),
+    )
+
+
+async def load_context():
+    """Database rows the payloads depend on, they rarely change during the day."""
+    jegan = await DeployedOptionStrategy.objects.filter(pk=2).afirst()
+    strategies = [
+        strategy async for strategy in DeployedOptionStrategy.objects.filter(is_active=True).select_related("strategy")
+    ]
+
+    quantities = {}
+    async for row in DeployedOptionStrategyUser.objects.filter(parent__in=strategies).select_related("user", "parent"):
+        quantities.setdefault(row.parent_id, []).append(
+            {"username": row.user.username, "quantity": (row.parent.lot_size * row.lots), "broker_name": row.broker}
+        )
+
+    return {
+        "jegan_map": {row.user.username: row.lots for row in jegan.users.all()} if jegan else {},
+        "jegan_parameters": strategy_parameters(jegan) if jegan else [],
+        "strategies": {
+            strategy.pk: strategy_parameters(strategy) if strategy.strategy.strategy_type == "ce_pe_with_sl" else None
+            for strategy in strategies
+        },
+        "quantities": {
+            pk: pd.DataFrame(rows, columns=["username", "quantity", "broker_name"]) for pk, rows in quantities.items()
+        },
+    }
+
+
+def account_risk(risk: RiskAggregator, context, greeks):
+    """Risk of every account, strategy and the firm from one pass of the aggregator."""
+    members = {pk: list(zip(rows["broker_name"], rows["username"])) for pk, rows in context["quantities"].items()}
+    try:
+        chain = get_option_chain()
+    except FileNotFoundError:
+        return {"accounts": pd.DataFrame(columns=ACCOUNT_COLUMNS), "strategies": {}, "firm": {}}
+    return risk.compute(chain, greeks, members)
+
+
+async def publish_second(context, risk: RiskAggregator):
+    """Compute every per second payload once and send it to its group."""
+    df = await calculate_live_pnl()
+    greeks = cache.get("OPTION_GREEKS_INSTRUMENTS")
+    instruments = greeks.set_index("tradingsymbol", drop=False) if greeks is not None else None
+
+    accounts = None
+    with topic(RISK_GROUP):
+        result = account_risk(risk, context, greeks)
+        accounts = result["accounts"]
+        await publish(
+            RISK_GROUP,
+            {
+                "firm": result["firm"],
+                "strategies": result["strategies"],
+                "accounts": accounts.round(2).to_dict("records"),
+            },
+        )
+
+    with topic(LIVE_POSITIONS_GROUP):
+        await publish(LIVE_POSITIONS_GROUP, live_positions(df).to_dict("records"))
+
+    with topic(STOP_LOSS_DIFFERENCE_GROUP):
+        stop_loss = cache.get("STRATEGY_STOP_LOSS", 0)
+        await publish(
+            STOP_LOSS_DIFFERENCE_GROUP, {"stop_loss_difference": round(await get_dummy_points(df) + stop_loss)}
+        )
+
+    # the pnl topics are built from the accounts of the risk pass
+    if accounts is None:
+        return
+
+    _, jegan_pts = strategy_points(context["jegan_parameters"], cache.get("2_tradingsymbol", {}), instruments)
+    empty = pd.DataFrame(columns=["username", "quantity", "broker_name"])
+
+    with topic(LIVE_PNL_GROUP):
+        quantity_df = context["quantities"].get(1, empty)[["username", "quantity"]]
+        await publish(LIVE_PNL_GROUP, live_pnl(accounts, quantity_df, context["jegan_map"], jegan_pts))
+
+    quantity_map_df = await quantity_mistmatch(df)
+    quantity_map_df["mismatch"] = np.where(quantity_map_df["expected_qty"] != quantity_map_df["net_qty"], 1, 0)
+    quantity_mismatch_df = quantity_map_df.groupby("username").agg({"mismatch": "max"})
+    user_in_cache = [x["username"] for x in strategy_state.accounts("1")]
+
+    for pk, parameters in context["strategies"].items():
+        with topic(live_pnl_group(pk)):
+            await publish(
+                live_pnl_group(pk),
+                strategy_live_pnl(
+                    accounts,
+                    context["quantities"].get(pk, empty),
+                    quantity_mismatch_df,
+                    user_in_cache,
+                    context["jegan_map"],
+                    jegan_pts,
+                ),
+            )
+
+        with topic(strategy_symbol_group(pk)):
+            if parameters is not None:
+                rows, _ = strategy_points(parameters, cache.get(f"{pk}_tradingsymbol", {}), instruments)
+                await publish(strategy_symbol_group(pk), rows)
+            else:
+                await publish(strategy_symbol_group(pk), open_position_data(pk, instruments))
+
+
+async def run_publishers(until=dt.time(15, 30)):
+    """
+    Single producer of every dashboard topic. Payloads are built once per second, the PCR every 5
+    seconds, and fanned out over the channel layer, so the load does not grow with open dashboards.
+    """
+    context, context_at = None, None
+    risk = RiskAggregator()
+    while True:
+        ct = timezone.localtime()
+        if ct.time() > until:
+            break
+
+        # errors of single topics are caught in publish_second, these are the inputs every topic shares
+        try:
+            if context is None or (ct - context_at).total_seconds() >= CONTEXT_REFRESH_SECONDS:
+                context, context_at = await load_context(), ct
+            await publish_second(context, risk)
+        except Exception:
+            traceback.print_exc()
+
+        if ct.second % 5 == 0:
+            with topic(PCR_GROUP):
+                await publish(PCR_GROUP, pcr_latest())
+
+        ct = timezone.localtime()
+        loop_time = ct.replace(microsecond=0) + dt.timedelta(seconds=1)
+        await asyncio.sleep((loop_time - ct).total_seconds())
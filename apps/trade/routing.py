@@ -6,6 +6,7 @@ from apps.trade.consumers import (  # AlgoStatusConsumer,;
     LivekPositionConsumer,
     LivePnlConsumer,
     NotificationConsumner,
+    RiskConsumer,
     LivePnlConsumerStrategy,
     StopLossDifference
 )
@@ -16,6 +17,7 @@ websocket_urlpatterns = [
     path("ws/live_pnl/<pk>", LivePnlConsumerStrategy.as_asgi()),
     path("ws/stop_loss_difference/<pk>", StopLossDifference.as_asgi()),
     path("ws/live_positions/", LivekPositionConsumer.as_asgi()),
+    path("ws/risk/", RiskConsumer.as_asgi()),
     path("ws/deployed_option_strategy_symbol/<pk>", DeployedOptionStrategySymbolConsumer.as_asgi()),
     # path("ws/algo_status/<pk>", AlgoStatusConsumer.as_asgi()),
     path("ws/read_notifications", NotificationConsumner.as_asgi()),
@@ -0,0 +1,139 @@
+import asyncio
+import datetime as dt
+import json
+import time
+import traceback
+
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from apps.trade.models import DeployedOptionStrategy
+from utils import strategy_state
+from utils.timeseries import get_redis
+
+COMMANDS_KEY = "STRATEGY_RUNNER_COMMANDS"
+HEARTBEAT_KEY = "STRATEGY_RUNNER_HEARTBEAT"
+
+# seconds without a heartbeat before the runner counts as down
+HEARTBEAT_TIMEOUT = 5
+
+# seconds a queued command stays good, older ones are dropped instead of acting on a stale market
+COMMAND_TIMEOUT = 30
+
+# Strategy methods the runner takes commands for, everything else is refused.
+ACTIONS = {
+    "manual_shifting",
+    "manual_shift_single_strike",
+    "manual_reentry",
+    "manual_exit",
+    "one_side_exit_hold",
+    "release_one_side_exit_hold",
+    "exit_algo",
+    "place_straddle",
+    "modify_to_cost",
+    "exit_order",
+    "update_position",
+}
+
+
+def is_running() -> bool:
+    return cache.get(HEARTBEAT_KEY) is not None
+
+
+def submit(pk, action, *args, **kwargs) -> bool:
+    """Queue `action` of strategy `pk` on the resident runner, False when no runner is up to take it."""
+    if not is_running():
+        return False
+    command = {"pk": str(pk), "action": action, "args": list(args), "kwargs": kwargs, "submitted_at": time.time()}
+    with get_redis().pipeline() as pipe:
+        pipe.rpush(COMMANDS_KEY, json.dumps(command))
+        # a queue nobody took off expires, it never reaches the next day's runner
+        pipe.expire(COMMANDS_KEY, COMMAND_TIMEOUT)
+        pipe.execute()
+    return True
+
+
+async def run_action(pk, action, *args, **kwargs):
+    """Hand `action` to the resident runner, or run it here on a one-off runner when none is up."""
+    if not submit(pk, action, *args, **kwargs):
+        await StrategyRunner().execute(str(pk), action, args, kwargs)
+
+
+class StrategyRunner:
+    """
+    Deployed strategies and their broker sessions, kept warm between manual actions.
+
+    Each strategy is built once, its user_params follow `strategy_state` and are rebuilt only when
+    accounts change, so a command costs the action itself. Commands of one strategy run one at a time,
+    commands of different strategies run side by side.
+    """
+
+    def __init__(self):
+        self.strategies = {}
+        self.versions = {}
+        self.locks = {}
+
+    async def build(self, pk):
+        opt_strategy = await DeployedOptionStrategy.objects.select_related("strategy").aget(pk=pk)
+        Strategy = import_string(f"apps.trade.strategy.{opt_strategy.strategy.file_name}.Strategy")
+        if opt_strategy.strategy.strategy_type == "ce_pe_with_sl":
+            return Strategy(user_params=[], opt_strategy=opt_strategy)
+
+        parameters = [p.parameters async for p in opt_strategy.parameters.filter(is_active=True).order_by("name")]
+        return Strategy(user_params=[], parameters=parameters, opt_strategy=opt_strategy)
+
+    async def strategy(self, pk):
+        if pk not in self.strategies:
+            self.strategies[pk] = await self.build(pk)
+
+        strategy = self.strategies[pk]
+        version = strategy_state.version(pk)
+        if version != self.versions.get(pk):
+            strategy.user_params = await strategy_state.user_params(pk, strategy.user_params)
+            self.versions[pk] = version
+        return strategy
+
+    async def execute(self, pk, action, args=(), kwargs=None):
+        if action not in ACTIONS:
+            print("STRATEGY RUNNER UNKNOWN ACTION", pk, action)
+            return
+
+        async with self.locks.setdefault(pk, asyncio.Lock()):
+            try:
+                strategy = await self.strategy(pk)
+                if strategy.user_params:
+                    await getattr(strategy, action)(*args, **(kwargs or {}))
+            except Exception:
+                traceback.print_exc()
+
+            if action == "exit_algo":
+                # parameters may change before the next deployment, build it again then
+                self.strategies.pop(pk, None)
+                self.versions.pop(pk, None)
+
+    async def run(self, until=dt.time(15, 30)):
+        """Take commands off the queue until `until`, each one in its own task."""
+        client = get_redis()
+        # commands left over from a runner that went down were meant for then, not now
+        client.delete(COMMANDS_KEY)
+        tasks = set()
+        while timezone.localtime().time() < until:
+            cache.set(HEARTBEAT_KEY, timezone.localtime(), HEARTBEAT_TIMEOUT)
+            item = await asyncio.to_thread(client.blpop, COMMANDS_KEY, 1)
+            if item is None:
+                continue
+
+            command = json.loads(item[1])
+            if time.time() - command.get("submitted_at", 0) > COMMAND_TIMEOUT:
+                print("STRATEGY RUNNER STALE COMMAND DROPPED", command["pk"], command["action"])
+                continue
+
+            task = asyncio.create_task(
+                self.execute(command["pk"], command["action"], command["args"], command["kwargs"])
+            )
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        cache.delete(HEARTBEAT_KEY)
+        await asyncio.gather(*tasks)
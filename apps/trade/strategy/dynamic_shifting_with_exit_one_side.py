@@ -1,13 +1,16 @@
 import asyncio
 import datetime as dt
+import traceback
 
-import pandas as pd
 from colorama import Fore
+from django.conf import settings
 from django.core.cache import cache
 from django.utils import timezone
 
-from utils import send_notifications
+from utils import chain_events, send_notifications, strategy_state
 from utils.multi_broker import Broker as MultiBroker
+from utils.strike_ladder import LADDERS_KEY, ChainLadders
+from utils.timeseries import LIVE_BNF_PCR
 
 
 class Strategy:
@@ -69,58 +72,54 @@ class Strategy:
         self.no_of_strategy = len(parameters)
         self.parameters = parameters
         self.instrument_name = instrument_name
-        self.entry_times = [
-            (dt.datetime.combine(timezone.localdate(), entry_time))
-            + dt.timedelta(seconds=(idx * 2 * self.sleep_time) - 1)
-            for idx, _ in enumerate(self.parameters)
-        ]
         self.opt_strategy = opt_strategy
         self.strategy = str(self.opt_strategy.pk)
+        for user in self.user_params:
+            user["order_obj"].strategy_id = self.opt_strategy.pk
+        # strategy_state version self.user_params was built from
+        self.state_version = None
+
+    async def refresh_user_params(self):
+        """Rebuild self.user_params when accounts were added or removed since the last look."""
+        version = strategy_state.version(self.strategy)
+        if version != self.state_version:
+            self.user_params = await strategy_state.user_params(self.strategy, self.user_params)
+            self.state_version = version
 
     def get_greeks_instruments(self):
         return cache.get("OPTION_GREEKS_INSTRUMENTS")
 
+    def get_strike_ladders(self, instruments):
+        """Strike ladders of the `instruments` snapshot, built here only when the published ones moved on."""
+        ladders = cache.get(LADDERS_KEY)
+        if ladders is None or not ladders.matches(instruments):
+            ladders = ChainLadders.from_frame(instruments)
+        return ladders
+
     async def find_strike(self, instruments, near, option_type, query_type, near_type):
-        df = instruments
+        """Ladder of `option_type` and the index of the strike nearest `near` on it, None when there is none."""
+        ladder = self.get_strike_ladders(instruments)[option_type]
         bnf_ltp = cache.get("BANKNIFTY_LTP")
         if option_type == "CE":
-            df = df[df["strike"] > bnf_ltp - 200].copy()
+            strikes = {"above": bnf_ltp - 200}
         else:
-            df = df[df["strike"] < bnf_ltp + 200].copy()
-
-        if near_type == "delta":
-            if query_type == ">":
-                df = (
-                    df[(df["instrument_type"] == option_type) & (df[near_type] >= near)]
-                    .sort_values("strike", ascending=False)
-                    .copy()
-                )
+            strikes = {"below": bnf_ltp + 200}
+
+        # delta falls with the strike for both types, premium falls for calls and rises for puts
+        if query_type == ">":
+            if near_type == "delta" or option_type == "CE":
+                idx = ladder.last(near_type, ">=", near, **strikes)
             else:
-                df = (
-                    df[(df["instrument_type"] == option_type) & (df[near_type] <= near)]
-                    .sort_values("strike", ascending=True)
-                    .copy()
-                )
+                idx = ladder.first(near_type, ">=", near, **strikes)
         else:
-            if query_type == ">":
-                df = df[(df["instrument_type"] == option_type) & (df[near_type] >= near)].copy()
-                if option_type == "CE":
-                    df.sort_values("strike", inplace=True, ignore_index=True, ascending=False)
-                else:
-                    df.sort_values("strike", inplace=True, ignore_index=True, ascending=True)
+            if near_type == "delta" or option_type == "CE":
+                idx = ladder.first(near_type, "<=", near, **strikes)
             else:
-                df = df[(df["instrument_type"] == option_type) & (df[near_type] <= near)].copy()
+                idx = ladder.last(near_type, "<=", near, **strikes)
 
-                if option_type == "PE":
-                    df.sort_values("strike", inplace=True, ignore_index=True, ascending=False)
-                else:
-                    df.sort_values("strike", inplace=True, ignore_index=True, ascending=True)
-
-        if not df.empty:
-            return df.iloc[0].strike, df.iloc[0].sigma
-
-        print("STRIKE EMPTY NOT FOUND.")
-        return 0, 0
+        if idx is None:
+            print("STRIKE EMPTY NOT FOUND.")
+        return ladder, idx
 
     async def place_orders(self, user, buy_pending, sell_pending):
         buy_data, sell_data = [], []
@@ -163,14 +162,47 @@ class Strategy:
             )
         return buy_data, sell_data
 
-    async def save_order_in_db(self, user_order_datas, user_params):
-        for user_order_data in user_order_datas:
-            buy_data = user_order_data[0]
-            sell_data = user_order_data[1]
+    def entry_legs(self, idx, instruments):
+        """Entry strangle of parameter set `idx`, its sell orders and its tradingsymbol row."""
+        # the least delta past min_delta, the highest such call and the lowest such put as delta falls with the strike
+        ladders = self.get_strike_ladders(instruments)
+        ce, pe = ladders["CE"], ladders["PE"]
+        ce_idx = ce.last("delta", ">", self.min_delta[idx])
+        pe_idx = pe.first("delta", "<", -self.min_delta[idx])
+        if ce_idx is None or ce.delta[ce_idx] >= self.max_delta:
+            raise Exception("CE Strike not found")
+        if pe_idx is None or pe.delta[pe_idx] <= -self.max_delta:
+            raise Exception("PE Strike not found")
+
+        sell_pending = [
+            {
+                "strike": pe.strike[pe_idx],
+                "option_type": "PE",
+                "expected_price": pe.last_price[pe_idx],
+                "expected_time": timezone.localtime(),
+                "idx": idx,
+                "reason": "ENTERING PE",
+            },
+            {
+                "strike": ce.strike[ce_idx],
+                "option_type": "CE",
+                "expected_price": ce.last_price[ce_idx],
+                "expected_time": timezone.localtime(),
+                "idx": idx,
+                "reason": "ENTERING CE",
+            },
+        ]
+
+        return sell_pending, {
+            "ce_tradingsymbol": ce.tradingsymbol[ce_idx],
+            "pe_tradingsymbol": pe.tradingsymbol[pe_idx],
+            "exited_one_side": False,
+            "ce_exit_one_side": False,
+            "pe_exit_one_side": False,
+        }
 
     async def place_entry_order(self, conditions):
         instruments = self.get_greeks_instruments()
-        sell_pending, buy_pending = [], []
 
         if timezone.localtime().time() <= self.entry_time:
             await asyncio.sleep(
@@ -187,75 +219,24 @@ class Strategy:
 
         print(timezone.localtime().replace(microsecond=0))
 
-        tradingsymbol = {}
-        user_order_datas = []
-        for idx, _ in enumerate(conditions):
-            ce = (
-                instruments[
-                    (instruments["delta"] > self.min_delta[idx])
-                    & (instruments["delta"] < self.max_delta)
-                    & (instruments["instrument_type"] == "CE")
-                ]
-                .sort_values("delta")
-                .iloc[0]
-            )
-            pe = (
-                instruments[
-                    (instruments["delta"] < -self.min_delta[idx])
-                    & (instruments["delta"] > -self.max_delta)
-                    & (instruments["instrument_type"] == "PE")
-                ]
-                .sort_values("delta")
-                .iloc[-1]
-            )
-            sell_pending = [
-                {
-                    "strike": pe.strike,
-                    "option_type": "PE",
-                    "expected_price": pe.last_price,
-                    "expected_time": timezone.localtime(),
-                    "idx": idx,
-                    "reason": "ENTERING PE",
-                },
-                {
-                    "strike": ce.strike,
-                    "option_type": "CE",
-                    "expected_price": ce.last_price,
-                    "expected_time": timezone.localtime(),
-                    "idx": idx,
-                    "reason": "ENTERING CE",
-                },
-            ]
-
-            ce_tradingsymbol, pe_tradingsymbol = (ce["tradingsymbol"], pe["tradingsymbol"])
-
-            user_order_data = await asyncio.gather(
-                *[
-                    self.place_orders(
-                        user=user,
-                        buy_pending=buy_pending,
-                        sell_pending=sell_pending,
-                    )
-                    for user in self.user_params
-                ]
-            )
-
-            tradingsymbol[idx] = {
-                "ce_tradingsymbol": ce_tradingsymbol,
-                "pe_tradingsymbol": pe_tradingsymbol,
-                "exited_one_side": False,
-                "ce_exit_one_side": False,
-                "pe_exit_one_side": False,
-            }
+        # every strike is picked before any order goes out, so a set without one enters nothing at all
+        entries = [self.entry_legs(idx, instruments) for idx, _ in enumerate(conditions)]
+        tradingsymbol = {idx: row for idx, (_, row) in enumerate(entries)}
 
-        user_order_datas.append(user_order_data)
+        # the parameter sets enter side by side, the order dispatcher paces what reaches each broker
+        await asyncio.gather(
+            *[
+                self.place_orders(
+                    user=user,
+                    buy_pending=[],
+                    sell_pending=sell_pending,
+                )
+                for sell_pending, _ in entries
+                for user in self.user_params
+            ]
+        )
 
-        strategy_list = cache.get("deployed_strategies", {})
-        strategy_list[self.strategy] = {
-            "user_params": self.user_params,
-            "no_of_strategy": self.no_of_strategy,
-        }
-        cache.set("deployed_strategies", strategy_list)
+        self.state_version = strategy_state.deploy(self.strategy, self.user_params, self.no_of_strategy)["version"]
         cache.set(f"{self.strategy}_tradingsymbol", tradingsymbol)
 
         await send_notifications(
@@ -264,11 +245,6 @@ class Strategy:
             "alert-success",
         )
 
-        for user_ordera_data in user_order_datas:
-            for order_data, user in zip(user_ordera_data, self.user_params):
-                # self.save_order_in_db(order_data, user)
-                pass
-
         return True
 
     async def check_shifting_orders(
@@ -281,16 +257,21 @@ class Strategy:
         now_time=timezone.localtime(),
     ):
         buy_pending, sell_pending = [], []
+        ce_tradingsymbol, pe_tradingsymbol = ce["tradingsymbol"], pe["tradingsymbol"]
         if ((pe["delta"] + ce["delta"]) > (min(abs(pe["delta"]), ce["delta"]) * multiplier)) and ce[
             "last_price"
         ] > self.skip_price:
             if ce.strike - ce["bnf_ltp"] <= self.point_difference:
                 if now_time <= self.expiry_check_timestamp:
-                    strike, sigma = await self.find_strike(instruments, -pe["delta"], "CE", ">", "delta")
+                    ladder, found = await self.find_strike(instruments, -pe["delta"], "CE", ">", "delta")
                 else:
-                    strike, sigma = await self.find_strike(instruments, pe["last_price"], "CE", ">", "last_price")
+                    ladder, found = await self.find_strike(instruments, pe["last_price"], "CE", ">", "last_price")
 
-                if strike != int(ce["strike"]) and abs(sigma - ce["sigma"]) < self.sigma_diff:
+                if (
+                    found is not None
+                    and ladder.strike[found] != int(ce["strike"])
+                    and abs(ladder.sigma[found] - ce["sigma"]) < self.sigma_diff
+                ):
                     buy_pending.append(
                         {
                             "strike": ce.strike,
@@ -301,34 +282,36 @@ class Strategy:
                             "reason": "EXIT CE - SHIFTING CALL AWAY",
                         }
                     )
-                    ce = instruments[
-                        (instruments["strike"] == strike) & (instruments["instrument_type"] == "CE")
-                    ].iloc[0]
                     sell_pending.append(
                         {
-                            "strike": ce.strike,
+                            "strike": ladder.strike[found],
                             "option_type": "CE",
-                            "expected_price": ce.last_price,
+                            "expected_price": ladder.last_price[found],
                             "expected_time": timezone.localtime(),
                             "idx": idx,
                             "reason": "ENTER CE - SHIFTING CALL AWAY",
                         }
                     )
+                    ce_tradingsymbol = ladder.tradingsymbol[found]
                 else:
                     print("CALL AWAY SHIFT")
                     if not ce["last_price"] > self.skip_price:
                         print("SKIP PRICE")
-                    elif strike == int(ce["strike"]):
+                    elif found is None or ladder.strike[found] == int(ce["strike"]):
                         print("STRIKE")
                     else:
-                        print("SIGMA", abs(sigma - ce["sigma"]), round(self.sigma_diff))
+                        print("SIGMA", abs(ladder.sigma[found] - ce["sigma"]), round(self.sigma_diff))
             else:
                 if now_time <= self.expiry_check_timestamp:
-                    strike, sigma = await self.find_strike(instruments, -ce["delta"], "PE", ">", "delta")
+                    ladder, found = await self.find_strike(instruments, -ce["delta"], "PE", ">", "delta")
                 else:
-                    strike, sigma = await self.find_strike(instruments, ce["last_price"], "PE", "<", "last_price")
+                    ladder, found = await self.find_strike(instruments, ce["last_price"], "PE", "<", "last_price")
 
-                if strike != int(pe["strike"]) and abs(sigma - ce["sigma"]) < self.sigma_diff:
+                if (
+                    found is not None
+                    and ladder.strike[found] != int(pe["strike"])
+                    and abs(ladder.sigma[found] - ce["sigma"]) < self.sigma_diff
+                ):
                     buy_pending.append(
                         {
                             "strike": pe.strike,
@@ -339,37 +322,39 @@ class Strategy:
                             "reason": "EXIT PE - SHIFTING PUT IN",
                         }
                     )
-                    pe = instruments[
-                        (instruments["strike"] == strike) & (instruments["instrument_type"] == "PE")
-                    ].iloc[0]
                     sell_pending.append(
                         {
-                            "strike": pe.strike,
+                            "strike": ladder.strike[found],
                             "option_type": "PE",
-                            "expected_price": pe.last_price,
+                            "expected_price": ladder.last_price[found],
                             "expected_time": timezone.localtime(),
                             "idx": idx,
                             "reason": "ENTER PE - SHIFTING PUT IN",
                         }
                     )
+                    pe_tradingsymbol = ladder.tradingsymbol[found]
                 else:
                     print("SHIFTED PUT IN")
                     if not ce["last_price"] > self.skip_price:
                         print("SKIP PRICE")
-                    elif strike == int(pe["strike"]):
+                    elif found is None or ladder.strike[found] == int(pe["strike"]):
                         print("STRIKE")
                     else:
-                        print("SIGMA", abs(sigma - ce["sigma"]), round(self.sigma_diff))
+                        print("SIGMA", abs(ladder.sigma[found] - ce["sigma"]), round(self.sigma_diff))
         elif ((ce["delta"] + pe["delta"]) < -(min(abs(pe["delta"]), ce["delta"]) * multiplier)) and pe[
             "last_price"
         ] > self.skip_price:
             if pe.strike - pe["bnf_ltp"] >= -self.point_difference:
                 if now_time <= self.expiry_check_timestamp:
-                    strike, sigma = await self.find_strike(instruments, -ce["delta"], "PE", "<", "delta")
+                    ladder, found = await self.find_strike(instruments, -ce["delta"], "PE", "<", "delta")
                 else:
-                    strike, sigma = await self.find_strike(instruments, ce["last_price"], "PE", ">", "last_price")
+                    ladder, found = await self.find_strike(instruments, ce["last_price"], "PE", ">", "last_price")
 
-                if strike != pe["strike"] and abs(sigma - pe["sigma"]) < self.sigma_diff:
+                if (
+                    found is not None
+                    and ladder.strike[found] != pe["strike"]
+                    and abs(ladder.sigma[found] - pe["sigma"]) < self.sigma_diff
+                ):
                     buy_pending.append(
                         {
                             "strike": pe.strike,
@@ -380,34 +365,36 @@ class Strategy:
                             "reason": "EXIT PE - SHIFTING PUT AWAY",
                         }
                     )
-                    pe = instruments[
-                        (instruments["strike"] == strike) & (instruments["instrument_type"] == "PE")
-                    ].iloc[0]
                     sell_pending.append(
                         {
-                            "strike": pe.strike,
+                            "strike": ladder.strike[found],
                             "option_type": "PE",
-                            "expected_price": pe.last_price,
+                            "expected_price": ladder.last_price[found],
                             "expected_time": timezone.localtime(),
                             "idx": idx,
                             "reason": "ENTER PE - SHIFTING PUT AWAY",
                         }
                     )
+                    pe_tradingsymbol = ladder.tradingsymbol[found]
                 else:
                     print("PUT AWAY SHIFT")
                     if not ce["last_price"] > self.skip_price:
                         print("SKIP PRICE")
-                    if strike == int(pe["strike"]):
+                    if found is None or ladder.strike[found] == int(pe["strike"]):
                         print("STRIKE")
                     else:
-                        print("SIGMA", abs(sigma - pe["sigma"]), round(self.sigma_diff))
+                        print("SIGMA", abs(ladder.sigma[found] - pe["sigma"]), round(self.sigma_diff))
             else:
                 if now_time <= self.expiry_check_timestamp:
-                    strike, sigma = await self.find_strike(instruments, -pe["delta"], "CE", "<", "delta")
+                    ladder, found = await self.find_strike(instruments, -pe["delta"], "CE", "<", "delta")
                 else:
-                    strike, sigma = await self.find_strike(instruments, pe["last_price"], "CE", "<", "last_price")
+                    ladder, found = await self.find_strike(instruments, pe["last_price"], "CE", "<", "last_price")
 
-                if strike != ce["strike"] and abs(sigma - ce["sigma"]) < self.sigma_diff:
+                if (
+                    found is not None
+                    and ladder.strike[found] != ce["strike"]
+                    and abs(ladder.sigma[found] - ce["sigma"]) < self.sigma_diff
+                ):
                     buy_pending.append(
                         {
                             "strike": ce.strike,
@@ -418,33 +405,31 @@ class Strategy:
                             "reason": "EXIT CE - SHIFTING CALL IN",
                         }
                     )
-                    ce = instruments[
-                        (instruments["strike"] == strike) & (instruments["instrument_type"] == "CE")
-                    ].iloc[0]
                     sell_pending.append(
                         {
-                            "strike": ce.strike,
+                            "strike": ladder.strike[found],
                             "option_type": "CE",
-                            "expected_price": ce.last_price,
+                            "expected_price": ladder.last_price[found],
                             "expected_time": timezone.localtime(),
                             "idx": idx,
                             "reason": "ENTER PE - SHIFTING PUT AWAY",
                         }
                     )
+                    ce_tradingsymbol = ladder.tradingsymbol[found]
                 else:
                     print("CALL IN SHIFT")
                     if not ce["last_price"] > self.skip_price:
                         print("SKIP PRICE")
-                    if strike == int(ce["strike"]):
+                    if found is None or ladder.strike[found] == int(ce["strike"]):
                         print("STRIKE")
                     else:
-                        print("SIGMA", abs(sigma - ce["sigma"]), round(self.sigma_diff))
+                        print("SIGMA", abs(ladder.sigma[found] - ce["sigma"]), round(self.sigma_diff))
 
         return (
             buy_pending,
             sell_pending,
-            ce["tradingsymbol"],
-            pe["tradingsymbol"],
+            ce_tradingsymbol,
+            pe_tradingsymbol,
         )
 
     async def initiate(self):
@@ -484,12 +469,7 @@ class Strategy:
             if not tradingsymbol:
                 raise Exception("Trading Symbol not found")
         elif entered and data:
-            strategy_list = cache.get("deployed_strategies", {})
-            strategy_list[self.strategy] = {
-                "user_params": self.user_params,
-                "no_of_strategy": self.no_of_strategy,
-            }
-            cache.set("deployed_strategies", strategy_list)
+            self.state_version = strategy_state.deploy(self.strategy, self.user_params, self.no_of_strategy)["version"]
             tradingsymbol = {}
             for idx in sorted(data.keys()):
                 if not data[idx].get("ce_strike") and not data[idx].get("pe_strike"):
@@ -545,236 +525,237 @@ class Strategy:
         else:
             entered = await self.place_entry_order(conditions)
 
-        ct = timezone.localtime()
-        st = self.sleep_time * self.no_of_strategy
-        if ct.second % st == 0:
-            diff = (ct.replace(microsecond=0) + dt.timedelta(seconds=st) - timezone.localtime()).total_seconds()
-        else:
-            diff = (
-                ct.replace(second=((ct.second // st) * st), microsecond=0)
-                + dt.timedelta(seconds=st)
-                - timezone.localtime()
-            ).total_seconds()
-        del st, ct
-        await asyncio.sleep(diff)
-
-        exit_trigger = False
-        while (
-            timezone.localtime().time() < self.exit_time
-            and self.strategy in (cache.get("deployed_strategies", {})).keys()
-        ):
-            for idx, (func, cond) in enumerate(zip(strategies, conditions)):
-                self.user_params = (cache.get("deployed_strategies", {}))[self.strategy]["user_params"]
-                cache.set(f"{self.strategy}_hold", True)
-                tradingsymbol = cache.get(f"{self.strategy}_tradingsymbol", {})
-                now_time = timezone.localtime()
-
-                instruments = self.get_greeks_instruments()
-                live_pcr_df = cache.get(
-                    "LIVE_BNF_PCR",
-                    pd.DataFrame(columns=["timestamp", "pe_total_oi", "ce_total_oi", "pcr"]),
-                )
-                live_pcr_df["ce_oi_change"] = live_pcr_df["ce_total_oi"].pct_change(periods=72)
-                live_pcr_df["pe_oi_change"] = live_pcr_df["pe_total_oi"].pct_change(periods=72)
+        # every parameter set is evaluated when new chain data makes it worth it, see EvaluationGate
+        events = chain_events.ChainEvents()
+        gate = chain_events.EvaluationGate(
+            settings.STRATEGY_SPOT_MOVE_POINTS, settings.STRATEGY_MIN_EVALUATION_INTERVAL, self.sleep_time
+        )
 
-                ce_tradingsymbol = tradingsymbol[idx]["ce_tradingsymbol"]
-                pe_tradingsymbol = tradingsymbol[idx]["pe_tradingsymbol"]
+        # each parameter set is evaluated in a task of its own, so one waiting on its fills never holds up
+        # the others. A set still busy with the previous evaluation sits the new one out.
+        evaluations = {}
+        stop = False
+        try:
+            while (
+                not stop and timezone.localtime().time() < self.exit_time and strategy_state.is_deployed(self.strategy)
+            ):
+                due = gate.due(await events.next(), timezone.localtime())
+                for idx in [idx for idx, task in evaluations.items() if task.done()]:
+                    stop = self.evaluation_done(idx, evaluations.pop(idx)) or stop
+                if stop or not due:
+                    continue
+                gate.evaluated(timezone.localtime())
+
+                await self.refresh_user_params()
+                for idx, (func, cond) in enumerate(zip(strategies, conditions)):
+                    if idx not in evaluations:
+                        evaluations[idx] = asyncio.create_task(self.evaluate(idx, func, cond))
+        finally:
+            # orders already sent are chased to the end before the exit squares everything off
+            results = await asyncio.gather(*evaluations.values(), return_exceptions=True)
+            for idx, result in zip(evaluations, results):
+                if isinstance(result, BaseException):
+                    print("EVALUATION FAILED", self.strategy, idx)
+                    traceback.print_exception(result)
+            await self.exit_algo()
+
+    def evaluation_done(self, idx, task) -> bool:
+        """Result of a finished evaluation of `idx`, a failure is printed and lets the strategy go on."""
+        if task.cancelled():
+            return False
+        if task.exception() is not None:
+            print("EVALUATION FAILED", self.strategy, idx)
+            traceback.print_exception(task.exception())
+            return False
+        return task.result()
+
+    async def evaluate(self, idx, func, cond) -> bool:
+        """Evaluate parameter set `idx` once and place its orders, True when the strategy has to stop."""
+        cache.set(f"{self.strategy}_hold", True)
+        tradingsymbol = cache.get(f"{self.strategy}_tradingsymbol", {})
+        now_time = timezone.localtime()
 
-                make_ce_exit = make_pe_exit = ce_reentry = pe_reentry = False
-                buy_pending, sell_pending = [], []
-                tradingsymbol = cache.get(f"{self.strategy}_tradingsymbol", {})
-                tradingsymbol_temp = tradingsymbol.copy()
+        instruments = self.get_greeks_instruments()
+        # only the last row is used, it needs the 72 before it for the oi change
+        live_pcr_df = LIVE_BNF_PCR.latest(73)
+        live_pcr_df["ce_oi_change"] = live_pcr_df["ce_total_oi"].pct_change(periods=72)
+        live_pcr_df["pe_oi_change"] = live_pcr_df["pe_total_oi"].pct_change(periods=72)
 
-                if ce_tradingsymbol:
-                    ce = instruments[(instruments["tradingsymbol"] == ce_tradingsymbol)].iloc[0]
+        ce_tradingsymbol = tradingsymbol[idx]["ce_tradingsymbol"]
+        pe_tradingsymbol = tradingsymbol[idx]["pe_tradingsymbol"]
 
-                if pe_tradingsymbol:
-                    pe = instruments[(instruments["tradingsymbol"] == pe_tradingsymbol)].iloc[0]
+        make_ce_exit = make_pe_exit = ce_reentry = pe_reentry = False
+        buy_pending, sell_pending = [], []
+        tradingsymbol = cache.get(f"{self.strategy}_tradingsymbol", {})
+        tradingsymbol_temp = tradingsymbol.copy()
 
-                exited_one_side = tradingsymbol_temp[idx]["exited_one_side"]
-                ce_exit_one_side = tradingsymbol_temp[idx]["ce_exit_one_side"]
-                pe_exit_one_side = tradingsymbol_temp[idx]["pe_exit_one_side"]
+        if ce_tradingsymbol:
+            ce = instruments[(instruments["tradingsymbol"] == ce_tradingsymbol)].iloc[0]
 
-                if not live_pcr_df.empty:
-                    row = live_pcr_df.iloc[-1]
-                    make_ce_exit, make_pe_exit, ce_reentry, pe_reentry = func(
-                        idx, row, exited_one_side, ce_exit_one_side, pe_exit_one_side, cond
-                    )
-                    # print(round(row.ce_oi_change * 100, 2))
-                    # print(round(row.pe_oi_change * 100, 2))
-                    # print(round((row.pe_oi_change - row.ce_oi_change) * 100, 2))
-
-                if exited_one_side:
-                    if ce_reentry and ce_exit_one_side:
-                        (
-                            buy_pending_temp,
-                            sell_pending_temp,
-                            ce_tradingsymbol,
-                            pe_tradingsymbol,
-                            exited_one_side,
-                            ce_exit_one_side,
-                        ) = await self.get_ce_reentry(idx, instruments, pe, now_time)
-
-                        buy_pending.extend(buy_pending_temp)
-                        sell_pending.extend(sell_pending_temp)
-
-                        del buy_pending_temp, sell_pending_temp
-
-                    elif pe_reentry and pe_exit_one_side:
-                        (
-                            buy_pending_temp,
-                            sell_pending_temp,
-                            ce_tradingsymbol,
-                            pe_tradingsymbol,
-                            exited_one_side,
-                            pe_exit_one_side,
-                        ) = await self.get_pe_reentry(idx, instruments, ce, now_time)
-
-                        buy_pending.extend(buy_pending_temp)
-                        sell_pending.extend(sell_pending_temp)
-
-                        del buy_pending_temp, sell_pending_temp
-                else:
-                    if make_ce_exit:
-                        buy_pending_temp, ce_tradingsymbol, exited_one_side, ce_exit_one_side = await self.get_ce_exit(
-                            idx, ce
-                        )
-                        buy_pending.extend(buy_pending_temp)
-                        del buy_pending_temp
-                    elif make_pe_exit:
-                        buy_pending_temp, pe_tradingsymbol, exited_one_side, pe_exit_one_side = await self.get_pe_exit(
-                            idx, pe
-                        )
-                        buy_pending.extend(buy_pending_temp)
-                        del buy_pending_temp
-                    else:
-                        (
-                            buy_pending_temp,
-                            sell_pending_temp,
-                            ce_tradingsymbol,
-                            pe_tradingsymbol,
-                        ) = await self.check_shifting_orders(
-                            instruments=instruments,
-                            idx=idx,
-                            ce=ce,
-                            pe=pe,
-                            multiplier=self.multiplier,
-                            now_time=now_time,
-                        )
-                        buy_pending.extend(buy_pending_temp)
-                        sell_pending.extend(sell_pending_temp)
+        if pe_tradingsymbol:
+            pe = instruments[(instruments["tradingsymbol"] == pe_tradingsymbol)].iloc[0]
 
-                        del buy_pending_temp, sell_pending_temp
+        exited_one_side = tradingsymbol_temp[idx]["exited_one_side"]
+        ce_exit_one_side = tradingsymbol_temp[idx]["ce_exit_one_side"]
+        pe_exit_one_side = tradingsymbol_temp[idx]["pe_exit_one_side"]
 
-                user_order_data = await asyncio.gather(
-                    *[
-                        self.place_orders(
-                            user=user,
-                            buy_pending=buy_pending,
-                            sell_pending=sell_pending,
-                        )
-                        for user in self.user_params
-                    ]
-                )
+        if not live_pcr_df.empty:
+            row = live_pcr_df.iloc[-1]
+            make_ce_exit, make_pe_exit, ce_reentry, pe_reentry = func(
+                idx, row, exited_one_side, ce_exit_one_side, pe_exit_one_side, cond
+            )
+            # print(round(row.ce_oi_change * 100, 2))
+            # print(round(row.pe_oi_change * 100, 2))
+            # print(round((row.pe_oi_change - row.ce_oi_change) * 100, 2))
 
-                tradingsymbol[idx] = {
-                    "ce_tradingsymbol": ce_tradingsymbol,
-                    "pe_tradingsymbol": pe_tradingsymbol,
-                    "exited_one_side": exited_one_side,
-                    "ce_exit_one_side": ce_exit_one_side,
-                    "pe_exit_one_side": pe_exit_one_side,
-                }
-                cache.set(f"{self.strategy}_hold", False)
+        if exited_one_side:
+            if ce_reentry and ce_exit_one_side:
+                (
+                    buy_pending_temp,
+                    sell_pending_temp,
+                    ce_tradingsymbol,
+                    pe_tradingsymbol,
+                    exited_one_side,
+                    ce_exit_one_side,
+                ) = await self.get_ce_reentry(idx, instruments, pe, now_time)
 
-                call_sigma = put_sigma = call_delta = put_delta = 0
-                ce_print = pe_print = "NONE"
-                total_delta = 0
-                if ce_tradingsymbol:
-                    call_delta = ce.delta * 100
-                    call_sigma = ce.sigma * 100
-                    ce_print = ce_tradingsymbol
-                if pe_tradingsymbol:
-                    put_delta = pe.delta * 100
-                    put_sigma = pe.sigma * 100
-                    pe_print = pe_tradingsymbol
-
-                total_delta = call_delta + put_delta
-                total_sigma = call_sigma + put_sigma
-
-                print(timezone.localtime().replace(microsecond=0))
-                if cache.get(f"{self.strategy}_{idx}_one_side_exit_hold", 0):
-                    print("Hold Marked")
-                print("INDEX:", idx)
-                print(f"{Fore.GREEN}{ce_print} {Fore.RED}{pe_print}{Fore.WHITE}")
-                print(
-                    f"{Fore.GREEN}CALL DELTA: {round(call_delta, 2)} {Fore.RED}PUT DELTA: {round(put_delta, 2)} {Fore.WHITE}= Total: {round(total_delta, 2)}"  # noqa: E501
+                buy_pending.extend(buy_pending_temp)
+                sell_pending.extend(sell_pending_temp)
+
+                del buy_pending_temp, sell_pending_temp
+
+            elif pe_reentry and pe_exit_one_side:
+                (
+                    buy_pending_temp,
+                    sell_pending_temp,
+                    ce_tradingsymbol,
+                    pe_tradingsymbol,
+                    exited_one_side,
+                    pe_exit_one_side,
+                ) = await self.get_pe_reentry(idx, instruments, ce, now_time)
+
+                buy_pending.extend(buy_pending_temp)
+                sell_pending.extend(sell_pending_temp)
+
+                del buy_pending_temp, sell_pending_temp
+        else:
+            if make_ce_exit:
+                buy_pending_temp, ce_tradingsymbol, exited_one_side, ce_exit_one_side = await self.get_ce_exit(idx, ce)
+                buy_pending.extend(buy_pending_temp)
+                del buy_pending_temp
+            elif make_pe_exit:
+                buy_pending_temp, pe_tradingsymbol, exited_one_side, pe_exit_one_side = await self.get_pe_exit(idx, pe)
+                buy_pending.extend(buy_pending_temp)
+                del buy_pending_temp
+            else:
+                (
+                    buy_pending_temp,
+                    sell_pending_temp,
+                    ce_tradingsymbol,
+                    pe_tradingsymbol,
+                ) = await self.check_shifting_orders(
+                    instruments=instruments,
+                    idx=idx,
+                    ce=ce,
+                    pe=pe,
+                    multiplier=self.multiplier,
+                    now_time=now_time,
                 )
-                print(
-                    f"{Fore.GREEN}CALL IV: {round(call_sigma, 2)} {Fore.RED}PUT IV: {round(put_sigma, 2)} {Fore.WHITE}= Total: {round(total_sigma, 2)}"  # noqa: E501
+                buy_pending.extend(buy_pending_temp)
+                sell_pending.extend(sell_pending_temp)
+
+                del buy_pending_temp, sell_pending_temp
+
+        await asyncio.gather(
+            *[
+                self.place_orders(
+                    user=user,
+                    buy_pending=buy_pending,
+                    sell_pending=sell_pending,
                 )
+                for user in self.user_params
+            ]
+        )
 
-                if idx == self.no_of_strategy - 1:
-                    total_call_delta = 0
-                    total_put_delta = 0
-
-                    for _, v in tradingsymbol.items():
-                        if v["ce_tradingsymbol"]:
-                            total_call_delta += (
-                                instruments[instruments["tradingsymbol"] == v["ce_tradingsymbol"]].iloc[0].delta
-                            )  # noqa #501
-                        if v["pe_tradingsymbol"]:
-                            total_put_delta += (
-                                instruments[instruments["tradingsymbol"] == v["pe_tradingsymbol"]].iloc[0].delta
-                            )  # noqa #501
-
-                    total_call_delta = total_call_delta / self.no_of_strategy
-                    total_put_delta = total_put_delta / self.no_of_strategy
-                    print()
-                    print(
-                        Fore.GREEN + f"TOTAL CALL DELTA: {round(total_call_delta * 100, 2)}",
-                        Fore.RED + f"TOTAL PUT DELTA: {round(total_put_delta * 100 ,2)}" + Fore.WHITE,
-                        f"CE + PE TOTAL DELTA: {round((total_call_delta + total_put_delta) * 100, 2)}",
-                    )
-                    print()
-                    del total_call_delta, total_put_delta
-                del ce_tradingsymbol, pe_tradingsymbol
+        tradingsymbol[idx] = {
+            "ce_tradingsymbol": ce_tradingsymbol,
+            "pe_tradingsymbol": pe_tradingsymbol,
+            "exited_one_side": exited_one_side,
+            "ce_exit_one_side": ce_exit_one_side,
+            "pe_exit_one_side": pe_exit_one_side,
+        }
+        cache.set(f"{self.strategy}_hold", False)
+
+        call_sigma = put_sigma = call_delta = put_delta = 0
+        ce_print = pe_print = "NONE"
+        total_delta = 0
+        if ce_tradingsymbol:
+            call_delta = ce.delta * 100
+            call_sigma = ce.sigma * 100
+            ce_print = ce_tradingsymbol
+        if pe_tradingsymbol:
+            put_delta = pe.delta * 100
+            put_sigma = pe.sigma * 100
+            pe_print = pe_tradingsymbol
+
+        total_delta = call_delta + put_delta
+        total_sigma = call_sigma + put_sigma
 
-                if (
-                    timezone.localtime().time() > self.exit_time
-                    or self.strategy not in cache.get("deployed_strategies", {}).keys()
-                ):
-                    exit_trigger = True
-                    break
-                cache.set(f"{self.strategy}_tradingsymbol", tradingsymbol)
-                await self.save_order_in_db(user_order_data, self.user_params)
-
-                # sleep for next sleep_timeth second
-                ct = timezone.localtime()
-                if ct.second % self.sleep_time == 0:
-                    diff = (
-                        ct.replace(microsecond=0) + dt.timedelta(seconds=self.sleep_time) - timezone.localtime()
-                    ).total_seconds()
-                else:
-                    diff = (
-                        ct.replace(second=((ct.second // self.sleep_time) * self.sleep_time), microsecond=0)
-                        + dt.timedelta(seconds=self.sleep_time)
-                        - timezone.localtime()
-                    ).total_seconds()
-                await asyncio.sleep(diff)
+        print(timezone.localtime().replace(microsecond=0))
+        if cache.get(f"{self.strategy}_{idx}_one_side_exit_hold", 0):
+            print("Hold Marked")
+        print("INDEX:", idx)
+        print(f"{Fore.GREEN}{ce_print} {Fore.RED}{pe_print}{Fore.WHITE}")
+        print(
+            f"{Fore.GREEN}CALL DELTA: {round(call_delta, 2)} {Fore.RED}PUT DELTA: {round(put_delta, 2)} {Fore.WHITE}= Total: {round(total_delta, 2)}"  # noqa: E501
+        )
+        print(
+            f"{Fore.GREEN}CALL IV: {round(call_sigma, 2)} {Fore.RED}PUT IV: {round(put_sigma, 2)} {Fore.WHITE}= Total: {round(total_sigma, 2)}"  # noqa: E501
+        )
+
+        if idx == self.no_of_strategy - 1:
+            total_call_delta = 0
+            total_put_delta = 0
+
+            for _, v in tradingsymbol.items():
+                if v["ce_tradingsymbol"]:
+                    total_call_delta += (
+                        instruments[instruments["tradingsymbol"] == v["ce_tradingsymbol"]].iloc[0].delta
+                    )  # noqa #501
+                if v["pe_tradingsymbol"]:
+                    total_put_delta += (
+                        instruments[instruments["tradingsymbol"] == v["pe_tradingsymbol"]].iloc[0].delta
+                    )  # noqa #501
+
+            total_call_delta = total_call_delta / self.no_of_strategy
+            total_put_delta = total_put_delta / self.no_of_strategy
             print()
-            if exit_trigger:
-                break
+            print(
+                Fore.GREEN + f"TOTAL CALL DELTA: {round(total_call_delta * 100, 2)}",
+                Fore.RED + f"TOTAL PUT DELTA: {round(total_put_delta * 100 ,2)}" + Fore.WHITE,
+                f"CE + PE TOTAL DELTA: {round((total_call_delta + total_put_delta) * 100, 2)}",
+            )
+            print()
+            del total_call_delta, total_put_delta
+        del ce_tradingsymbol, pe_tradingsymbol
 
-        await self.exit_algo()
+        if timezone.localtime().time() > self.exit_time or not strategy_state.is_deployed(self.strategy):
+            return True
+        # other parameter sets may have moved their legs meanwhile, only this set's row is written back
+        latest = cache.get(f"{self.strategy}_tradingsymbol", {})
+        latest[idx] = tradingsymbol[idx]
+        cache.set(f"{self.strategy}_tradingsymbol", latest)
+        return False
 
     async def user_entry(self, user_param_user_obj):
+        user_param_user_obj["order_obj"].strategy_id = self.opt_strategy.pk
         instruments = self.get_greeks_instruments()
         user_exists = False
         for _, row in enumerate(self.user_params):
             if row["user"] == user_param_user_obj["user"]:
                 user_exists = True
                 break
-        if self.strategy in (cache.get("deployed_strategies", {})).keys() and not user_exists:
+        if strategy_state.is_deployed(self.strategy) and not user_exists:
             buy_pending, sell_pending = [], []
 
             tradingsymbol: dict = cache.get(f"{self.strategy}_tradingsymbol", {})
@@ -806,7 +787,7 @@ class Strategy:
                         }
                     )
 
-            user_order_data = await asyncio.gather(
+            await asyncio.gather(
                 *[
                     self.place_orders(
                         user=user_param_user_obj,
@@ -816,15 +797,9 @@ class Strategy:
                 ]
             )
 
-        self.save_order_in_db(user_order_data, self.user_params)
         self.user_params.append(user_param_user_obj)
 
-        strategy_list = cache.get("deployed_strategies", {})
-        strategy_list[self.strategy] = {
-            "user_params": self.user_params,
-            "no_of_strategy": self.no_of_strategy,
-        }
-        cache.set("deployed_strategies", strategy_list)
+        strategy_state.add_account(self.strategy, user_param_user_obj)
         cache.set(f"{self.strategy}_tradingsymbol", tradingsymbol)
 
         await send_notifications(
@@ -844,7 +819,7 @@ class Strategy:
                 user_index = user_idx
                 user_param_user_obj = row
                 break
-        if self.strategy in (cache.get("deployed_strategies", {})).keys() and user_exists:
+        if strategy_state.is_deployed(self.strategy) and user_exists:
             buy_pending, sell_pending = [], []
 
             tradingsymbol: dict = cache.get(f"{self.strategy}_tradingsymbol", {})
@@ -876,7 +851,7 @@ class Strategy:
                         }
                     )
 
-            user_order_data = await asyncio.gather(
+            await asyncio.gather(
                 *[
                     self.place_orders(
                         user=user_param_user_obj,
@@ -886,27 +861,17 @@ class Strategy:
                 ]
             )
 
-            self.save_order_in_db(user_order_data, self.user_params)
             self.user_params.pop(user_index)
 
-            if self.user_params:
-                strategy_list = cache.get("deployed_strategies", {})
-                strategy_list[self.strategy] = {
-                    "user_params": self.user_params,
-                    "no_of_strategy": self.no_of_strategy,
-                }
-                cache.set("deployed_strategies", strategy_list)
+            if strategy_state.remove_account(self.strategy, user.username):
                 cache.set(f"{self.strategy}_tradingsymbol", tradingsymbol)
             else:
                 cache.set(f"{self.strategy}_tradingsymbol", {})
-                strategy_list = cache.get("deployed_strategies", {})
-                del strategy_list[self.strategy]
-                cache.set("deployed_strategies", strategy_list)
                 cache.set(f"{self.strategy}_hold", False)
 
     async def exit_algo(self):
         instruments = self.get_greeks_instruments()
-        if self.strategy in (cache.get("deployed_strategies", {})).keys():
+        if strategy_state.is_deployed(self.strategy):
             buy_pending, sell_pending = [], []
 
             tradingsymbol: dict = cache.get(f"{self.strategy}_tradingsymbol", {})
@@ -938,7 +903,7 @@ class Strategy:
                         }
                     )
 
-            user_order_data = await asyncio.gather(
+            await asyncio.gather(
                 *[
                     self.place_orders(
                         user=user,
@@ -949,12 +914,8 @@ class Strategy:
                 ]
             )
 
-            self.save_order_in_db(user_order_data, self.user_params)
-
             cache.set(f"{self.strategy}_tradingsymbol", {})
-            strategy_list = cache.get("deployed_strategies", {})
-            del strategy_list[self.strategy]
-            cache.set("deployed_strategies", strategy_list)
+            strategy_state.remove(self.strategy)
             cache.set(f"{self.strategy}_hold", False)
             await send_notifications(
                 self.opt_strategy.strategy_name.upper(),
@@ -968,13 +929,13 @@ class Strategy:
         buy_pending = []
         sell_pending = []
 
-        pe_reentry_strike, _ = await self.find_strike(instruments, -self.shift_min_delta_entry, "PE", "<", "delta")
+        pe_ladder, pe_found = await self.find_strike(instruments, -self.shift_min_delta_entry, "PE", "<", "delta")
         if (
             (pe["delta"] > -self.shift_min_delta and now_time <= self.expiry_check_timestamp)
             or pe["delta"] < -self.shift_max_delta
-        ) and pe_reentry_strike != pe["strike"]:
-            ce_reentry_strike, _ = await self.find_strike(instruments, self.shift_min_delta_entry, "CE", "<", "delta")
-            if ce_reentry_strike and pe_reentry_strike:
+        ) and (pe_found is None or pe_ladder.strike[pe_found] != pe["strike"]):
+            ce_ladder, ce_found = await self.find_strike(instruments, self.shift_min_delta_entry, "CE", "<", "delta")
+            if ce_found is not None and pe_found is not None:
                 buy_pending.append(
                     {
                         "strike": pe.strike,
@@ -985,26 +946,20 @@ class Strategy:
                         "reason": "EXIT PE - RESTRUCTURING",
                     }
                 )
-                ce = instruments[
-                    (instruments["strike"] == ce_reentry_strike) & (instruments["instrument_type"] == "CE")
-                ].iloc[0]
-                pe = instruments[
-                    (instruments["strike"] == pe_reentry_strike) & (instruments["instrument_type"] == "PE")
-                ].iloc[0]
                 sell_pending.extend(
                     [
                         {
-                            "strike": pe.strike,
+                            "strike": pe_ladder.strike[pe_found],
                             "option_type": "PE",
-                            "expected_price": pe.last_price,
+                            "expected_price": pe_ladder.last_price[pe_found],
                             "expected_time": timezone.localtime(),
                             "idx": idx,
                             "reason": "ENTERING PE - RESTRUCTURING",
                         },
                         {
-                            "strike": ce.strike,
+                            "strike": ce_ladder.strike[ce_found],
                             "option_type": "CE",
-                            "expected_price": ce.last_price,
+                            "expected_price": ce_ladder.last_price[ce_found],
                             "expected_time": timezone.localtime(),
                             "idx": idx,
                             "reason": "ENTERING CE - RESTRUCTURING",
@@ -1012,25 +967,29 @@ class Strategy:
                     ]
                 )
 
-                return buy_pending, sell_pending, ce["tradingsymbol"], pe["tradingsymbol"], False, False
+                return (
+                    buy_pending,
+                    sell_pending,
+                    ce_ladder.tradingsymbol[ce_found],
+                    pe_ladder.tradingsymbol[pe_found],
+                    False,
+                    False,
+                )
         else:
-            ce_reentry_strike, _ = await self.find_strike(instruments, -pe["delta"], "CE", "<", "delta")
-            if ce_reentry_strike:
-                ce = instruments[
-                    (instruments["strike"] == ce_reentry_strike) & (instruments["instrument_type"] == "CE")
-                ].iloc[0]
+            ce_ladder, ce_found = await self.find_strike(instruments, -pe["delta"], "CE", "<", "delta")
+            if ce_found is not None:
                 sell_pending.append(
                     {
-                        "strike": ce.strike,
+                        "strike": ce_ladder.strike[ce_found],
                         "option_type": "CE",
-                        "expected_price": ce.last_price,
+                        "expected_price": ce_ladder.last_price[ce_found],
                         "expected_time": timezone.localtime(),
                         "idx": idx,
                         "reason": "ENTERING CE",
                     }
                 )
 
-                return buy_pending, sell_pending, ce["tradingsymbol"], pe["tradingsymbol"], False, False
+                return buy_pending, sell_pending, ce_ladder.tradingsymbol[ce_found], pe["tradingsymbol"], False, False
 
         return buy_pending, sell_pending, None, pe["tradingsymbol"], True, True
 
@@ -1040,13 +999,13 @@ class Strategy:
         buy_pending = []
         sell_pending = []
 
-        ce_reentry_strike, _ = await self.find_strike(instruments, self.shift_min_delta_entry, "CE", ">", "delta")
+        ce_ladder, ce_found = await self.find_strike(instruments, self.shift_min_delta_entry, "CE", ">", "delta")
         if (
             (ce["delta"] < self.shift_min_delta and now_time <= self.expiry_check_timestamp)
             or ce["delta"] > self.shift_max_delta
-        ) and ce_reentry_strike != ce["strike"]:
-            pe_reentry_strike, _ = await self.find_strike(instruments, -self.shift_min_delta_entry, "PE", ">", "delta")
-            if ce_reentry_strike and pe_reentry_strike:
+        ) and (ce_found is None or ce_ladder.strike[ce_found] != ce["strike"]):
+            pe_ladder, pe_found = await self.find_strike(instruments, -self.shift_min_delta_entry, "PE", ">", "delta")
+            if ce_found is not None and pe_found is not None:
                 buy_pending.append(
                     {
                         "strike": ce.strike,
@@ -1057,26 +1016,20 @@ class Strategy:
                         "reason": "EXIT CE - RESTRUCTURING",
                     }
                 )
-                ce = instruments[
-                    (instruments["strike"] == ce_reentry_strike) & (instruments["instrument_type"] == "CE")
-                ].iloc[0]
-                pe = instruments[
-                    (instruments["strike"] == pe_reentry_strike) & (instruments["instrument_type"] == "PE")
-                ].iloc[0]
                 sell_pending.extend(
                     [
                         {
-                            "strike": pe.strike,
+                            "strike": pe_ladder.strike[pe_found],
                             "option_type": "PE",
-                            "expected_price": pe.last_price,
+                            "expected_price": pe_ladder.last_price[pe_found],
                             "expected_time": timezone.localtime(),
                             "idx": idx,
                             "reason": "ENTERING PE - RESTRUCTURING",
                         },
                         {
-                            "strike": ce.strike,
+                            "strike": ce_ladder.strike[ce_found],
                             "option_type": "CE",
-                            "expected_price": ce.last_price,
+                            "expected_price": ce_ladder.last_price[ce_found],
                             "expected_time": timezone.localtime(),
                             "idx": idx,
                             "reason": "ENTERING CE - RESTRUCTURING",
@@ -1084,26 +1037,30 @@ class Strategy:
                     ]
                 )
 
-                return buy_pending, sell_pending, ce["tradingsymbol"], pe["tradingsymbol"], False, False
+                return (
+                    buy_pending,
+                    sell_pending,
+                    ce_ladder.tradingsymbol[ce_found],
+                    pe_ladder.tradingsymbol[pe_found],
+                    False,
+                    False,
+                )
 
         else:
-            pe_reentry_strike, _ = await self.find_strike(instruments, -ce["delta"], "PE", ">", "delta")
-            if pe_reentry_strike:
-                pe = instruments[
-                    (instruments["strike"] == pe_reentry_strike) & (instruments["instrument_type"] == "PE")
-                ].iloc[0]
+            pe_ladder, pe_found = await self.find_strike(instruments, -ce["delta"], "PE", ">", "delta")
+            if pe_found is not None:
                 sell_pending.append(
                     {
-                        "strike": pe.strike,
+                        "strike": pe_ladder.strike[pe_found],
                         "option_type": "PE",
-                        "expected_price": pe.last_price,
+                        "expected_price": pe_ladder.last_price[pe_found],
                         "expected_time": timezone.localtime(),
                         "idx": idx,
                         "reason": "ENTERING PE",
                     }
                 )
 
-                return buy_pending, sell_pending, ce["tradingsymbol"], pe["tradingsymbol"], False, False
+                return buy_pending, sell_pending, ce["tradingsymbol"], pe_ladder.tradingsymbol[pe_found], False, False
 
         return buy_pending, sell_pending, ce["tradingsymbol"], None, True, True
 
@@ -1218,7 +1175,7 @@ class Strategy:
             tradingsymbol_temp[idx]["exited_one_side"] = exited_one_side
             tradingsymbol_temp[idx]["pe_exit_one_side"] = pe_exit_one_side
 
-        user_order_data = await asyncio.gather(
+        await asyncio.gather(
             *[
                 self.place_orders(
                     user=user,
@@ -1231,7 +1188,6 @@ class Strategy:
 
         tradingsymbol = tradingsymbol_temp.copy()
         cache.set(f"{self.strategy}_tradingsymbol", tradingsymbol)
-        await self.save_order_in_db(user_order_data, self.user_params)
 
     async def manual_reentry(self, idx):
         await self.initiate()
@@ -1254,7 +1210,7 @@ class Strategy:
                     ce_exit_one_side,
                 ) = await self.get_ce_reentry(idx, instruments, pe, now_time)
 
-                user_order_data = await asyncio.gather(
+                await asyncio.gather(
                     *[
                         self.place_orders(
                             user=user,
@@ -1271,8 +1227,6 @@ class Strategy:
                 cache.set(f"{self.strategy}_tradingsymbol", tradingsymbol)
                 cache.set(f"{self.strategy}_{idx}_one_side_exit_hold", 1)
 
-                await self.save_order_in_db(user_order_data, self.user_params)
-
             elif row["pe_exit_one_side"]:
                 ce = instruments[(instruments["tradingsymbol"] == row["ce_tradingsymbol"])].iloc[0]
 
@@ -1285,7 +1239,7 @@ class Strategy:
                     pe_exit_one_side,
                 ) = await self.get_pe_reentry(idx, instruments, ce, now_time)
 
-                user_order_data = await asyncio.gather(
+                await asyncio.gather(
                     *[
                         self.place_orders(
                             user=user,
@@ -1303,8 +1257,6 @@ class Strategy:
                 cache.set(f"{self.strategy}_tradingsymbol", tradingsymbol)
                 cache.set(f"{self.strategy}_{idx}_one_side_exit_hold", 1)
 
-                await self.save_order_in_db(user_order_data, self.user_params)
-
     async def manual_shifting(self, idx):
         await self.initiate()
 
@@ -1321,7 +1273,7 @@ class Strategy:
                 instruments, idx, ce, pe, 0.1, now_time
             )
 
-            user_order_data = await asyncio.gather(
+            await asyncio.gather(
                 *[
                     self.place_orders(
                         user=user,
@@ -1332,7 +1284,6 @@ class Strategy:
                 ]
             )
 
-            await self.save_order_in_db(user_order_data, self.user_params)
             tradingsymbol[idx]["ce_tradingsymbol"] = ce_tradingsymbol
             tradingsymbol[idx]["pe_tradingsymbol"] = pe_tradingsymbol
             cache.set(f"{self.strategy}_tradingsymbol", tradingsymbol)
@@ -1407,7 +1358,7 @@ class Strategy:
 
             tradingsymbol_temp[idx]["pe_tradingsymbol"] = pe["tradingsymbol"]
 
-        user_order_data = await asyncio.gather(
+        await asyncio.gather(
             *[
                 self.place_orders(
                     user=user,
@@ -1417,7 +1368,6 @@ class Strategy:
                 for user in self.user_params
             ]
         )
-        await self.save_order_in_db(user_order_data, self.user_params)
         tradingsymbol = tradingsymbol_temp.copy()
         cache.set(f"{self.strategy}_tradingsymbol", tradingsymbol)
 
@@ -4,6 +4,7 @@ import numpy as np
 from django.core.cache import cache
 from django.utils import timezone
 
+from utils import strategy_state
 from utils.multi_broker import Broker as MultiBroker
 
 
@@ -28,6 +29,8 @@ class Strategy:
         self.sleep_time = sleep_time
         self.instrument_name = instrument_name
         self.strategy = str(opt_strategy.pk)
+        for user in self.user_params:
+            user["order_obj"].strategy_id = opt_strategy.pk
 
     def get_greeks_instruments(self):
         return cache.get("OPTION_GREEKS_INSTRUMENTS")
@@ -196,11 +199,7 @@ class Strategy:
 
     async def run(self):
         await self.initiate()
-        strategy_list = cache.get("deployed_strategies", {})
-        strategy_list[self.strategy] = {
-            "user_params": self.user_params,
-        }
-        cache.set("deployed_strategies", strategy_list)
+        strategy_state.deploy(self.strategy, self.user_params)
 
     async def modify_order(self, user, order_id, strike, option_type, price):
         order: MultiBroker = user["order_obj"]
@@ -0,0 +1,134 @@
+import concurrent.futures
+import importlib
+import inspect
+import itertools
+import multiprocessing
+
+import pandas as pd
+from asgiref.sync import async_to_sync
+from django import db
+from django.core.cache import cache
+from django.utils import timezone
+
+from apps.trade.backtest import backtest
+from apps.trade.models import DeployedOptionStrategy
+from utils import archive
+
+
+def sweep_key(pk):
+    return f"BACKTEST_SWEEP_{pk}"
+
+
+async def load_strategy(pk):
+    """Deployed strategy and its active parameter sets, fetched once and handed to every job."""
+    opt_strategy = await DeployedOptionStrategy.objects.select_related("strategy").aget(pk=pk)
+    parameters = [p.parameters async for p in opt_strategy.parameters.filter(is_active=True).order_by("name")]
+    return opt_strategy, parameters
+
+
+def parameter_grid(opt_strategy, grid: dict) -> list:
+    """Every combination of the values in `grid`, checked against the strategy's ``__init__``."""
+    Strategy = importlib.import_module(f"apps.trade.strategy.{opt_strategy.strategy.file_name}").Strategy
+    accepted = inspect.signature(Strategy.__init__).parameters
+    unknown = [name for name in grid if name not in accepted]
+    if unknown:
+        raise ValueError(f"{opt_strategy.strategy.file_name} does not take {', '.join(unknown)}")
+
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def trading_days(start, end):
+    """
+    Days from `start` to `end` with archived snapshots. Their memory mapped copies are written here,
+    before any worker starts, so workers only ever read them.
+    """
+    days = []
+    for day in pd.date_range(start, end).date:
+        if not archive.mapped("snapshots", day).empty:
+            archive.mapped("pcr", day)
+            days.append(day)
+    return days
+
+
+def plan(opt_strategy, start, end, grid):
+    """(day, params) of every job of a sweep."""
+    return list(itertools.product(trading_days(start, end), parameter_grid(opt_strategy, grid)))
+
+
+def label(params):
+    return ", ".join(f"{name}={value}" for name, value in params.items())
+
+
+def summarize(result, params):
+    """A backtested day as one row, buy and sell pnl split by the side that opened each position."""
+    trades, book = result["trades"], result["positions"]
+    opened = trades.sort_values("filled_at").groupby("tradingsymbol")["transaction_type"].first()
+    side = book["tradingsymbol"].map(opened)
+    return {
+        "name": label(params),
+        "params": params,
+        "day": result["day"].isoformat(),
+        "pnl": result["pnl"],
+        "buy_pnl": round(float(book["pnl"][side == "BUY"].sum()), 2),
+        "sell_pnl": round(float(book["pnl"][side == "SELL"].sum()), 2),
+        "trades": len(trades),
+    }
+
+
+def run_job(opt_strategy, parameters, day, params, lots=1):
+    result = async_to_sync(backtest)(opt_strategy, day, lots, parameters, **params)
+    return summarize(result, params)
+
+
+def compare(rows, pk=None):
+    """Comparison table of a sweep for the multi backtesting page, one row per parameter set, best first."""
+    if not rows:
+        return []
+
+    table = []
+    for name, days in pd.DataFrame(rows).sort_values("day").groupby("name", sort=False):
+        equity = days["pnl"].cumsum()
+        table.append(
+            {
+                "pk": pk,
+                "name": name,
+                "params": days["params"].iloc[0],
+                "net_pnl": round(float(days["pnl"].sum()), 2),
+                "buy_pnl": round(float(days["buy_pnl"].sum()), 2),
+                "sell_pnl": round(float(days["sell_pnl"].sum()), 2),
+                "profit_days": int((days["pnl"] > 0).sum()),
+                "loss_days": int((days["pnl"] < 0).sum()),
+                "total_trades": int(days["trades"].sum()),
+                "start_date": days["day"].iloc[0],
+                "end_date": days["day"].iloc[-1],
+                "max_drawdown": round(float((equity - equity.cummax().clip(lower=0)).min()), 2),
+            }
+        )
+    return sorted(table, key=lambda row: row["net_pnl"], reverse=True)
+
+
+def store(pk, table):
+    cache.set(sweep_key(pk), {"updated_at": timezone.localtime(), "rows": table}, None)
+    return table
+
+
+def sweep(pk, start, end, grid, lots=1, processes=None):
+    """
+    Backtest every combination of `grid` over the archived days from `start` to `end` on a process
+    pool and store the comparison table. Each worker replays from the memory mapped day files, so a
+    day is decompressed once however many parameter sets run over it.
+
+    Inside a Celery worker use the "Parameter Sweep" task instead, prefork workers cannot fork.
+    """
+    opt_strategy, parameters = async_to_sync(load_strategy)(pk)
+    jobs = plan(opt_strategy, start, end, grid)
+
+    # forked workers must not share the parent's database connections
+    db.connections.close_all()
+    context = multiprocessing.get_context("fork")
+    with concurrent.futures.ProcessPoolExecutor(processes, mp_context=context) as pool:
+        futures = [pool.submit(run_job, opt_strategy, parameters, day, params, lots) for day, params in jobs]
+        rows = [future.result() for future in futures]
+
+    return store(pk, compare(rows, pk))
@@ -1,66 +1,106 @@
 import asyncio
 
-import numpy as np
 import pandas as pd
 from asgiref.sync import async_to_sync
+from celery import chord
 from django.core.cache import cache
 
 from apps.integration.models import BrokerApi
+from apps.trade.backtest import run_backtest
 from apps.trade.models import Order
+from apps.trade.publishers import run_publishers
+from apps.trade.runner import StrategyRunner
+from apps.trade.sweep import compare, load_strategy, plan, run_job, store
 from trading.celery import app
+from utils.latency import start_metrics_server
 from utils.multi_broker import Broker as MultiBroker
+from utils.strike_ladder import ChainLadders
+from utils.timeseries import BNF_SNAPSHOT_5SEC
 import datetime as dt
 from django.utils import timezone
 
 
-async def get_live_positions(username, broker):
+async def reconcile_positions(username, broker):
     order = await MultiBroker(username, broker)
     await order.initiate_session()
-    df = await order.calculate_live_pnl()
-    if not df.empty:
-        df["username"] = username
-        df['broker_name'] = broker
-        df['margin'] = await order.margin()
-        return df[["username", "broker_name", "margin", "tradingsymbol", "sell_value", "buy_value", "net_qty"]].copy()
-    else:
-        df = pd.DataFrame([{'margin': await order.margin()}], columns=["username", "broker_name", "margin", "tradingsymbol", "sell_value", "buy_value", "net_qty"])
-        df.fillna(0, inplace=True)
-
-    return pd.DataFrame(columns=["username", "broker_name", "margin", "tradingsymbol", "sell_value", "buy_value", "net_qty"])
+    book = await order.reconcile_positions()
+    return book.frame()
 
 
-async def get_all_user_kotak_open_positions():
+async def reconcile_all_position_books():
     users = [
-        get_live_positions(broker_api.user.username, broker_api.broker)
-        async for broker_api in BrokerApi.objects.filter(is_active=True, broker__in=["kotak", "kotak_neo", "dummy"])
+        reconcile_positions(broker_api.user.username, broker_api.broker)
+        async for broker_api in BrokerApi.objects.filter(
+            is_active=True, broker__in=["kotak", "kotak_neo", "dummy"]
+        ).select_related("user")
     ]
-    data = pd.concat(await asyncio.gather(*users), ignore_index=True)
-    cache.set("OPEN_POSITION", data)
-    return data
+    return pd.concat(await asyncio.gather(*users), ignore_index=True)
 
 
-async def calculate_live_pnl():
-    instruments = cache.get("OPTION_INSTRUMENTS")
+@app.task(name="Get Open Position", bind=True)
+def get_all_user_open_positions(self):
+    data = async_to_sync(reconcile_all_position_books)()
+    return data.to_dict("records")
 
-    df = cache.get("OPEN_POSITION")
-    df = pd.merge(df, instruments, on="tradingsymbol")
-    df["pnl"] = df["sell_value"] - df["buy_value"] + (df["net_qty"] * df["last_price"])
-    df["ce_buy_qty"] = np.where(df["tradingsymbol"].str.contains("CE") & (df["net_qty"] > 0), df["net_qty"], 0)
-    df["pe_buy_qty"] = np.where(df["tradingsymbol"].str.contains("PE") & (df["net_qty"] > 0), df["net_qty"], 0)
-    df["ce_sell_qty"] = np.where(df["tradingsymbol"].str.contains("CE") & (df["net_qty"] < 0), df["net_qty"] * -1, 0)
-    df["pe_sell_qty"] = np.where(df["tradingsymbol"].str.contains("PE") & (df["net_qty"] < 0), df["net_qty"] * -1, 0)
 
-    return df
+@app.task(name="Dashboard Publisher", bind=True)
+def dashboard_publisher(self):
+    async_to_sync(run_publishers)()
 
 
-@app.task(name="Get Open Position", bind=True)
-def get_all_user_open_positions(self):
-    data = async_to_sync(get_all_user_kotak_open_positions)()
-    return data.to_dict("records")
+@app.task(name="Strategy Runner", bind=True)
+def strategy_runner(self):
+    """Resident runner taking the manual strategy actions of the API, see apps.trade.runner."""
+    start_metrics_server()
+    async_to_sync(StrategyRunner().run)()
+
+
+@app.task(name="Backtest Strategy", bind=True)
+def backtest_strategy(self, pk, day, lots=1, parameters=None):
+    result = async_to_sync(run_backtest)(pk, dt.date.fromisoformat(day), lots, parameters)
+    result["trades"]["filled_at"] = result["trades"]["filled_at"].astype(str)
+    return {
+        "day": day,
+        "pnl": result["pnl"],
+        "trades": result["trades"].to_dict("records"),
+        "positions": result["positions"].to_dict("records"),
+    }
+
+
+@app.task(name="Parameter Sweep", bind=True)
+def parameter_sweep(self, pk, start, end, grid, lots=1):
+    """One "Backtest Sweep Job" per (day, parameter set) across the workers, collected into one table."""
+    opt_strategy, _ = async_to_sync(load_strategy)(pk)
+    jobs = plan(opt_strategy, dt.date.fromisoformat(start), dt.date.fromisoformat(end), grid)
+    if jobs:
+        chord([backtest_sweep_job.s(pk, day.isoformat(), params, lots) for day, params in jobs])(collect_sweep.s(pk))
+    return len(jobs)
+
+
+@app.task(name="Backtest Sweep Job", bind=True)
+def backtest_sweep_job(self, pk, day, params, lots=1):
+    opt_strategy, parameters = async_to_sync(load_strategy)(pk)
+    return run_job(opt_strategy, parameters, dt.date.fromisoformat(day), params, lots)
+
+
+@app.task(name="Collect Parameter Sweep", bind=True)
+def collect_sweep(self, rows, pk):
+    return store(pk, compare(rows, pk))
 
 
 @app.task(name="Save Order", bind=True)
-def save_order_details(self, user, broker, strategy, order_id, order_timestamp, tradingsymbol, transaction_type, expected_price):
+def save_order_details(
+    self,
+    user,
+    broker,
+    strategy,
+    order_id,
+    order_timestamp,
+    tradingsymbol,
+    transaction_type,
+    expected_price,
+    trade_history=None,
+):
     return Order.objects.create(
         user=user,
         broker=broker,
@@ -69,12 +109,13 @@ def save_order_details(self, user, broker, strategy, order_id, order_timestamp,
         tradingsymbol=tradingsymbol,
         transaction_type=transaction_type,
         expected_price=expected_price,
+        trade_history=trade_history or [],
     )
 
 
 def update_stop_loss():
-    df = cache.get("BNF_SNAPSHOT_5SEC")
-    df = df[df['timestamp'].dt.time == dt.time(9, 15, 59)].copy()
+    entry_time = timezone.localtime().replace(hour=9, minute=15, second=59, microsecond=0)
+    df = BNF_SNAPSHOT_5SEC.range(entry_time, entry_time)
 
     percent_stop_loss_map = {
         0: 0.45,
@@ -99,11 +140,15 @@ def update_stop_loss():
     current_day = (cache.get("EXPIRY") - timezone.localdate()).days
 
     if not df.empty:
-        ce_df = df[df['instrument_type'] == 'CE']
-        pe_df = df[df['instrument_type'] == 'PE']
-        
-        ce_premium = ce_df[ce_df['delta'] >= 0.45].sort_values('delta').iloc[0].last_price
-        pe_premium = pe_df[pe_df['delta'] <= -0.45].sort_values('delta', ascending=False).iloc[0].last_price
+        # delta falls with the strike, so the least delta past 0.45 is the highest call and the lowest put there
+        ladders = ChainLadders.from_frame(df)
+        ce, pe = ladders["CE"], ladders["PE"]
+        ce_idx, pe_idx = ce.last("delta", ">=", 0.45), pe.first("delta", "<=", -0.45)
+        if ce_idx is None or pe_idx is None:
+            return
+
+        ce_premium = ce.last_price[ce_idx]
+        pe_premium = pe.last_price[pe_idx]
 
         total_premium = ce_premium + pe_premium
 
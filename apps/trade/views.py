@@ -8,6 +8,7 @@ from django.views.generic.detail import DetailView
 from django.views.generic.list import ListView
 
 from apps.trade.models import DeployedOptionStrategy, OptionStrategy
+from apps.trade.sweep import sweep_key
 
 
 # Create your views here.
@@ -84,4 +85,10 @@ class MultiBacktestingView(ListView):
     template_name = "multi_backtesting.html"
 
     def get_queryset(self):
-        return OptionStrategy.objects.all()
\ No newline at end of file
+        return OptionStrategy.objects.all()
+
+    def get_context_data(self, *args, **kwargs):
+        context = super(MultiBacktestingView, self).get_context_data(*args, **kwargs)
+        keys = [sweep_key(pk) for pk in DeployedOptionStrategy.objects.values_list("pk", flat=True)]
+        context["sweep_rows"] = [row for sweep in cache.get_many(keys).values() for row in sweep["rows"]]
+        return context
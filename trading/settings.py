@@ -116,6 +116,73 @@ CACHES = {
     }
 }
 
+# Option Chain Ingestion
+# Underlyings streamed over the single kite websocket, and how many of the nearest expiries to keep.
+OPTION_CHAIN_UNDERLYINGS = env.list("OPTION_CHAIN_UNDERLYINGS", default=["BANKNIFTY", "NIFTY", "FINNIFTY"])
+OPTION_CHAIN_EXPIRIES = env.int("OPTION_CHAIN_EXPIRIES", default=1)
+# Ticks buffered between the websocket thread and the publisher, and the publish interval.
+TICK_PIPELINE_MAXLEN = env.int("TICK_PIPELINE_MAXLEN", default=10000)
+TICK_PIPELINE_BATCH_MS = env.int("TICK_PIPELINE_BATCH_MS", default=50)
+SPOT_INSTRUMENT_TOKENS = {
+    "BANKNIFTY": 260105,
+    "NIFTY": 256265,
+    "FINNIFTY": 257801,
+    "MIDCPNIFTY": 288009,
+}
+
+# Pooled HTTP sessions used by the broker adapters, timeouts in seconds.
+HTTP_POOL_LIMIT = env.int("HTTP_POOL_LIMIT", default=100)
+HTTP_POOL_LIMIT_PER_HOST = env.int("HTTP_POOL_LIMIT_PER_HOST", default=20)
+HTTP_DNS_CACHE_TTL = env.int("HTTP_DNS_CACHE_TTL", default=300)
+HTTP_KEEPALIVE_TIMEOUT = env.float("HTTP_KEEPALIVE_TIMEOUT", default=60)
+HTTP_TIMEOUT = env.float("HTTP_TIMEOUT", default=30)
+HTTP_CONNECT_TIMEOUT = env.float("HTTP_CONNECT_TIMEOUT", default=5)
+
+# Seconds between order book polls while orders are being chased.
+ORDER_TRACKER_INTERVAL = env.float("ORDER_TRACKER_INTERVAL", default=0.5)
+
+# Order API rate limits per broker as (requests per second, burst), brokers not listed are not limited.
+BROKER_RATE_LIMITS = {
+    "kotak_neo": (10, 10),
+    "kotak": (10, 10),
+    "zerodha": (10, 10),
+}
+ORDER_DISPATCH_MAX_IN_FLIGHT = env.int("ORDER_DISPATCH_MAX_IN_FLIGHT", default=50)
+ORDER_DISPATCH_RETRIES = env.int("ORDER_DISPATCH_RETRIES", default=5)
+ORDER_DISPATCH_BACKOFF = env.float("ORDER_DISPATCH_BACKOFF", default=0.2)
+ORDER_DISPATCH_MAX_BACKOFF = env.float("ORDER_DISPATCH_MAX_BACKOFF", default=2)
+
+# Prometheus endpoint for order path latency, each process takes the first free port of the range.
+LATENCY_METRICS_HOST = env("LATENCY_METRICS_HOST", default="127.0.0.1")
+LATENCY_METRICS_PORT = env.int("LATENCY_METRICS_PORT", default=9108)
+LATENCY_METRICS_PORTS = env.int("LATENCY_METRICS_PORTS", default=10)
+
+# Intraday time series, one Redis stream per series and day, dropped after this many days.
+TIMESERIES_RETENTION_DAYS = env.int("TIMESERIES_RETENTION_DAYS", default=3)
+
+# End of day Parquet archive of ticks, greeks snapshots and PCR, and how raw ticks are spooled during the day.
+ARCHIVE_DIR = env("ARCHIVE_DIR", default=str(BASE_DIR / "archive"))
+ARCHIVE_RECORD_TICKS = env.bool("ARCHIVE_RECORD_TICKS", default=True)
+ARCHIVE_TICK_FLUSH_ROWS = env.int("ARCHIVE_TICK_FLUSH_ROWS", default=100000)
+ARCHIVE_TICK_FLUSH_SECONDS = env.int("ARCHIVE_TICK_FLUSH_SECONDS", default=60)
+
+# Paper trading fills for the dummy broker: exchange latency range in seconds, slippage of market and marketable
+# orders in ticks, largest quantity filled per match (0 fills in full) and how often resting orders are matched.
+DUMMY_LATENCY_MIN = env.float("DUMMY_LATENCY_MIN", default=0.05)
+DUMMY_LATENCY_MAX = env.float("DUMMY_LATENCY_MAX", default=0.25)
+DUMMY_SLIPPAGE_TICKS = env.int("DUMMY_SLIPPAGE_TICKS", default=2)
+DUMMY_MAX_FILL_QUANTITY = env.int("DUMMY_MAX_FILL_QUANTITY", default=0)
+DUMMY_MATCH_INTERVAL = env.float("DUMMY_MATCH_INTERVAL", default=0.1)
+
+# Order journal, orders are saved in batches of at most ORDER_JOURNAL_BATCH_SIZE every ORDER_JOURNAL_INTERVAL seconds
+ORDER_JOURNAL_BATCH_SIZE = env.int("ORDER_JOURNAL_BATCH_SIZE", default=500)
+ORDER_JOURNAL_INTERVAL = env.float("ORDER_JOURNAL_INTERVAL", default=1.0)
+
+# Event driven strategies evaluate on a new PCR row, on new greeks once the spot moved this many points and
+# at least every sleep_time seconds, never more often than every STRATEGY_MIN_EVALUATION_INTERVAL seconds.
+STRATEGY_SPOT_MOVE_POINTS = env.float("STRATEGY_SPOT_MOVE_POINTS", default=5.0)
+STRATEGY_MIN_EVALUATION_INTERVAL = env.float("STRATEGY_MIN_EVALUATION_INTERVAL", default=1.0)
+
 # Channels Redis Layer
 # https://channels.readthedocs.io/en/stable/topics/channel_layers.html
 CHANNEL_LAYERS = {
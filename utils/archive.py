@@ -0,0 +1,295 @@
+import datetime as dt
+import os
+import shutil
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from utils.option_chain import OptionChainStore, to_epoch
+from utils.timeseries import BNF_SNAPSHOT_5SEC, LIVE_BNF_PCR
+
+# Raw tick fields spooled during the day, timestamps as float seconds of naive exchange time.
+TICK_COLUMNS = (
+    "received_at",
+    "instrument_token",
+    "last_price",
+    "oi",
+    "volume_traded",
+    "exchange_timestamp",
+    "last_trade_time",
+)
+
+# Repeated strings written as dictionary pages.
+DICTIONARY_COLUMNS = (
+    "name",
+    "tradingsymbol",
+    "instrument_type",
+    "str_expiry",
+    "kotak_neo_instrument_token",
+)
+
+SPOT_EXPIRY = "spot"
+
+
+def expiry_label(expiry):
+    if pd.isna(expiry):
+        return SPOT_EXPIRY
+    return pd.Timestamp(expiry).strftime("%Y-%m-%d")
+
+
+def partition_path(dataset, underlying, day, expiry=None):
+    """``ARCHIVE_DIR/<dataset>/underlying=<name>/date=<day>[/expiry=<expiry>]``"""
+    path = Path(settings.ARCHIVE_DIR) / dataset / f"underlying={underlying}" / f"date={day:%Y-%m-%d}"
+    if expiry is not None:
+        path = path / f"expiry={expiry}"
+    return path
+
+
+def spool_path(day):
+    return Path(settings.ARCHIVE_DIR) / "spool" / "ticks" / f"{day:%Y-%m-%d}"
+
+
+def mapped_path(dataset, underlying, day):
+    return Path(settings.ARCHIVE_DIR) / "mapped" / dataset / f"underlying={underlying}" / f"{day:%Y-%m-%d}.arrow"
+
+
+class TickRecorder:
+    """
+    Spools every raw tick to Parquet chunks under ``ARCHIVE_DIR/spool/ticks/<date>``.
+
+    Called from the tick pipeline worker, so the reactor thread never waits on disk. Chunks are written
+    every `flush_rows` ticks or `flush_seconds`, whichever comes first, and merged by `archive_day`.
+    """
+
+    def __init__(self, flush_rows=100000, flush_seconds=60):
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.columns = {column: [] for column in TICK_COLUMNS}
+        self.flushed_at = time.monotonic()
+        # tokens whose chain metadata is saved next to the spool of `meta_day`
+        self.meta_day = None
+        self.meta_tokens = set()
+
+    def record(self, items):
+        # received_at is a perf_counter reading, shift it to naive exchange time like the tick timestamps
+        offset = time.time() - time.perf_counter() + timezone.localtime().utcoffset().total_seconds()
+        for received_at, tick in items:
+            self.columns["received_at"].append(received_at + offset)
+            self.columns["instrument_token"].append(tick["instrument_token"])
+            self.columns["last_price"].append(tick.get("last_price", np.nan))
+            self.columns["oi"].append(tick.get("oi", np.nan))
+            self.columns["volume_traded"].append(tick.get("volume_traded", np.nan))
+            self.columns["exchange_timestamp"].append(to_epoch(tick.get("exchange_timestamp")))
+            self.columns["last_trade_time"].append(to_epoch(tick.get("last_trade_time")))
+
+        if (
+            len(self.columns["received_at"]) >= self.flush_rows
+            or time.monotonic() - self.flushed_at >= self.flush_seconds
+        ):
+            self.flush()
+
+    def flush(self):
+        self.flushed_at = time.monotonic()
+        if not self.columns["received_at"]:
+            return
+
+        table = pa.table(
+            {
+                column: pa.array(values, type=pa.int64() if column == "instrument_token" else pa.float64())
+                for column, values in self.columns.items()
+            }
+        )
+        self.columns = {column: [] for column in TICK_COLUMNS}
+
+        day = timezone.localdate()
+        path = spool_path(day)
+        path.mkdir(parents=True, exist_ok=True)
+        pq.write_table(table, path / f"{int(time.time() * 1000)}.parquet")
+        self.save_meta(day)
+
+    def save_meta(self, day):
+        """Keep the chain metadata next to the day's spool, the chains may have moved on by the time it is archived."""
+        if day != self.meta_day:
+            self.meta_day, self.meta_tokens = day, set()
+
+        meta = chain_meta()
+        new = meta[~meta.index.isin(self.meta_tokens)]
+        if new.empty:
+            return
+
+        path = spool_path(day) / "meta"
+        path.mkdir(parents=True, exist_ok=True)
+        pq.write_table(
+            pa.Table.from_pandas(new.reset_index(), preserve_index=False), path / f"{int(time.time() * 1000)}.parquet"
+        )
+        self.meta_tokens.update(new.index)
+
+
+def write_partitions(dataset, underlying, day, df, by_expiry=True):
+    """
+    Write `df` as the `day` partition of `dataset`, split by expiry. Re-running replaces the whole day,
+    an empty `df` leaves the archived day as it is.
+    """
+    if df.empty:
+        return 0
+
+    # written next to the day and swapped in once complete, a failed write keeps the previous copy
+    final = partition_path(dataset, underlying, day)
+    staging = final.with_name(f".{final.name}.{os.getpid()}.tmp")
+    shutil.rmtree(staging, ignore_errors=True)
+
+    df = df.reset_index(drop=True)
+    for column in DICTIONARY_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].where(df[column].isna(), df[column].astype(str)).astype("category")
+
+    groups = df.groupby(df["expiry"].map(expiry_label), sort=False) if by_expiry else [(None, df)]
+    for expiry, part in groups:
+        path = staging / f"expiry={expiry}" if expiry is not None else staging
+        path.mkdir(parents=True, exist_ok=True)
+        pq.write_table(
+            pa.Table.from_pandas(part.reset_index(drop=True), preserve_index=False),
+            path / "part-0.parquet",
+            use_dictionary=[x for x in DICTIONARY_COLUMNS if x in part.columns],
+            compression="zstd",
+        )
+
+    # every expiry of the day is replaced, not only the ones in `df`, so nothing stale is read back with it
+    previous = final.with_name(f".{final.name}.{os.getpid()}.old")
+    if final.exists():
+        final.replace(previous)
+    staging.replace(final)
+    shutil.rmtree(previous, ignore_errors=True)
+    mapped_path(dataset, underlying, day).unlink(missing_ok=True)
+    return len(df)
+
+
+def chain_meta():
+    """Static metadata of every chain and spot token, indexed by kite instrument token."""
+    frames = []
+    for name in settings.OPTION_CHAIN_UNDERLYINGS:
+        meta = cache.get(OptionChainStore.meta_key(name))
+        if meta is not None:
+            frames.append(
+                meta[["kite_instrument_token", "name", "tradingsymbol", "expiry", "strike", "instrument_type"]]
+            )
+
+    spot = pd.DataFrame(
+        [{"kite_instrument_token": token, "name": name} for name, token in settings.SPOT_INSTRUMENT_TOKENS.items()]
+    )
+    meta = pd.concat(frames + [spot], ignore_index=True)
+    meta["kite_instrument_token"] = meta["kite_instrument_token"].astype(np.int64)
+    return meta.drop_duplicates("kite_instrument_token").set_index("kite_instrument_token")
+
+
+def spool_meta(spool):
+    """Chain metadata saved with the spool, the cached chains fill in for tokens it misses."""
+    frames = [pq.read_table(x).to_pandas() for x in sorted((spool / "meta").glob("*.parquet"))]
+    meta = pd.concat([*frames, chain_meta().reset_index()], ignore_index=True)
+    return meta.drop_duplicates("kite_instrument_token").set_index("kite_instrument_token")
+
+
+def archive_ticks(day):
+    spool = spool_path(day)
+    chunks = sorted(spool.glob("*.parquet"))
+    if not chunks:
+        return 0
+
+    ticks = pd.concat([pq.read_table(x).to_pandas() for x in chunks], ignore_index=True)
+    ticks = ticks.join(spool_meta(spool), on="instrument_token")
+    for column in ("received_at", "exchange_timestamp", "last_trade_time"):
+        ticks[column] = pd.to_datetime(ticks[column], unit="s")
+
+    known = ticks.dropna(subset=["name"])
+    written = 0
+    for name, part in known.groupby("name"):
+        written += write_partitions("ticks", name, day, part)
+
+    if len(known) < len(ticks):
+        # ticks nothing maps to stay spooled, the day is written again whole once their metadata is back
+        print(f"ARCHIVE TICKS {day}: {len(ticks) - len(known)} ticks without chain metadata, spool kept")
+        return written
+
+    shutil.rmtree(spool)
+    return written
+
+
+def archive_day(day=None):
+    """
+    Move the day's raw ticks, 5 second greeks snapshots and PCR series to partitioned Parquet under
+    ``ARCHIVE_DIR``, returns the rows written per dataset.
+    """
+    day = day or timezone.localdate()
+    return {
+        "ticks": archive_ticks(day),
+        "snapshots": write_partitions("snapshots", "BANKNIFTY", day, BNF_SNAPSHOT_5SEC.range(day=day)),
+        "pcr": write_partitions("pcr", "BANKNIFTY", day, LIVE_BNF_PCR.range(day=day), by_expiry=False),
+    }
+
+
+def partitions(dataset, start, end=None, underlying="BANKNIFTY", expiry=None):
+    """Parquet files of `dataset` from `start` to `end` inclusive, optionally of a single `expiry`."""
+    day, end = start, end or start
+    while day <= end:
+        path = partition_path(dataset, underlying, day)
+        pattern = f"expiry={expiry_label(expiry)}/part-*.parquet" if expiry is not None else "**/part-*.parquet"
+        yield from sorted(path.glob(pattern))
+        day += dt.timedelta(days=1)
+
+
+def load(dataset, start, end=None, underlying="BANKNIFTY", expiry=None, columns=None) -> pd.DataFrame:
+    """Memory-mapped read of a date range as a DataFrame, symbols come back as categoricals."""
+    frames = [
+        pq.read_table(path, columns=columns, memory_map=True).to_pandas()
+        for path in partitions(dataset, start, end, underlying, expiry)
+    ]
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(frames, ignore_index=True)
+
+
+def mapped(dataset, day, underlying="BANKNIFTY") -> pd.DataFrame:
+    """
+    `dataset` of `day` read from an uncompressed Arrow copy under ``ARCHIVE_DIR/mapped``, written on
+    first use. The copy is memory mapped, so processes replaying the same day share its pages through
+    the OS instead of each decompressing the Parquet files into a private copy.
+    """
+    path = mapped_path(dataset, underlying, day)
+    if not path.exists():
+        tables = [pq.read_table(x) for x in partitions(dataset, day, underlying=underlying)]
+        if not tables:
+            return pd.DataFrame()
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # the IPC file format allows one dictionary per column
+        table = pa.concat_tables(tables).unify_dictionaries()
+        partial = path.with_suffix(f".{os.getpid()}.tmp")
+        with pa.OSFile(str(partial), "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        partial.replace(path)
+
+    return pa.ipc.open_file(pa.memory_map(str(path))).read_all().to_pandas(split_blocks=True)
+
+
+def load_arrays(dataset, start, end=None, underlying="BANKNIFTY", expiry=None, columns=None) -> dict:
+    """
+    Memory-mapped read of a date range as NumPy arrays. Numeric columns without nulls of a single
+    partition are views of the mapped file, nothing is copied.
+    """
+    tables = [
+        pq.read_table(path, columns=columns, memory_map=True)
+        for path in partitions(dataset, start, end, underlying, expiry)
+    ]
+    if not tables:
+        return {}
+
+    names = columns or tables[0].column_names
+    arrays = {name: [table.column(name).to_numpy() for table in tables] for name in names}
+    return {name: values[0] if len(values) == 1 else np.concatenate(values) for name, values in arrays.items()}
@@ -2,22 +2,51 @@ import random
 import string
 
 from django.utils import timezone
-from django_pandas.io import read_frame
 
 from apps.trade.models import DummyOrder
 from utils.async_obj import AsyncObj
-import numpy as np
+from utils.matching_engine import get_matching_engine
+from utils.order_journal import get_order_journal
 
 
 class DummyApi(AsyncObj):
+    """Paper trading account, orders are matched against the live chain by the loop's `MatchingEngine`."""
+
     async def __ainit__(self, user):
         self.user = user
+        self.engine = get_matching_engine()
+        if self.user.username not in self.engine.books:
+            self.engine.seed(self.user.username, await self.todays_fills())
+
+    async def todays_fills(self):
+        return [
+            row
+            async for row in DummyOrder.objects.filter(
+                user=self.user,
+                order_timestamp__gte=timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0),
+                quantity__gt=0,
+            ).values("tradingsymbol", "transaction_type", "quantity", "price")
+        ]
 
     async def generate_token(self, n=7):
         return "".join(random.choices(string.ascii_uppercase + string.digits, k=n))
 
-    def apply_slippage(self, rate, slippage=4):
-        return round(rate * abs((rate ** (1 / ((max(rate, 0.05)) * slippage))) - 1), 2)
+    async def save_order(self, order):
+        """Filled quantity and average price of a completed or cancelled order."""
+        get_order_journal().record(
+            DummyOrder,
+            user_id=self.user.pk,
+            tradingsymbol=order["tradingsymbol"],
+            order_id=order["order_id"],
+            order_timestamp=order["order_timestamp"],
+            exchange=order["exchange"],
+            quantity=order["filled_qty"],
+            transaction_type=order["transaction_type"],
+            price=order["average_price"],
+            trigger_price=order["trigger_price"],
+            status=order["status"],
+            tag=order["tag"],
+        )
 
     async def place_order(
         self,
@@ -31,20 +60,19 @@ class DummyApi(AsyncObj):
     ):
         while True:
             order_id = await self.generate_token(12)
-            if not DummyOrder.objects.filter(order_id=order_id).exists():
+            if order_id not in self.engine.orders:
                 break
 
-        DummyOrder.objects.create(
-            user=self.user,
-            tradingsymbol=tradingsymbol,
-            order_id=order_id,
-            order_timestamp=timezone.localtime(),
-            exchange=exchange,
-            quantity=quantity,
-            transaction_type=transaction_type,
+        self.engine.submit(
+            self.user.username,
+            order_id,
+            tradingsymbol,
+            exchange,
+            transaction_type,
+            quantity,
             price=price,
-            trigger_price=trigger_price,
             tag=tag,
+            on_final=self.save_order,
         )
 
         return {
@@ -52,65 +80,62 @@ class DummyApi(AsyncObj):
             "message": f"Your Order has been Placed and Forwarded to the Exchange: {order_id}",
         }
 
-    async def single_order_report(self, order_id, is_fno, error_message=None):
-        order = DummyOrder.objects.get(order_id=order_id)
+    async def modify_order(self, order_id, quantity, price=0):
+        self.engine.modify(order_id, quantity, price)
+        return {"order_id": order_id, "message": f"Your Order has been Modified: {order_id}"}
+
+    async def cancel_order(self, order_id):
+        self.engine.cancel(order_id)
+        return {"order_id": order_id, "message": f"Your Order has been Cancelled: {order_id}"}
+
+    def order_report(self, order):
         return {
-            "order_id": order_id,
+            "order_id": order["order_id"],
+            "tradingsymbol": order["tradingsymbol"],
+            "exchange": order["exchange"],
+            "transaction_type": order["transaction_type"],
+            "quantity": order["quantity"],
+            "pending_qty": order["pending_qty"],
+            "filled_qty": order["filled_qty"],
+            "price": order["price"],
+            "average_price": order["average_price"],
+            "trigger_price": order["trigger_price"],
+            "status": order["status"],
+            "tag": order["tag"],
+        }
+
+    async def saved_order(self, order_id):
+        """Report of an order placed by another process, from its saved row."""
+        order = await DummyOrder.objects.aget(order_id=order_id)
+        return {
+            "order_id": order.order_id,
             "tradingsymbol": order.tradingsymbol,
             "exchange": order.exchange,
             "transaction_type": order.transaction_type,
             "quantity": order.quantity,
-            "price": order.price,
-            "trigger_price": order.trigger_price,
+            "pending_qty": 0,
+            "filled_qty": order.quantity,
+            "price": float(order.price),
+            "average_price": float(order.price),
+            "trigger_price": float(order.trigger_price),
             "status": order.status,
             "tag": order.tag,
         }
 
-    async def positions(self):
-        qs = DummyOrder.objects.filter(
-            user=self.user,
-            order_timestamp__gte=timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0),
-        )
-        df = read_frame(qs)
-        df["price"] = df["price"].astype(float)
-        df['slippage'] = df['price'].apply(self.apply_slippage)
-        df["price"] = np.where(df["transaction_type"] == "BUY", df['price'] + df['slippage'], df['price'] - df['slippage'])
-        df['total_value'] = df["price"] * df['quantity']
-        df = (
-            df.groupby(["tradingsymbol", "transaction_type"])
-            .agg(
-                {
-                    "quantity": "sum",
-                    "price": "mean",
-                    "total_value": "sum",
-                }
-            )
-            .reset_index()
-        )
-
-        buy_df = df[df["transaction_type"] == "BUY"]
-        sell_df = df[df["transaction_type"] == "SELL"]
-
-        buy_df = buy_df.rename(
-            columns={
-                "quantity": "buy_qty",
-                "price": "buy_avg",
-                "total_value": "buy_value",
-            }
-        )
-        buy_df.drop(columns=["transaction_type"], inplace=True)
-        sell_df = sell_df.rename(
-            columns={
-                "quantity": "sell_qty",
-                "price": "sell_avg",
-                "total_value": "sell_value",
-            }
-        )
-        sell_df.drop(columns=["transaction_type"], inplace=True)
+    async def single_order_report(self, order_id, is_fno, error_message=None):
+        if order_id in self.engine.orders:
+            return self.order_report(self.engine.orders[order_id])
+        return await self.saved_order(order_id)
 
-        df = buy_df.merge(sell_df, on="tradingsymbol", how="outer").fillna(0)
+    async def orders_report(self, order_ids):
+        return {
+            order_id: self.order_report(self.engine.orders[order_id])
+            for order_id in order_ids
+            if order_id in self.engine.orders and self.engine.orders[order_id]["account"] == self.user.username
+        }
 
-        return df
+    async def positions(self):
+        return self.engine.positions(self.user.username)
 
     async def margin(self):
-        return 0
\ No newline at end of file
+        return 0
@@ -7,12 +7,11 @@ from urllib.parse import quote
 from urllib.request import urlretrieve
 
 import pandas as pd
-from aiohttp import ClientSession
 from dateutil.relativedelta import relativedelta
 from django.utils.timezone import localdate
 
 from utils.async_obj import AsyncObj
-from utils.http_request import http_request
+from utils.http_request import get_session, http_request
 import traceback
 
 
@@ -147,13 +146,13 @@ class KotakNeoApi(AsyncObj):
                 }
             )
         )
-        async with ClientSession() as client:
-            async with client.post(url, headers=headers, data=payload) as resp:
-                resp = await resp.json()
-                self.sid = resp["data"]["sid"]
-                self.auth = resp["data"]["token"]
-                self.hs_server_id = resp["data"]["hsServerId"]
-                self.rid = resp["data"]["rid"]
+        client = await get_session(url)
+        async with client.post(url, headers=headers, data=payload) as resp:
+            resp = await resp.json()
+            self.sid = resp["data"]["sid"]
+            self.auth = resp["data"]["token"]
+            self.hs_server_id = resp["data"]["hsServerId"]
+            self.rid = resp["data"]["rid"]
 
     async def update_auth_token(self):
         url = f"{self.login_url}/login/refresh"
@@ -434,6 +433,23 @@ class KotakNeoApi(AsyncObj):
             traceback.print_exc()
             return {}
 
+    async def orders_report(self, order_ids=None):
+        """Every order in the order book keyed by order id, with the fields of single_order_report."""
+        reports = {}
+        for order in await self.order_book():
+            qty = int(order["qty"])
+            pending_qty = int(order["unFldSz"])
+            reports[str(order["nOrdNo"])] = {
+                "activity_timestamp": order.get("flDtTm"),
+                "exchange_order_id": order.get("exchOrdId"),
+                "filled_qty": qty - pending_qty,
+                "message": order.get("rejRsn"),
+                "qty": qty,
+                "status": self.order_status_map[order["ordSt"]],
+                "pending_qty": pending_qty,
+            }
+        return reports
+
     async def trade_book(self):
         url = f"{self.opi_url}/quick/user/trades?sId={self.hs_server_id}"
 
@@ -632,6 +632,13 @@ class KotakSecuritiesApi(AsyncObj):
             print(e)
             return {}
 
+    async def orders_report(self, order_ids=None):
+        """Every order of the day keyed by order id, with the fields of single_order_report."""
+        df = await self.order_report(is_fno=True)
+        if df is None or df.empty:
+            return {}
+        return {str(row["order_id"]): row for row in df.to_dict("records")}
+
     async def trade_report(self, order_id=None, is_fno=False):
         if not hasattr(self, "session_token") and not self.session_token:
             raise KotakSecuritiesApiError("No session token found. Please invoke 'login' function first")
@@ -1,6 +1,12 @@
-from math import erf, exp, log, pi, sqrt
+from math import erf, exp, isnan, log, pi, sqrt
 
-from numba import jit
+import numpy as np
+from numba import jit, njit, prange
+
+# Bracket and price tolerance of the scalar bisection above, kept identical for the chain solver.
+SIGMA_LOWER = 0.00001
+SIGMA_UPPER = 15.0
+PRICE_TOLERANCE = 0.005
 
 
 @jit(nopython=True)
@@ -108,3 +114,100 @@ def find_greeks(target_value, S, K, T, r, o):
         return find_call_greeks(target_value, S, K, T, r)
     else:
         return find_put_greeks(target_value, S, K, T, r)
+
+
+@njit
+def _bs_price(S, K, T, r, volatility, is_call):
+    if is_call:
+        return bs_call(S, K, T, r, volatility)
+    return bs_put(S, K, T, r, volatility)
+
+
+@njit
+def _implied_volatility(target_value, S, K, T, r, is_call, guess, max_iters):
+    """Newton steps inside a shrinking [lower, upper] bracket, bisecting whenever Newton leaves it."""
+    lower = SIGMA_LOWER
+    upper = SIGMA_UPPER
+
+    if target_value - _bs_price(S, K, T, r, lower, is_call) <= PRICE_TOLERANCE:
+        return lower
+    if _bs_price(S, K, T, r, upper, is_call) - target_value <= PRICE_TOLERANCE:
+        return upper
+
+    volatility = guess
+    if isnan(volatility) or volatility <= lower or volatility >= upper:
+        # Brenner-Subrahmanyam approximation for a cold start
+        volatility = min(max(sqrt(2 * pi / T) * target_value / S, 0.05), 5.0)
+
+    for _ in range(max_iters):
+        diff = _bs_price(S, K, T, r, volatility, is_call) - target_value
+        if abs(diff) < PRICE_TOLERANCE:
+            break
+
+        if diff > 0:
+            upper = volatility
+        else:
+            lower = volatility
+
+        d1 = (log(S / K) + (r + (volatility**2) / 2) * T) / (volatility * sqrt(T))
+        vega = S * norm_pdf(d1) * sqrt(T)
+        step = volatility - diff / vega if vega > 1e-8 else -1.0
+        volatility = step if lower < step < upper else (lower + upper) / 2
+
+    return volatility
+
+
+@njit(parallel=True)
+def _chain_greeks(price, S, K, T, r, is_call, sigma0, solve, max_iters, out):
+    for i in prange(price.shape[0]):
+        if isnan(price[i]) or isnan(S[i]) or T[i] <= 0 or price[i] <= 0:
+            for j in range(5):
+                out[j, i] = np.nan
+            continue
+
+        if solve[i] or isnan(sigma0[i]):
+            volatility = _implied_volatility(price[i], S[i], K[i], T[i], r, is_call[i], sigma0[i], max_iters)
+        else:
+            volatility = sigma0[i]
+        sqrt_t = sqrt(T[i])
+        d1 = (log(S[i] / K[i]) + (r + (volatility**2) / 2) * T[i]) / (volatility * sqrt_t)
+        d2 = d1 - volatility * sqrt_t
+        discount = r * K[i] * exp(-r * T[i])
+
+        out[0, i] = volatility
+        if is_call[i]:
+            out[1, i] = norm_cdf(d1)
+            out[2, i] = (-S[i] * norm_pdf(d1) * volatility / (2 * sqrt_t) - discount * norm_cdf(d2)) / 365
+        else:
+            out[1, i] = -norm_cdf(-d1)
+            out[2, i] = (-S[i] * norm_pdf(d1) * volatility / (2 * sqrt_t) + discount * norm_cdf(-d2)) / 365
+        out[3, i] = norm_pdf(d1) / (S[i] * volatility * sqrt_t)
+        out[4, i] = S[i] * norm_pdf(d1) * sqrt_t / 100
+
+
+def chain_greeks(target_value, S, K, T, r, is_call, sigma0=None, solve=None, max_iters=100):
+    """
+    Implied volatility and greeks for a whole chain in one call.
+
+    All array arguments are broadcast to the length of `target_value`; `S` may be a scalar spot.
+    `sigma0` is the previous sigma per row and is used as the Newton starting point when given.
+    Rows where `solve` is False keep their `sigma0` and only get delta/theta/gamma/vega refreshed for the
+    current spot and time left. Returns ``(sigma, delta, theta, gamma, vega)`` arrays, NaN where the price
+    or time left is missing.
+    """
+    target_value = np.ascontiguousarray(target_value, dtype=np.float64)
+    n = target_value.shape[0]
+    S, K, T = (np.ascontiguousarray(np.broadcast_to(np.asarray(x, dtype=np.float64), (n,))) for x in (S, K, T))
+    is_call = np.ascontiguousarray(np.broadcast_to(np.asarray(is_call, dtype=np.bool_), (n,)))
+    if sigma0 is None:
+        sigma0 = np.full(n, np.nan)
+    else:
+        sigma0 = np.ascontiguousarray(sigma0, dtype=np.float64)
+    if solve is None:
+        solve = np.ones(n, dtype=np.bool_)
+    else:
+        solve = np.ascontiguousarray(solve, dtype=np.bool_)
+
+    out = np.empty((5, n), dtype=np.float64)
+    _chain_greeks(target_value, S, K, T, float(r), is_call, sigma0, solve, max_iters, out)
+    return out[0], out[1], out[2], out[3], out[4]
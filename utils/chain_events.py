@@ -0,0 +1,74 @@
+import asyncio
+
+from utils.timeseries import get_redis
+
+EVENTS_KEY = "CHAIN_EVENTS"
+
+# kinds of events, new greeks of the whole chain and a new PCR row
+GREEKS = "greeks"
+PCR = "pcr"
+
+# events kept in the stream, readers only ever look at the newest ones
+MAX_EVENTS = 10000
+
+
+def publish(kind, **fields):
+    """Announce new chain data to the strategies, `fields` are sent as strings."""
+    get_redis().xadd(EVENTS_KEY, {"kind": kind, **fields}, maxlen=MAX_EVENTS, approximate=True)
+
+
+class ChainEvents:
+    """Events published after this reader was created, in order and without gaps."""
+
+    def __init__(self):
+        self.last_id = "$"
+
+    async def next(self, timeout=1.0) -> list:
+        """Every event since the previous call, waits up to `timeout` seconds for one."""
+        result = await asyncio.to_thread(
+            get_redis().xread, {EVENTS_KEY: self.last_id}, block=max(int(timeout * 1000), 1)
+        )
+        events = []
+        for _, entries in result or []:
+            for entry_id, fields in entries:
+                self.last_id = entry_id
+                events.append({key.decode(): value.decode() for key, value in fields.items()})
+        return events
+
+
+class EvaluationGate:
+    """
+    When a strategy should evaluate again. A new PCR row always counts, new greeks only once the spot
+    moved `spot_move` points since the last evaluation or `max_idle` seconds went by without one.
+    Evaluations are at least `min_interval` seconds apart whatever comes in.
+    """
+
+    def __init__(self, spot_move, min_interval, max_idle):
+        self.spot_move = spot_move
+        self.min_interval = min_interval
+        self.max_idle = max_idle
+        self.pending = True
+        self.spot = None
+        self.evaluated_spot = None
+        self.evaluated_at = None
+
+    def due(self, events, now) -> bool:
+        for event in events:
+            if event["kind"] == PCR:
+                self.pending = True
+            elif event["kind"] == GREEKS:
+                self.spot = float(event.get("spot") or 0) or self.spot
+                if self.evaluated_spot is None or self.spot is None:
+                    self.pending = True
+                elif abs(self.spot - self.evaluated_spot) >= self.spot_move:
+                    self.pending = True
+
+        if self.evaluated_at is None:
+            return True
+        elapsed = (now - self.evaluated_at).total_seconds()
+        return elapsed >= self.max_idle or (self.pending and elapsed >= self.min_interval)
+
+    def evaluated(self, now):
+        self.pending = False
+        self.evaluated_at = now
+        self.evaluated_spot = self.spot
@@ -1,6 +1,68 @@
+import asyncio
 import json
+import weakref
+from urllib.parse import urlsplit
 
-from aiohttp import ClientSession
+from aiohttp import ClientSession, ClientTimeout, DummyCookieJar, TCPConnector
+from django.conf import settings
+
+from utils.latency import span
+
+# event loop -> (sessions by origin, guard closing them when the loop shuts down)
+_pools = weakref.WeakKeyDictionary()
+
+
+async def _close_on_shutdown(loop, sessions):
+    # loop.shutdown_asyncgens(), called by asyncio.run and async_to_sync, closes this generator
+    try:
+        yield
+    finally:
+        _pools.pop(loop, None)
+        await close_sessions(sessions)
+
+
+async def close_sessions(sessions=None):
+    """Close the pooled sessions of the running loop."""
+    if sessions is None:
+        sessions = _pools.get(asyncio.get_running_loop(), ({}, None))[0]
+
+    while sessions:
+        _, session = sessions.popitem()
+        await session.close()
+
+
+async def get_session(url) -> ClientSession:
+    """
+    Keep-alive session for the origin of `url`, shared by every request made on the running loop.
+
+    Cookies are not stored, callers read them from the response like before.
+    """
+    loop = asyncio.get_running_loop()
+    if loop not in _pools:
+        sessions = {}
+        guard = _close_on_shutdown(loop, sessions)
+        await guard.__anext__()
+        _pools[loop] = (sessions, guard)
+
+    sessions = _pools[loop][0]
+    url = urlsplit(url)
+    origin = f"{url.scheme}://{url.netloc}"
+
+    session = sessions.get(origin)
+    if session is None or session.closed:
+        session = ClientSession(
+            connector=TCPConnector(
+                limit=settings.HTTP_POOL_LIMIT,
+                limit_per_host=settings.HTTP_POOL_LIMIT_PER_HOST,
+                ttl_dns_cache=settings.HTTP_DNS_CACHE_TTL,
+                keepalive_timeout=settings.HTTP_KEEPALIVE_TIMEOUT,
+            ),
+            timeout=ClientTimeout(total=settings.HTTP_TIMEOUT, connect=settings.HTTP_CONNECT_TIMEOUT),
+            cookie_jar=DummyCookieJar(),
+        )
+        sessions[origin] = session
+
+    return session
 
 
 async def http_request(
@@ -23,40 +85,45 @@ async def http_request(
     if isinstance(payload, dict) and payload_decode:
         payload = json.dumps(payload)
 
-    async with ClientSession() as client:
-        match method:
-            case "POST":
-                async with client.post(
-                    url, headers=headers, data=payload, params=query_params
-                ) as resp:
-                    if resp.headers["Content-Type"] in [
-                        "application/json",
-                        "application/json; charset=UTF-8",
-                    ]:
-                        return resp.status, await resp.json(), resp.cookies
-                    elif resp.headers["Content-Type"] == "text/html":
-                        return resp.status, await resp.text(), resp.cookies
-
-            case "GET":
-                async with client.get(
-                    url, headers=headers, params=query_params
-                ) as resp:
-                    if resp.headers["Content-Type"] in [
-                        "application/json",
-                        "application/json; charset=UTF-8",
-                    ]:
-                        return resp.status, await resp.json(), resp.cookies
-                    elif resp.headers["Content-Type"] == "text/csv":
-                        return resp.status, await resp.text(), resp.cookies
-                    
-            case "PUT":
-                async with client.put(
-                    url, headers=headers, data=json.dumps(payload)
-                ) as resp:
+    client = await get_session(url)
+    with span("http", method=method, path=urlsplit(url).path):
+        return await _request(client, method, url, headers, payload, query_params)
+
+
+async def _request(client, method, url, headers, payload, query_params):
+    match method:
+        case "POST":
+            async with client.post(
+                url, headers=headers, data=payload, params=query_params
+            ) as resp:
+                if resp.headers["Content-Type"] in [
+                    "application/json",
+                    "application/json; charset=UTF-8",
+                ]:
                     return resp.status, await resp.json(), resp.cookies
+                elif resp.headers["Content-Type"] == "text/html":
+                    return resp.status, await resp.text(), resp.cookies
 
-            case "DELETE":
-                async with client.delete(
-                    url, headers=headers, params=query_params
-                ) as resp:
+        case "GET":
+            async with client.get(
+                url, headers=headers, params=query_params
+            ) as resp:
+                if resp.headers["Content-Type"] in [
+                    "application/json",
+                    "application/json; charset=UTF-8",
+                ]:
                     return resp.status, await resp.json(), resp.cookies
+                elif resp.headers["Content-Type"] == "text/csv":
+                    return resp.status, await resp.text(), resp.cookies
+                
+        case "PUT":
+            async with client.put(
+                url, headers=headers, data=json.dumps(payload)
+            ) as resp:
+                return resp.status, await resp.json(), resp.cookies
+
+        case "DELETE":
+            async with client.delete(
+                url, headers=headers, params=query_params
+            ) as resp:
+                return resp.status, await resp.json(), resp.cookies
@@ -0,0 +1,146 @@
+import bisect
+import contextlib
+import contextvars
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.conf import settings
+from django.utils import timezone
+
+# Histogram bucket upper bounds in seconds.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+LABELS = ("step", "broker", "user", "leg")
+
+_current_trace = contextvars.ContextVar("latency_trace", default=None)
+
+
+class Histogram:
+    """Cumulative histograms per label set, rendered in the Prometheus text format."""
+
+    def __init__(self, name, help_text, buckets=BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(x, "")) for x in LABELS)
+        with self.lock:
+            counts, total = self.series.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.series[key] = (counts, total + value)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for key, (counts, total) in sorted(self.series.items()):
+                labels = ",".join(f'{name}="{value}"' for name, value in zip(LABELS, key))
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), counts):
+                    cumulative += count
+                    lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f"{self.name}_sum{{{labels}}} {total}")
+                lines.append(f"{self.name}_count{{{labels}}} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+ORDER_LATENCY = Histogram("order_latency_seconds", "Latency of each step of the order path.")
+
+
+class LatencyTrace:
+    """
+    Spans of one order leg, tagged with user, broker and leg.
+
+    Every span is observed into ``ORDER_LATENCY`` and kept in `spans` so it can be stored with the
+    order's trade history.
+    """
+
+    def __init__(self, user, broker, leg):
+        self.tags = {"user": user, "broker": broker, "leg": leg}
+        self.started = time.perf_counter()
+        self.spans = []
+
+    def record(self, step, started, **extra):
+        duration = time.perf_counter() - started
+        ORDER_LATENCY.observe(duration, step=step, **self.tags)
+        self.spans.append(
+            {
+                "event": "latency",
+                "step": step,
+                "timestamp": str(timezone.localtime()),
+                "duration_ms": round(duration * 1000, 3),
+                **extra,
+            }
+        )
+        return duration
+
+    @contextlib.contextmanager
+    def span(self, step, **extra):
+        started = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.record(step, started, **extra)
+
+    @contextlib.contextmanager
+    def activate(self):
+        """Make this trace current so nested code, like http_request, can add spans to it."""
+        token = _current_trace.set(self)
+        try:
+            yield self
+        finally:
+            _current_trace.reset(token)
+
+
+@contextlib.contextmanager
+def span(step, **extra):
+    """Span on the current trace, a no-op outside of one."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+
+    with trace.span(step, **extra):
+        yield trace
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = ORDER_LATENCY.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_started = False
+
+
+def start_metrics_server():
+    """
+    Serve the histograms on the first free port of ``LATENCY_METRICS_PORT`` onwards, one port per process.
+    Called by the long running trading entry points. Only the first call tries to bind, a process that
+    found no free port stays without a server.
+    """
+    global _server, _started
+    if _started or not settings.LATENCY_METRICS_PORT:
+        return _server
+    _started = True
+
+    for port in range(settings.LATENCY_METRICS_PORT, settings.LATENCY_METRICS_PORT + settings.LATENCY_METRICS_PORTS):
+        try:
+            _server = ThreadingHTTPServer((settings.LATENCY_METRICS_HOST, port), MetricsHandler)
+        except OSError:
+            continue
+        threading.Thread(target=_server.serve_forever, name="latency-metrics", daemon=True).start()
+        print(f"Latency metrics on {settings.LATENCY_METRICS_HOST}:{port}")
+        break
+
+    return _server
@@ -0,0 +1,201 @@
+import asyncio
+import contextvars
+import math
+import random
+import time
+import traceback
+import weakref
+
+import pandas as pd
+from django.conf import settings
+from django.utils import timezone
+
+from utils.option_chain import get_option_chain
+from utils.order_tracker import FINAL_STATUS
+
+TICK_SIZE = 0.05
+
+POSITION_COLUMNS = ["tradingsymbol", "buy_qty", "buy_avg", "buy_value", "sell_qty", "sell_avg", "sell_value"]
+
+# event loop -> MatchingEngine
+_engines = weakref.WeakKeyDictionary()
+
+
+def chain_ltp(tradingsymbol):
+    chain = get_option_chain()
+    return chain.ltp(chain.row_from_tradingsymbol(tradingsymbol))
+
+
+class MatchingEngine:
+    """
+    Simulated exchange for paper trading accounts.
+
+    New orders, modifications and cancellations take effect after a random latency. Limit orders rest
+    until the last price `ltp(tradingsymbol)` crosses them, market and marketable orders fill at the
+    last price plus slippage, and each match fills at most `max_fill`. Every fill updates the
+    account's positions in place.
+    """
+
+    def __init__(self, ltp=chain_ltp, latency=(0.0, 0.0), slippage_ticks=0, max_fill=0, interval=0.1):
+        self.ltp = ltp
+        self.latency = latency
+        self.slippage = slippage_ticks * TICK_SIZE
+        self.max_fill = max_fill
+        self.interval = interval
+        self.orders = {}
+        self.books = {}
+        self.task = None
+
+    def delay(self):
+        return time.monotonic() + random.uniform(*self.latency)
+
+    def submit(
+        self, account, order_id, tradingsymbol, exchange, transaction_type, quantity, price=0, tag=None, on_final=None
+    ):
+        """Send an order to the book, `on_final` is awaited with it once it is completed or cancelled."""
+        self.orders[order_id] = {
+            "order_id": order_id,
+            "account": account,
+            "tradingsymbol": tradingsymbol,
+            "exchange": exchange,
+            "transaction_type": transaction_type,
+            "quantity": int(quantity),
+            "pending_qty": int(quantity),
+            "filled_qty": 0,
+            "price": float(price),
+            "trigger_price": 0.0,
+            "average_price": 0.0,
+            "status": "OPEN",
+            "tag": tag,
+            "order_timestamp": timezone.localtime(),
+            "active_at": self.delay(),
+            "amendments": [],
+            "on_final": on_final,
+        }
+        self.start()
+        return self.orders[order_id]
+
+    def amend(self, order_id, **changes):
+        order = self.orders[order_id]
+        if order["status"] not in FINAL_STATUS:
+            order["amendments"].append((self.delay(), changes))
+        return order
+
+    def modify(self, order_id, quantity, price):
+        """New pending quantity and limit price, as the chase loop sends them."""
+        return self.amend(order_id, pending_qty=int(quantity), price=float(price))
+
+    def apply(self, order, changes):
+        order.update(changes)
+        # the pending quantity was read before the amendment's latency, fills since then are not pending anymore
+        order["pending_qty"] = max(min(order["pending_qty"], order["quantity"] - order["filled_qty"]), 0)
+
+    def cancel(self, order_id):
+        return self.amend(order_id, status="CANCELLED")
+
+    def fill_price(self, order, ltp):
+        buy = order["transaction_type"] == "BUY"
+        if not order["price"]:
+            return ltp + self.slippage if buy else max(ltp - self.slippage, TICK_SIZE)
+        if buy and ltp <= order["price"]:
+            return min(ltp + self.slippage, order["price"])
+        if not buy and ltp >= order["price"]:
+            return max(ltp - self.slippage, order["price"])
+        return None
+
+    def position(self, account, tradingsymbol):
+        book = self.books.setdefault(account, {})
+        if tradingsymbol not in book:
+            book[tradingsymbol] = {"buy_qty": 0, "buy_value": 0.0, "sell_qty": 0, "sell_value": 0.0}
+        return book[tradingsymbol]
+
+    def fill(self, order, quantity, price):
+        filled = order["filled_qty"] + quantity
+        order["average_price"] = round((order["average_price"] * order["filled_qty"] + price * quantity) / filled, 2)
+        order["filled_qty"] = filled
+        order["pending_qty"] -= quantity
+        if not order["pending_qty"]:
+            order["status"] = "COMPLETED"
+
+        side = "buy" if order["transaction_type"] == "BUY" else "sell"
+        position = self.position(order["account"], order["tradingsymbol"])
+        position[f"{side}_qty"] += quantity
+        position[f"{side}_value"] += quantity * price
+
+    def match(self):
+        """One pass over the open orders, returns the orders that reached a final status."""
+        now = time.monotonic()
+        finished = []
+        for order in self.orders.values():
+            if order["status"] in FINAL_STATUS:
+                continue
+
+            while order["amendments"] and order["amendments"][0][0] <= now:
+                self.apply(order, order["amendments"].pop(0)[1])
+            if order["status"] == "CANCELLED":
+                finished.append(order)
+                continue
+            if now < order["active_at"]:
+                continue
+
+            ltp = self.ltp(order["tradingsymbol"])
+            if not ltp or math.isnan(ltp):
+                continue
+
+            price = self.fill_price(order, ltp)
+            if price is not None:
+                quantity = min(order["pending_qty"], self.max_fill or order["pending_qty"])
+                self.fill(order, quantity, round(price, 2))
+                if order["status"] == "COMPLETED":
+                    finished.append(order)
+
+        return finished
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self.run(), context=contextvars.Context())
+
+    async def run(self):
+        try:
+            while any(order["status"] not in FINAL_STATUS for order in self.orders.values()):
+                try:
+                    for order in self.match():
+                        if order["on_final"] is not None:
+                            await order["on_final"](order)
+                except Exception:
+                    traceback.print_exc()
+
+                await asyncio.sleep(self.interval)
+        finally:
+            self.task = None
+
+    def seed(self, account, orders):
+        """Start the account's book from earlier fills, dicts with tradingsymbol, transaction_type, quantity and price."""
+        self.books[account] = {}
+        for order in orders:
+            side = "buy" if order["transaction_type"] == "BUY" else "sell"
+            position = self.position(account, order["tradingsymbol"])
+            position[f"{side}_qty"] += int(order["quantity"])
+            position[f"{side}_value"] += int(order["quantity"]) * float(order["price"])
+
+    def positions(self, account) -> pd.DataFrame:
+        df = pd.DataFrame(
+            [{"tradingsymbol": symbol, **values} for symbol, values in self.books.get(account, {}).items()],
+            columns=POSITION_COLUMNS,
+        )
+        df["buy_avg"] = (df["buy_value"] / df["buy_qty"].where(df["buy_qty"] != 0)).fillna(0)
+        df["sell_avg"] = (df["sell_value"] / df["sell_qty"].where(df["sell_qty"] != 0)).fillna(0)
+        return df
+
+
+def get_matching_engine() -> MatchingEngine:
+    """Engine shared by every paper trading account on the running loop."""
+    loop = asyncio.get_running_loop()
+    if loop not in _engines:
+        _engines[loop] = MatchingEngine(
+            latency=(settings.DUMMY_LATENCY_MIN, settings.DUMMY_LATENCY_MAX),
+            slippage_ticks=settings.DUMMY_SLIPPAGE_TICKS,
+            max_fill=settings.DUMMY_MAX_FILL_QUANTITY,
+            interval=settings.DUMMY_MATCH_INTERVAL,
+        )
+    return _engines[loop]
@@ -2,16 +2,26 @@ import asyncio
 import traceback
 
 import pandas as pd
-from django.core.cache import cache
+from asgiref.sync import sync_to_async
 from django.db.utils import OperationalError
 from django.utils import timezone
 
 from apps.integration.models import BrokerApi, KotakNeoApi, KotakSecuritiesApi
+from apps.trade.models import Order
 from utils.async_obj import AsyncObj
 from utils.broker.dummy import DummyApi as DApi
 from utils.broker.kotak_neo import KotakNeoApi as KNApi, KotakNeoApiError as KNApiError
 from utils.broker.kotak_securities import KotakSecuritiesApi as KSApi
 from utils.broker.kotak_securities import KotakSecuritiesApiError as KSError
+from utils.latency import LatencyTrace
+from utils.option_chain import get_option_chain, option_chains
+from utils.order_dispatcher import dispatch
+from utils.order_journal import get_order_journal
+from utils.order_tracker import FINAL_STATUS, get_order_tracker
+from utils.position_book import PositionBook, reconcile_book, record_fill
+
+# credentials of a broker session, a session is opened again when one of them changes
+SESSION_FIELDS = ("access_token", "session_token", "sid", "auth")
 
 
 class Broker(AsyncObj):
@@ -31,8 +41,14 @@ class Broker(AsyncObj):
         # sourcery skip: raise-specific-error
         self.username = username
         self.broker_name = broker_name
+        # set by the strategy running this account, its orders are journaled against it
+        self.strategy_id = None
 
-        self.broker = BrokerApi.objects.filter(user__username=username, is_active=True).first()
+        self.broker = (
+            await BrokerApi.objects.filter(user__username=username, is_active=True)
+            .select_related("user", "kotak_neo_api", "kotak_api")
+            .afirst()
+        )
 
         if not self.broker:
             raise Exception("Broker not found")
@@ -51,12 +67,17 @@ class Broker(AsyncObj):
         if self.broker_name != self.DUMMY:
             while True:
                 try:
-                    self.broker.refresh_from_db()
+                    await sync_to_async(self.broker.refresh_from_db)()
                     break
                 except OperationalError as oe:
                     print(oe)
                     await asyncio.sleep(1)
 
+        # a resident process keeps the session it opened on this loop until the broker issues new credentials
+        session = (id(asyncio.get_running_loop()), *(getattr(self.broker, field, None) for field in SESSION_FIELDS))
+        if getattr(self, "session", None) == session:
+            return
+
         match self.broker_name:
             case self.KOTAK_NEO:
                 self.api = await KNApi(
@@ -80,18 +101,18 @@ class Broker(AsyncObj):
                 self.api: DApi = await DApi(user=self.broker.user)
             case _:
                 raise Exception("Broker not found")
+        self.session = session
 
-    async def get_instrument_from_kite_token(self, kite_instrument_token):
-        df = cache.get("OPTION_INSTRUMENTS")
-        return df[(df["kite_instrument_token"] == kite_instrument_token)].iloc[0]
+    async def get_instrument_from_kite_token(self, kite_instrument_token, instrument_name="BANKNIFTY"):
+        chain = get_option_chain(instrument_name)
+        return chain.instrument(chain.row(kite_instrument_token))
 
     async def get_instrument_from_strike_and_option_type(self, instrument, strike, option_type):
-        df = cache.get("OPTION_INSTRUMENTS")
-        return df[(df["strike"] == strike) & (df["instrument_type"] == option_type)].iloc[0]
+        chain = get_option_chain(instrument)
+        return chain.instrument(chain.row_from_strike(strike, option_type))
 
-    async def get_ltp(self, kite_instrument_token):
-        df = cache.get("OPTION_INSTRUMENTS")
-        return df[df["kite_instrument_token"] == kite_instrument_token].iloc[0].last_price
+    async def get_ltp(self, kite_instrument_token, instrument_name="BANKNIFTY"):
+        return get_option_chain(instrument_name).get_ltp(kite_instrument_token)
 
     async def get_order_report(self, order_id):
         return await self.api.single_order_report(order_id, True)
@@ -104,8 +125,9 @@ class Broker(AsyncObj):
         expected_price=0,
         order_type="NORMAL",
         slippage=0,
+        instrument_name="BANKNIFTY",
     ):
-        row = await self.get_instrument_from_kite_token(kite_instrument_token)
+        row = await self.get_instrument_from_kite_token(kite_instrument_token, instrument_name)
         price = expected_price
         if expected_price and slippage:
             if transaction_type == "BUY":
@@ -118,7 +140,9 @@ class Broker(AsyncObj):
         match self.broker_name:
             case self.KOTAK_NEO:
                 try:
-                    return await self.api.place_order(
+                    return await dispatch(
+                        self,
+                        self.api.place_order,
                         tradingsymbol=row.tradingsymbol,  # ts
                         quantity=str(quantity),  # qt
                         transaction_type=self.KOTAK_NEO_TRANSACTION_TYPE_MAP[transaction_type],  # tt
@@ -128,19 +152,12 @@ class Broker(AsyncObj):
                         product_code=self.KOTAK_NEO_PRODUCT_CODE_MAP[order_type],  # pc
                     )
                 except KNApiError as ke:
-                    if ke.code == 40000:
-                        return await self.place_order(
-                            kite_instrument_token,
-                            transaction_type,
-                            quantity,
-                            expected_price,
-                            order_type,
-                            slippage,
-                        )
                     print(ke)
             case self.KOTAK:
                 try:
-                    return await self.api.place_order(
+                    return await dispatch(
+                        self,
+                        self.api.place_order,
                         instrument_token=int(row.kotak_sec_instrument_token),
                         exchange="NSE",
                         transaction_type=self.KOTAK_TRANSACTION_TYPE_MAP[transaction_type],
@@ -148,18 +165,11 @@ class Broker(AsyncObj):
                         price=float(expected_price),
                     )
                 except KSError as ke:
-                    if ke.code == 40000:
-                        return await self.place_order(
-                            kite_instrument_token,
-                            transaction_type,
-                            quantity,
-                            expected_price,
-                            order_type,
-                            slippage,
-                        )
                     print(ke)
             case self.DUMMY:
-                return await self.api.place_order(
+                return await dispatch(
+                    self,
+                    self.api.place_order,
                     row.tradingsymbol,
                     "NFO",
                     transaction_type,
@@ -177,8 +187,9 @@ class Broker(AsyncObj):
         expected_price=0,
         order_type="NORMAL",
         slippage=0,
+        instrument_name="BANKNIFTY",
     ):
-        row = await self.get_instrument_from_kite_token(kite_instrument_token)
+        row = await self.get_instrument_from_kite_token(kite_instrument_token, instrument_name)
 
         if expected_price and slippage:
             if order_type == "BUY":
@@ -189,7 +200,9 @@ class Broker(AsyncObj):
         match self.broker_name:
             case self.KOTAK_NEO:
                 try:
-                    return await self.api.modify_order(
+                    return await dispatch(
+                        self,
+                        self.api.modify_order,
                         order_id=order_id,  # no
                         token=row.kotak_neo_instrument_token,  # tk
                         tradingsymbol=row.tradingsymbol,  # ts
@@ -201,38 +214,26 @@ class Broker(AsyncObj):
                         product_code=self.KOTAK_NEO_PRODUCT_CODE_MAP[order_type],  # pc
                     )
                 except KNApiError as ke:
-                    if ke.code == 40000:
-                        await asyncio.sleep(1)
-                        return await self.modify_order(
-                            kite_instrument_token,
-                            order_id,
-                            quantity,
-                            transaction_type,
-                            expected_price,
-                            order_type,
-                            slippage,
-                        )
                     print(ke)
             case self.KOTAK:
                 try:
-                    return await self.api.modify_order(
+                    return await dispatch(
+                        self,
+                        self.api.modify_order,
                         order_id=order_id,
                         quantity=int(quantity),
                         price=float(expected_price),
                     )
                 except KSError as ke:
-                    if ke.code == 40000:
-                        await asyncio.sleep(1)
-                        return await self.modify_order(
-                            kite_instrument_token,
-                            order_id,
-                            quantity,
-                            transaction_type,
-                            expected_price,
-                            order_type,
-                            slippage,
-                        )
                     print(ke)
+            case self.DUMMY:
+                return await dispatch(
+                    self,
+                    self.api.modify_order,
+                    order_id=order_id,
+                    quantity=int(quantity),
+                    price=float(expected_price),
+                )
 
     async def place_and_chase_order(
         self,
@@ -262,52 +263,56 @@ class Broker(AsyncObj):
         #     "order_entry_time": ct,
         #     "error_message": None,
         # }
-        instrument = await self.get_instrument_from_strike_and_option_type(instrument_name, strike, option_type)
-        kite_instrument_token = instrument.kite_instrument_token
+        trace = LatencyTrace(self.username, self.broker_name, f"{option_type} {transaction_type}")
+        with trace.activate():
+            with trace.span("lookup"):
+                instrument = await self.get_instrument_from_strike_and_option_type(
+                    instrument_name, strike, option_type
+                )
+                kite_instrument_token = instrument.kite_instrument_token
 
-        if order_in_limit and not expected_price:
-            expected_price = await self.get_ltp(kite_instrument_token)
+            if order_in_limit and not expected_price:
+                expected_price = await self.get_ltp(kite_instrument_token, instrument_name)
+            limit_price = expected_price
 
-        while True:
-            order = await self.place_order(
-                kite_instrument_token, transaction_type, quantity, expected_price, slippage=initial_slippage
-            )
-            print(order)
-            try:
-                order_id = order["order_id"]
-                error_message = order.get("error_message")
-                break
-            except Exception as e:
-                print(traceback.print_exc())
-                print("Place Order Exception", self.username, order)
-                print(e)
-
-        order_report = await self.api.single_order_report(order_id, True, error_message)
-
-        if order_report["status"] == "REJECTED":
-            print(self.username, "ORDER REJECTED")
-            now_time = timezone.localtime().replace(microsecond=0)
-            print(f"{int(strike)}{option_type} {transaction_type} {order_id} {now_time}")
-            print()
-        elif order_report["status"] not in ["COMPLETED", "CANCELLED"] and expected_price:
             while True:
-                print(order_report["status"])
-                await asyncio.sleep(sleep_time)
-                now_time = timezone.localtime().replace(microsecond=0)
-                order_report = await self.get_order_report(order_id)
+                with trace.span("ack"):
+                    order = await self.place_order(
+                        kite_instrument_token,
+                        transaction_type,
+                        quantity,
+                        expected_price,
+                        slippage=initial_slippage,
+                        instrument_name=instrument_name,
+                    )
+                print(order)
+                try:
+                    order_id = order["order_id"]
+                    error_message = order.get("error_message")
+                    break
+                except Exception as e:
+                    print(traceback.print_exc())
+                    print("Place Order Exception", self.username, order)
+                    print(e)
+
+            tracker = get_order_tracker(self)
+            try:
+                if error_message:
+                    order_report = await self.api.single_order_report(order_id, True, error_message)
+                else:
+                    order_report = await tracker.wait(order_id, sleep_time)
+                    if order_report is None:
+                        order_report = await self.get_order_report(order_id)
 
-                if order_report["status"] == "REJECTED":
-                    print(self.username, "ORDER REJECTED")
+                while order_report["status"] not in FINAL_STATUS and expected_price:
+                    print(order_report["status"])
                     now_time = timezone.localtime().replace(microsecond=0)
-                    print(f"{int(strike)}{option_type} {transaction_type} {order_id} {now_time}")
-                    print()
-                elif order_report["status"] not in ["COMPLETED", "CANCELLED"]:
                     print(
                         f"{self.username} MODIFY ORDER: {int(strike)}{option_type} \
                             {transaction_type} {order_id} {now_time}"
                     )
                     modify_quantity = order_report["pending_qty"]
-                    modify_price = await self.get_ltp(kite_instrument_token)
+                    modify_price = await self.get_ltp(kite_instrument_token, instrument_name)
                     modify_price = (
                         max(modify_price - slippage, 0.5) if transaction_type == "SELL" else modify_price + slippage
                     )
@@ -319,28 +324,70 @@ class Broker(AsyncObj):
                             else min(modify_price, max_price)
                         )
 
-                    await self.modify_order(
-                        kite_instrument_token=kite_instrument_token,
-                        order_id=order_id,
-                        quantity=modify_quantity,
-                        transaction_type=transaction_type,
-                        expected_price=modify_price,
-                    )
+                    limit_price = modify_price
+                    with trace.span("modify", price=modify_price, quantity=int(modify_quantity)):
+                        await self.modify_order(
+                            kite_instrument_token=kite_instrument_token,
+                            order_id=order_id,
+                            quantity=modify_quantity,
+                            transaction_type=transaction_type,
+                            expected_price=modify_price,
+                            instrument_name=instrument_name,
+                        )
 
-                    await asyncio.sleep(0.25)
+                    order_report = await tracker.wait(order_id, sleep_time) or order_report
+            finally:
+                tracker.unwatch(order_id)
 
-                    order_report = await self.api.single_order_report(order_id, True)
-                    if order_report["status"] in ["COMPLETED", "CANCELLED"]:
-                        break
-                else:
-                    break
+            if order_report["status"] == "COMPLETED":
+                trace.record("fill", trace.started, order_id=order_id)
 
-        return {
-            "order_number": order_id,
-            "order_status": order_report["status"],
-            "order_entry_time": ct,
-            "error_message": error_message,
-        }
+            # brokers without an average price in the report fill at our last limit, reconciliation corrects it
+            fill_price = (
+                order_report.get("average_price")
+                or limit_price
+                or await self.get_ltp(kite_instrument_token, instrument_name)
+            )
+            filled_qty = int(order_report.get("filled_qty") or 0)
+            record_fill(
+                self.broker_name,
+                self.username,
+                instrument.tradingsymbol,
+                transaction_type,
+                filled_qty,
+                fill_price,
+            )
+
+            get_order_journal().record(
+                Order,
+                username=self.username,
+                broker=self.broker_name,
+                strategy_id=getattr(self, "strategy_id", None),
+                order_id=order_id,
+                order_timestamp=ct,
+                tradingsymbol=instrument.tradingsymbol,
+                transaction_type=transaction_type,
+                price=limit_price,
+                expected_price=expected_price,
+                average_price=fill_price if filled_qty else 0,
+                quantity=filled_qty,
+                traded_value=round(fill_price * filled_qty, 2),
+                trade_history=trace.spans,
+            )
+
+            if order_report["status"] == "REJECTED":
+                print(self.username, "ORDER REJECTED")
+                now_time = timezone.localtime().replace(microsecond=0)
+                print(f"{int(strike)}{option_type} {transaction_type} {order_id} {now_time}")
+                print()
+
+            return {
+                "order_number": order_id,
+                "order_status": order_report["status"],
+                "order_entry_time": ct,
+                "error_message": error_message,
+                "trade_history": trace.spans,
+            }
 
     async def calculate_live_pnl(self):
         match self.broker_name:
@@ -348,8 +395,9 @@ class Broker(AsyncObj):
                 df = await self.api.positions()
             case self.KOTAK:
                 df = await self.api.positions("TODAYS")
-                instruments = cache.get("OPTION_INSTRUMENTS")
-                instruments = instruments[["kotak_sec_instrument_token", "tradingsymbol"]].copy()
+                instruments = pd.concat(
+                    [chain.meta[["kotak_sec_instrument_token", "tradingsymbol"]] for chain in option_chains()]
+                )
                 df = pd.merge(
                     df,
                     instruments,
@@ -365,14 +413,24 @@ class Broker(AsyncObj):
 
         return df
 
+    async def reconcile_positions(self) -> PositionBook:
+        """Replace the account's position book with the broker's own positions and margin."""
+        df = await self.calculate_live_pnl()
+        # the book is only read once both reports are in, fills landing meanwhile make it retry
+        book, drifted = reconcile_book(self.broker_name, self.username, df, await self.margin())
+        if drifted:
+            print(self.username, self.broker_name, "POSITION BOOK DRIFTED", drifted)
+        return book
+
     async def get_open_position(self) -> list:
         match self.broker_name:
             case self.KOTAK_NEO:
                 df = await self.api.positions()
             case self.KOTAK:
                 df = await self.api.positions("TODAYS")
-                instruments = cache.get("OPTION_INSTRUMENTS")
-                instruments = instruments[["kotak_sec_instrument_token", "tradingsymbol"]].copy()
+                instruments = pd.concat(
+                    [chain.meta[["kotak_sec_instrument_token", "tradingsymbol"]] for chain in option_chains()]
+                )
                 df = pd.merge(
                     df,
                     instruments,
@@ -383,9 +441,7 @@ class Broker(AsyncObj):
             case self.DUMMY:
                 df = await self.api.positions()
 
-        instruments = cache.get("OPTION_INSTRUMENTS")
-
-        tradingsymbols = instruments.tradingsymbol
+        tradingsymbols = {symbol for chain in option_chains() for symbol in chain.tradingsymbol_index}
 
         df["net_qty"] = df["buy_qty"] - df["sell_qty"]
 
@@ -395,19 +451,22 @@ class Broker(AsyncObj):
 
     async def square_off_all(self, market=False):
         positions = await self.get_open_position()
-        instruments = cache.get("OPTION_INSTRUMENTS")
+        chains = {symbol: chain for chain in option_chains() for symbol in chain.tradingsymbol_index}
         data = []
         for row in positions:
             transaction_type = "SELL" if row["net_qty"] > 0 else "BUY"
-            x = instruments[instruments["tradingsymbol"] == row["tradingsymbol"]].iloc[0]
+            # each position is chased on the chain of its own underlying
+            chain = chains[row["tradingsymbol"]]
+            idx = chain.row_from_tradingsymbol(row["tradingsymbol"])
+            x = chain.instrument(idx)
             data.append(
                 self.place_and_chase_order(
-                    instrument_name="BANKNIFTY",
-                    strike=x["strike"],
-                    option_type=x["instrument_type"],
+                    instrument_name=chain.name,
+                    strike=x.strike,
+                    option_type=x.instrument_type,
                     transaction_type=transaction_type,
                     quantity=abs(row["net_qty"]),
-                    expected_price=0 if market else x["last_price"],
+                    expected_price=0 if market else chain.ltp(idx),
                     initial_slippage=10,
                     slippage=5,
                     order_in_limit=not market
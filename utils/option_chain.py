@@ -0,0 +1,272 @@
+import contextlib
+import datetime as dt
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.core.cache import cache
+
+# Live columns kept in shared memory, one float64 row per field.
+FIELDS = (
+    "last_price",
+    "oi",
+    "exchange_timestamp",
+    "last_trade_time",
+    "tick_seq",
+)
+
+# Header slots at the start of the segment.
+HEADER = (
+    "seq",
+    "n_rows",
+    "updated_at",
+    "retired",
+    "layout",
+)
+
+# How long `attach` waits for the segment and the published metadata to describe the same layout.
+ATTACH_RETRIES = 50
+ATTACH_RETRY_DELAY = 0.1
+
+# Tick keys copied into the live columns of the same name.
+TICK_FIELDS = (
+    "last_price",
+    "oi",
+    "exchange_timestamp",
+    "last_trade_time",
+)
+
+TIMESTAMP_FIELDS = ("exchange_timestamp", "last_trade_time")
+
+EPOCH = dt.datetime(1970, 1, 1)
+
+
+def to_epoch(value):
+    """Naive exchange datetime to float seconds, NaN when missing."""
+    if value is None:
+        return np.nan
+    if isinstance(value, dt.datetime):
+        return (value.replace(tzinfo=None) - EPOCH).total_seconds()
+    return float(value)
+
+
+class OptionChainStore:
+    """
+    Option chain shared between the tick ingester and its readers.
+
+    Static instrument metadata (tradingsymbol, broker tokens, strike, expiry) is published once to the cache
+    under ``<NAME>_CHAIN_META``. Live tick fields sit in a float64 block in shared memory with one row per
+    instrument, so the ingester updates them in place and readers look them up without a Redis round trip.
+    """
+
+    def __init__(self, name: str, meta: pd.DataFrame, shm: shared_memory.SharedMemory):
+        self.name = name
+        self.meta = meta
+        self.shm = shm
+        self.n_rows = len(meta)
+
+        buffer = np.ndarray((len(HEADER) + len(FIELDS) * self.n_rows,), dtype=np.float64, buffer=shm.buf)
+        self.header = buffer[: len(HEADER)]
+        self.data = buffer[len(HEADER) :].reshape(len(FIELDS), self.n_rows)
+
+        # lookup indexes built once per layout, every value is a row number
+        self.token_index = {int(token): idx for idx, token in enumerate(meta["kite_instrument_token"])}
+        self.tradingsymbol_index = {symbol: idx for idx, symbol in enumerate(meta["tradingsymbol"])}
+        self.kotak_neo_index = {str(token): idx for idx, token in enumerate(meta["kotak_neo_instrument_token"])}
+        self.kotak_sec_index = {int(token): idx for idx, token in enumerate(meta["kotak_sec_instrument_token"])}
+        self.strike_index = {}
+        nearest_expiry = meta["expiry"].min() if self.n_rows else None
+        for idx, (expiry, strike, option_type) in enumerate(
+            zip(meta["expiry"], meta["strike"], meta["instrument_type"])
+        ):
+            self.strike_index[(expiry, float(strike), option_type)] = idx
+            if expiry == nearest_expiry:
+                self.strike_index[(None, float(strike), option_type)] = idx
+        self.instruments = {}
+
+    @staticmethod
+    def segment_name(name):
+        return f"{name.lower()}_option_chain"
+
+    @staticmethod
+    def meta_key(name):
+        return f"{name}_CHAIN_META"
+
+    @classmethod
+    def create(cls, name: str, instruments: pd.DataFrame):
+        """Allocate a fresh segment for `instruments` and publish its metadata. Used by the tick ingester."""
+        meta = instruments.drop(columns=[x for x in FIELDS if x in instruments.columns]).reset_index(drop=True)
+        # id shared by the segment header and the metadata, microseconds stay exact as a float64
+        meta.attrs["layout"] = time.time_ns() // 1000
+        size = 8 * (len(HEADER) + len(FIELDS) * len(meta))
+
+        try:
+            # attaching registers the segment with the resource tracker and unlink() unregisters it again
+            stale = shared_memory.SharedMemory(name=cls.segment_name(name))
+            # readers still mapped to the old segment see this and re-attach
+            np.ndarray((len(HEADER),), dtype=np.float64, buffer=stale.buf)[HEADER.index("retired")] = 1
+            stale.close()
+            stale.unlink()
+        except FileNotFoundError:
+            pass
+
+        shm = shared_memory.SharedMemory(name=cls.segment_name(name), create=True, size=size)
+        resource_tracker.unregister(shm._name, "shared_memory")
+
+        store = cls(name, meta, shm)
+        store.data[:] = np.nan
+        store.data[FIELDS.index("tick_seq")] = 0
+        store.header[:] = 0
+        store.header[HEADER.index("n_rows")] = store.n_rows
+        store.header[HEADER.index("layout")] = meta.attrs["layout"]
+
+        cache.set(cls.meta_key(name), meta)
+        return store
+
+    @classmethod
+    def attach(cls, name: str):
+        """
+        Attach to the segment published by the tick ingester. While the ingester is replacing the layout the
+        segment and the cached metadata may not match yet, so retry until their layout ids agree.
+        """
+        for _ in range(ATTACH_RETRIES):
+            meta = cache.get(cls.meta_key(name))
+            if meta is None:
+                raise FileNotFoundError(f"{name} option chain has not been published")
+
+            try:
+                shm = shared_memory.SharedMemory(name=cls.segment_name(name))
+            except FileNotFoundError:
+                time.sleep(ATTACH_RETRY_DELAY)
+                continue
+            resource_tracker.unregister(shm._name, "shared_memory")
+
+            # only the header is read until the layout is known to match, the rows may not fit the segment
+            if shm.size >= 8 * (len(HEADER) + len(FIELDS) * len(meta)):
+                header = np.ndarray((len(HEADER),), dtype=np.float64, buffer=shm.buf)
+                current = (
+                    not header[HEADER.index("retired")]
+                    and header[HEADER.index("layout")] == meta.attrs.get("layout")
+                    and header[HEADER.index("n_rows")] == len(meta)
+                )
+                del header
+                if current:
+                    return cls(name, meta, shm)
+
+            shm.close()
+            time.sleep(ATTACH_RETRY_DELAY)
+
+        raise FileNotFoundError(f"{name} option chain segment does not match its published metadata")
+
+    def is_current(self):
+        return not self.header[HEADER.index("retired")]
+
+    def close(self):
+        self.header = self.data = None
+        with contextlib.suppress(BufferError):
+            self.shm.close()
+
+    def column(self, field):
+        return self.data[FIELDS.index(field)]
+
+    @property
+    def seq(self):
+        return int(self.header[HEADER.index("seq")])
+
+    def changed_since(self, seq):
+        """Mask of rows that received a tick after the store sequence number `seq`."""
+        return self.column("tick_seq") > seq
+
+    def row(self, kite_instrument_token):
+        return self.token_index[int(kite_instrument_token)]
+
+    def row_from_strike(self, strike, option_type, expiry=None):
+        """Row of `strike`/`option_type`, on the nearest expiry unless `expiry` is given."""
+        return self.strike_index[(expiry, float(strike), option_type)]
+
+    def row_from_tradingsymbol(self, tradingsymbol):
+        return self.tradingsymbol_index[tradingsymbol]
+
+    def row_from_kotak_neo_token(self, token):
+        return self.kotak_neo_index[str(token)]
+
+    def row_from_kotak_sec_token(self, token):
+        return self.kotak_sec_index[int(token)]
+
+    def instrument(self, row):
+        """Static metadata of `row` as a read-only named tuple, built on first use and reused afterwards."""
+        if row not in self.instruments:
+            self.instruments[row] = next(self.meta.iloc[row : row + 1].itertuples(index=False, name="Instrument"))
+        return self.instruments[row]
+
+    def ltp(self, row):
+        return float(self.column("last_price")[row])
+
+    def update_ticks(self, ticks):
+        """Write the latest tick fields in place, returns the number of rows updated."""
+        seq = self.header[HEADER.index("seq")]
+        tick_seq = self.column("tick_seq")
+        updated = 0
+
+        for tick in ticks:
+            idx = self.token_index.get(tick["instrument_token"])
+            if idx is None:
+                continue
+
+            seq += 1
+            for field in TICK_FIELDS:
+                if field in tick:
+                    value = tick[field]
+                    self.data[FIELDS.index(field), idx] = to_epoch(value) if field in TIMESTAMP_FIELDS else value
+            tick_seq[idx] = seq
+            updated += 1
+
+        if updated:
+            self.header[HEADER.index("seq")] = seq
+            self.header[HEADER.index("updated_at")] = dt.datetime.now().timestamp()
+
+        return updated
+
+    def get_ltp(self, kite_instrument_token):
+        return self.ltp(self.row(kite_instrument_token))
+
+    def frame(self):
+        """Chain as a DataFrame, same columns as the former ``OPTION_INSTRUMENTS`` cache entry."""
+        df = self.meta.copy()
+        for field in FIELDS:
+            if field == "tick_seq":
+                continue
+            values = self.column(field).copy()
+            if field in TIMESTAMP_FIELDS:
+                df[field] = pd.to_datetime(values, unit="s")
+            else:
+                df[field] = values
+        return df
+
+
+_stores = {}
+
+
+def get_option_chain(name="BANKNIFTY") -> OptionChainStore:
+    """Per process reader for the `name` chain, re-attached when the ingester publishes a new layout."""
+    store = _stores.get(name)
+    if store is not None and not store.is_current():
+        store.close()
+        store = None
+
+    if store is None:
+        store = OptionChainStore.attach(name)
+        _stores[name] = store
+
+    return store
+
+
+def option_chains() -> list:
+    """Readers of every configured underlying whose chain has been published."""
+    chains = []
+    for name in settings.OPTION_CHAIN_UNDERLYINGS:
+        with contextlib.suppress(FileNotFoundError):
+            chains.append(get_option_chain(name))
+    return chains
@@ -0,0 +1,157 @@
+import asyncio
+import contextlib
+import contextvars
+import random
+import time
+import traceback
+import weakref
+from collections import deque
+
+from django.conf import settings
+
+# event loop -> OrderDispatcher
+_dispatchers = weakref.WeakKeyDictionary()
+
+
+def is_rate_limited(error):
+    # KotakNeoApiError and KotakSecuritiesApiError both raise code 40000 on 429
+    return getattr(error, "code", None) == 40000
+
+
+class TokenBucket:
+    def __init__(self, rate=None, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def try_acquire(self):
+        """Take a token, returns 0 on success or the seconds until the next token is available."""
+        if not self.rate:
+            return 0
+
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    async def acquire(self):
+        while delay := self.try_acquire():
+            await asyncio.sleep(delay)
+
+
+class OrderDispatcher:
+    """
+    Sends order API calls for every broker account on the loop.
+
+    Each account has its own queue and a token bucket sized from ``BROKER_RATE_LIMITS``. The scheduler
+    takes one call per account per round, so a user with many legs does not hold back the others, and
+    rate limited calls are retried with jittered exponential backoff.
+    """
+
+    def __init__(self, max_in_flight, retries, backoff, max_backoff):
+        self.queues = {}
+        self.buckets = {}
+        self.in_flight = asyncio.Semaphore(max_in_flight)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.wakeup = asyncio.Event()
+        self.running = set()
+        self.task = None
+
+    def bucket(self, broker):
+        key = (broker.broker_name, broker.username)
+        if key not in self.buckets:
+            limit = settings.BROKER_RATE_LIMITS.get(broker.broker_name)
+            self.buckets[key] = TokenBucket(*limit) if limit else TokenBucket()
+        return self.buckets[key]
+
+    async def submit(self, broker, func, *args, **kwargs):
+        key = (broker.broker_name, broker.username)
+        future = asyncio.get_running_loop().create_future()
+        # run the call in the caller's context so its latency trace sees the HTTP spans
+        context = contextvars.copy_context()
+        self.queues.setdefault(key, deque()).append((context, self.bucket(broker), func, args, kwargs, future))
+
+        self.wakeup.set()
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+        return await future
+
+    async def run(self):
+        try:
+            while self.queues:
+                self.wakeup.clear()
+                wait = None
+                sent = False
+
+                for key in list(self.queues):
+                    queue = self.queues[key]
+                    bucket = queue[0][1]
+
+                    delay = bucket.try_acquire()
+                    if delay:
+                        wait = min(wait or delay, delay)
+                        continue
+
+                    context, *job = queue.popleft()
+                    if not queue:
+                        del self.queues[key]
+
+                    await self.in_flight.acquire()
+                    task = asyncio.create_task(self.execute(*job), context=context)
+                    self.running.add(task)
+                    task.add_done_callback(self.running.discard)
+                    sent = True
+
+                if self.queues and not sent:
+                    # sleep until a bucket refills or a new call is submitted
+                    with contextlib.suppress(asyncio.TimeoutError):
+                        await asyncio.wait_for(self.wakeup.wait(), wait)
+        finally:
+            self.task = None
+
+    async def execute(self, bucket, func, args, kwargs, future):
+        try:
+            for attempt in range(self.retries + 1):
+                try:
+                    result = await func(*args, **kwargs)
+                except Exception as e:
+                    if not is_rate_limited(e) or attempt == self.retries:
+                        raise
+                    await asyncio.sleep(random.uniform(0, min(self.max_backoff, self.backoff * 2**attempt)))
+                    await bucket.acquire()
+                else:
+                    if not future.done():
+                        future.set_result(result)
+                    return
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+            else:
+                traceback.print_exc()
+        finally:
+            self.in_flight.release()
+
+
+def get_order_dispatcher() -> OrderDispatcher:
+    loop = asyncio.get_running_loop()
+    if loop not in _dispatchers:
+        _dispatchers[loop] = OrderDispatcher(
+            max_in_flight=settings.ORDER_DISPATCH_MAX_IN_FLIGHT,
+            retries=settings.ORDER_DISPATCH_RETRIES,
+            backoff=settings.ORDER_DISPATCH_BACKOFF,
+            max_backoff=settings.ORDER_DISPATCH_MAX_BACKOFF,
+        )
+    return _dispatchers[loop]
+
+
+async def dispatch(broker, func, *args, **kwargs):
+    """Run the order API call `func` for `broker` through the loop's dispatcher."""
+    return await get_order_dispatcher().submit(broker, func, *args, **kwargs)
@@ -0,0 +1,86 @@
+import asyncio
+import contextvars
+import traceback
+import weakref
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+
+# event loop -> OrderJournal
+_journals = weakref.WeakKeyDictionary()
+
+
+class OrderJournal:
+    """
+    Order rows of the running loop, written in the background.
+
+    `record` only puts the row on a queue, so the order path never waits on the database. A writer
+    task drains the queue every `interval` seconds and saves each batch off the loop, one
+    ``bulk_create`` per model.
+    """
+
+    def __init__(self, batch_size, interval):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.queue = asyncio.Queue()
+        self.task = None
+
+    def record(self, model, **fields):
+        """Queue a new `model` row, a `username` field is resolved to its user."""
+        self.queue.put_nowait((model, fields))
+        self.start()
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self.run(), context=contextvars.Context())
+
+    def drain(self, entries):
+        while not self.queue.empty() and len(entries) < self.batch_size:
+            entries.append(self.queue.get_nowait())
+        return entries
+
+    async def run(self):
+        entries = []
+        try:
+            while True:
+                entries = [await self.queue.get()]
+                await asyncio.sleep(self.interval)
+                batch, entries = self.drain(entries), []
+                try:
+                    await sync_to_async(self.write)(batch)
+                except Exception:
+                    traceback.print_exc()
+        except asyncio.CancelledError:
+            # the loop is closing, keep what is still queued
+            while entries := self.drain(entries):
+                await sync_to_async(self.write)(entries)
+                entries = []
+            raise
+        finally:
+            self.task = None
+
+    @staticmethod
+    def write(entries):
+        creates = {}
+        for model, fields in entries:
+            creates.setdefault(model, []).append(fields)
+
+        usernames = {row["username"] for rows in creates.values() for row in rows if "username" in row}
+        users = dict(get_user_model().objects.filter(username__in=usernames).values_list("username", "pk"))
+
+        for model, rows in creates.items():
+            objs = []
+            for row in rows:
+                if "username" in row:
+                    row = {**row, "user_id": users.get(row.pop("username"))}
+                objs.append(model(**row))
+            model.objects.bulk_create(objs)
+
+
+def get_order_journal() -> OrderJournal:
+    """Journal shared by every broker account on the running loop."""
+    loop = asyncio.get_running_loop()
+    if loop not in _journals:
+        _journals[loop] = OrderJournal(settings.ORDER_JOURNAL_BATCH_SIZE, settings.ORDER_JOURNAL_INTERVAL)
+    return _journals[loop]
@@ -0,0 +1,99 @@
+import asyncio
+import contextvars
+import traceback
+import weakref
+
+from django.conf import settings
+
+FINAL_STATUS = ("COMPLETED", "CANCELLED", "REJECTED")
+
+# event loop -> {(broker_name, username): OrderTracker}
+_trackers = weakref.WeakKeyDictionary()
+
+
+class OrderTracker:
+    """
+    Order status updates for one broker account.
+
+    While any order is watched a single poller fetches the account's order book every `interval`
+    seconds through ``api.orders_report`` and wakes the coroutines waiting on those orders. Broker
+    order-update streams can feed the same waiters through `publish`.
+    """
+
+    def __init__(self, api, interval):
+        self.api = api
+        self.interval = interval
+        self.watched = set()
+        self.reports = {}
+        self.waiters = {}
+        self.task = None
+
+    def watch(self, order_id):
+        self.watched.add(str(order_id))
+        if self.task is None:
+            # fresh context so the poller's requests are not traced as part of the first chase
+            self.task = asyncio.create_task(self.poll(), context=contextvars.Context())
+
+    def unwatch(self, order_id):
+        order_id = str(order_id)
+        self.watched.discard(order_id)
+        self.reports.pop(order_id, None)
+
+    def publish(self, order_id, report):
+        order_id = str(order_id)
+        self.reports[order_id] = report
+        if report["status"] in FINAL_STATUS:
+            for future in self.waiters.pop(order_id, ()):
+                if not future.done():
+                    future.set_result(report)
+
+    async def wait(self, order_id, timeout):
+        """
+        Report of `order_id` as soon as it reaches a final status, otherwise the latest report seen
+        within `timeout` seconds, None when the order has not shown up in the order book yet.
+        """
+        order_id = str(order_id)
+        self.watch(order_id)
+
+        report = self.reports.get(order_id)
+        if report is not None and report["status"] in FINAL_STATUS:
+            return report
+
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.setdefault(order_id, set()).add(future)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return self.reports.get(order_id)
+        finally:
+            self.waiters.get(order_id, set()).discard(future)
+
+    async def poll(self):
+        try:
+            while self.watched:
+                try:
+                    reports = await self.api.orders_report(list(self.watched))
+                except Exception:
+                    traceback.print_exc()
+                    reports = {}
+
+                for order_id, report in reports.items():
+                    if str(order_id) in self.watched:
+                        self.publish(order_id, report)
+
+                await asyncio.sleep(self.interval)
+        finally:
+            self.task = None
+
+
+def get_order_tracker(broker) -> OrderTracker:
+    """Tracker shared by every Broker of the same account on the running loop."""
+    trackers = _trackers.setdefault(asyncio.get_running_loop(), {})
+    key = (broker.broker_name, broker.username)
+
+    if key not in trackers:
+        trackers[key] = OrderTracker(broker.api, settings.ORDER_TRACKER_INTERVAL)
+
+    # pick up the latest session after initiate_session
+    trackers[key].api = broker.api
+    return trackers[key]
@@ -0,0 +1,230 @@
+import pandas as pd
+import redis
+
+from utils.timeseries import get_redis
+
+# Same columns as the former OPEN_POSITION frame, plus the per symbol figures of the book.
+BOOK_COLUMNS = [
+    "username",
+    "broker_name",
+    "margin",
+    "tradingsymbol",
+    "buy_qty",
+    "sell_qty",
+    "sell_value",
+    "buy_value",
+    "net_qty",
+    "avg_price",
+    "realized",
+]
+
+# Redis set of every account with a book, members are "<broker_name>:<username>"
+ACCOUNTS_KEY = "POSITION_BOOK_ACCOUNTS"
+
+# per symbol totals, each one a field "<tradingsymbol>|<total>" of the account's hash
+TOTALS = ("buy_qty", "sell_qty", "buy_value", "sell_value")
+
+
+class Position:
+    """Day totals of one symbol, every figure is derived from them in O(1), weighted average cost."""
+
+    __slots__ = ("buy_qty", "sell_qty", "buy_value", "sell_value")
+
+    def __init__(self, buy_qty=0, sell_qty=0, buy_value=0.0, sell_value=0.0):
+        self.buy_qty = int(buy_qty)
+        self.sell_qty = int(sell_qty)
+        self.buy_value = float(buy_value)
+        self.sell_value = float(sell_value)
+
+    def add(self, transaction_type, quantity, price):
+        if transaction_type == "BUY":
+            self.buy_qty += int(quantity)
+            self.buy_value += int(quantity) * float(price)
+        else:
+            self.sell_qty += int(quantity)
+            self.sell_value += int(quantity) * float(price)
+
+    @property
+    def net_qty(self):
+        return self.buy_qty - self.sell_qty
+
+    @property
+    def buy_avg(self):
+        return self.buy_value / self.buy_qty if self.buy_qty else 0.0
+
+    @property
+    def sell_avg(self):
+        return self.sell_value / self.sell_qty if self.sell_qty else 0.0
+
+    @property
+    def avg_price(self):
+        """Average price of the open side, 0 when flat."""
+        if self.net_qty > 0:
+            return self.buy_avg
+        if self.net_qty < 0:
+            return self.sell_avg
+        return 0.0
+
+    @property
+    def realized(self):
+        return min(self.buy_qty, self.sell_qty) * (self.sell_avg - self.buy_avg)
+
+    def unrealized(self, ltp):
+        return self.net_qty * (ltp - self.avg_price)
+
+    def pnl(self, ltp):
+        return self.sell_value - self.buy_value + self.net_qty * ltp
+
+
+class PositionBook:
+    """
+    Positions of one broker account, kept in the Redis hash ``POSITION_BOOK_<broker>_<username>``.
+
+    Our own fills are added to the per symbol totals with HINCRBY as they complete, so fills of the
+    same account from several processes never overwrite each other. `reconcile_book` replaces the
+    totals with the broker's position report, so readers never have to call the broker themselves.
+    """
+
+    def __init__(self, broker_name, username):
+        self.broker_name = broker_name
+        self.username = username
+        self.margin = 0
+        self.positions = {}
+        # bumped on every change, readers rebuild what they derived from the book when it moves
+        self.version = 0
+
+    @staticmethod
+    def key(broker_name, username):
+        return f"POSITION_BOOK_{broker_name}_{username}"
+
+    @classmethod
+    def from_hash(cls, broker_name, username, data: dict):
+        book = cls(broker_name, username)
+        totals = {}
+        for field, value in data.items():
+            field, value = field.decode(), value.decode()
+            if field == "margin":
+                book.margin = float(value)
+            elif field == "version":
+                book.version = int(value)
+            else:
+                symbol, total = field.rsplit("|", 1)
+                totals.setdefault(symbol, {})[total] = float(value)
+        book.positions = {symbol: Position(**values) for symbol, values in totals.items()}
+        return book
+
+    def to_hash(self) -> dict:
+        data = {"margin": float(self.margin or 0), "version": self.version}
+        for symbol, position in self.positions.items():
+            data.update({f"{symbol}|{total}": getattr(position, total) for total in TOTALS})
+        return data
+
+    @classmethod
+    def load(cls, broker_name, username):
+        return cls.from_hash(broker_name, username, get_redis().hgetall(cls.key(broker_name, username)))
+
+    @classmethod
+    def load_many(cls, accounts) -> dict:
+        """Books of `accounts`, (broker_name, username) pairs, keyed by their cache key."""
+        with get_redis().pipeline(transaction=False) as pipe:
+            for account in accounts:
+                pipe.hgetall(cls.key(*account))
+            hashes = pipe.execute()
+        return {cls.key(*account): cls.from_hash(*account, data) for account, data in zip(accounts, hashes)}
+
+    def position(self, tradingsymbol) -> Position:
+        if tradingsymbol not in self.positions:
+            self.positions[tradingsymbol] = Position()
+        return self.positions[tradingsymbol]
+
+    def reconcile(self, df: pd.DataFrame, margin=None):
+        """
+        Replace the totals with the broker's positions, a frame of tradingsymbol, buy_qty, sell_qty,
+        buy_value and sell_value. Returns the symbols whose net quantity had drifted.
+        """
+        drifted = []
+        reported = {}
+        for row in df.to_dict("records"):
+            position = Position(row["buy_qty"], row["sell_qty"], row["buy_value"], row["sell_value"])
+            if self.positions.get(row["tradingsymbol"], Position()).net_qty != position.net_qty:
+                drifted.append(row["tradingsymbol"])
+            reported[row["tradingsymbol"]] = position
+
+        drifted.extend(
+            symbol for symbol, position in self.positions.items() if symbol not in reported and position.net_qty
+        )
+        self.positions = reported
+        if margin is not None:
+            self.margin = margin
+        return drifted
+
+    def frame(self) -> pd.DataFrame:
+        return pd.DataFrame(
+            [
+                {
+                    "username": self.username,
+                    "broker_name": self.broker_name,
+                    "margin": self.margin,
+                    "tradingsymbol": symbol,
+                    "buy_qty": position.buy_qty,
+                    "sell_qty": position.sell_qty,
+                    "sell_value": position.sell_value,
+                    "buy_value": position.buy_value,
+                    "net_qty": position.net_qty,
+                    "avg_price": position.avg_price,
+                    "realized": position.realized,
+                }
+                for symbol, position in self.positions.items()
+            ],
+            columns=BOOK_COLUMNS,
+        )
+
+
+def accounts() -> list:
+    """(broker_name, username) of every account with a book."""
+    return sorted(tuple(member.decode().split(":", 1)) for member in get_redis().smembers(ACCOUNTS_KEY))
+
+
+def record_fill(broker_name, username, tradingsymbol, transaction_type, quantity, price):
+    if not quantity:
+        return
+    side = "buy" if transaction_type == "BUY" else "sell"
+    key = PositionBook.key(broker_name, username)
+    with get_redis().pipeline() as pipe:
+        pipe.hincrby(key, f"{tradingsymbol}|{side}_qty", int(quantity))
+        pipe.hincrbyfloat(key, f"{tradingsymbol}|{side}_value", int(quantity) * float(price))
+        pipe.hincrby(key, "version", 1)
+        pipe.sadd(ACCOUNTS_KEY, f"{broker_name}:{username}")
+        pipe.execute()
+
+
+def reconcile_book(broker_name, username, df: pd.DataFrame, margin=None):
+    """
+    Replace the account's book with the broker's positions, see `PositionBook.reconcile`. Retried
+    when a fill lands meanwhile. Returns the new book and the symbols whose net quantity had drifted.
+    """
+    key = PositionBook.key(broker_name, username)
+    with get_redis().pipeline() as pipe:
+        while True:
+            try:
+                pipe.watch(key)
+                book = PositionBook.from_hash(broker_name, username, pipe.hgetall(key))
+                drifted = book.reconcile(df, margin)
+                book.version += 1
+
+                pipe.multi()
+                pipe.delete(key)
+                pipe.hset(key, mapping=book.to_hash())
+                pipe.sadd(ACCOUNTS_KEY, f"{broker_name}:{username}")
+                pipe.execute()
+            except redis.WatchError:
+                continue
+            return book, drifted
+
+
+def open_positions() -> pd.DataFrame:
+    """Every saved book as one frame, what the dashboards read instead of the broker position APIs."""
+    frames = [book.frame() for book in PositionBook.load_many(accounts()).values()]
+    if not frames:
+        return pd.DataFrame(columns=BOOK_COLUMNS)
+    return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,121 @@
+import numpy as np
+import pandas as pd
+
+from utils.position_book import PositionBook, accounts
+
+# Chain vectors multiplied with the position matrix, last price first.
+RISK_FIELDS = ("last_price", "delta", "gamma", "vega", "theta")
+
+GREEKS = RISK_FIELDS[1:]
+
+ACCOUNT_COLUMNS = [
+    "username",
+    "broker_name",
+    "margin",
+    "pnl",
+    "ce_buy_qty",
+    "ce_sell_qty",
+    "pe_buy_qty",
+    "pe_sell_qty",
+    *GREEKS,
+]
+
+
+class RiskAggregator:
+    """
+    Net quantity of every account in every chain instrument, as one accounts x instruments matrix.
+
+    The matrix is rebuilt only when a position book is saved or the chain layout changes. `compute`
+    multiplies it with the live prices and the greeks of the chain, so pnl, delta, gamma, vega and
+    theta of every account, strategy and the whole firm come out of one matrix product.
+    """
+
+    def __init__(self):
+        self.chain = None
+        self.versions = None
+        self.accounts = []
+        self.qty = np.zeros((0, 0))
+        self.cash = np.zeros(0)
+        self.margin = np.zeros(0)
+        self.sides = np.zeros((0, 2))
+
+    def build(self, chain, books):
+        self.chain = chain
+        self.versions = {key: book.version for key, book in books.items()}
+        self.accounts = [(book.broker_name, book.username) for book in books.values()]
+        self.qty = np.zeros((len(books), chain.n_rows))
+        self.cash = np.zeros(len(books))
+        self.margin = np.array([float(book.margin or 0) for book in books.values()])
+
+        for i, book in enumerate(books.values()):
+            for symbol, position in book.positions.items():
+                # like the former merge with the chain, symbols outside it are left out
+                row = chain.tradingsymbol_index.get(symbol)
+                if row is not None:
+                    self.qty[i, row] = position.net_qty
+                    self.cash[i] += position.sell_value - position.buy_value
+
+        instrument_type = chain.meta["instrument_type"].to_numpy()
+        self.sides = np.column_stack([instrument_type == "CE", instrument_type == "PE"]).astype(float)
+
+    def refresh(self, chain):
+        books = PositionBook.load_many(accounts())
+        if chain is not self.chain or {key: book.version for key, book in books.items()} != self.versions:
+            self.build(chain, books)
+
+    def vectors(self, greeks: pd.DataFrame):
+        """instruments x RISK_FIELDS, live prices from the chain store, greeks of the last solve."""
+        values = np.zeros((self.chain.n_rows, len(RISK_FIELDS)))
+        values[:, 0] = self.chain.column("last_price")
+
+        if greeks is not None and not greeks.empty:
+            tradingsymbol = self.chain.meta["tradingsymbol"].to_numpy()
+            if len(greeks) != self.chain.n_rows or not np.array_equal(
+                greeks["tradingsymbol"].to_numpy(), tradingsymbol
+            ):
+                greeks = greeks.set_index("tradingsymbol").reindex(tradingsymbol)
+            values[:, 1:] = greeks[list(GREEKS)].to_numpy(dtype=float)
+
+        return np.nan_to_num(values)
+
+    def compute(self, chain, greeks=None, members=None):
+        """
+        Risk of every account, of every strategy in `members` ({pk: [(broker_name, username)]}) and of
+        the firm. Strategies sharing an account each count it in full, as the strategy dashboards do.
+        """
+        self.refresh(chain)
+        exposure = self.qty @ self.vectors(greeks)
+        pnl = self.cash + exposure[:, 0]
+        sides = np.clip(self.qty, 0, None) @ self.sides, np.clip(-self.qty, 0, None) @ self.sides
+
+        accounts = pd.DataFrame(
+            {
+                "username": [username for _, username in self.accounts],
+                "broker_name": [broker_name for broker_name, _ in self.accounts],
+                "margin": self.margin,
+                "pnl": pnl,
+                "ce_buy_qty": sides[0][:, 0],
+                "ce_sell_qty": sides[1][:, 0],
+                "pe_buy_qty": sides[0][:, 1],
+                "pe_sell_qty": sides[1][:, 1],
+                **{field: exposure[:, idx + 1] for idx, field in enumerate(GREEKS)},
+            },
+            columns=ACCOUNT_COLUMNS,
+        )
+
+        totals = np.column_stack([pnl, exposure[:, 1:]])
+        members = members or {}
+        index = {account: i for i, account in enumerate(self.accounts)}
+        membership = np.zeros((len(members), len(self.accounts)))
+        for row, accounts_of in enumerate(members.values()):
+            for account in accounts_of:
+                if account in index:
+                    membership[row, index[account]] = 1
+
+        strategies = membership @ totals
+        fields = ("pnl", *GREEKS)
+        return {
+            "accounts": accounts,
+            "strategies": {pk: dict(zip(fields, strategies[row].round(2).tolist())) for row, pk in enumerate(members)},
+            "firm": dict(zip(fields, totals.sum(axis=0).round(2).tolist())),
+        }
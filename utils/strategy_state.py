@@ -0,0 +1,145 @@
+import json
+
+import redis
+from django.contrib.auth import get_user_model
+
+from utils.multi_broker import Broker as MultiBroker
+from utils.timeseries import get_redis
+
+DEPLOYED_KEY = "DEPLOYED_STRATEGIES"
+
+# live objects of a user_params entry, everything else is kept in the account
+LIVE_FIELDS = ("user", "order_obj")
+
+
+def state_key(pk):
+    return f"STRATEGY_STATE_{pk}"
+
+
+def account(user_param) -> dict:
+    """Serializable form of a strategy's user_params entry: username, broker and its quantities."""
+    return {
+        "username": user_param["user"].username,
+        "broker": user_param["order_obj"].broker_name,
+        **{field: value for field, value in user_param.items() if field not in LIVE_FIELDS},
+    }
+
+
+def read(pk) -> dict | None:
+    """State of a deployed strategy, ``{"version", "no_of_strategy", "accounts"}``, None when not deployed."""
+    version, state = get_redis().hmget(state_key(pk), "version", "state")
+    if state is None:
+        return None
+    return {"version": int(version), **json.loads(state)}
+
+
+def version(pk) -> int:
+    """Bumped on every update, a single HGET that loops can poll to see if their copy is stale."""
+    return int(get_redis().hget(state_key(pk), "version") or 0)
+
+
+def is_deployed(pk) -> bool:
+    return bool(get_redis().sismember(DEPLOYED_KEY, str(pk)))
+
+
+def deployed() -> list:
+    return sorted(pk.decode() for pk in get_redis().smembers(DEPLOYED_KEY))
+
+
+def accounts(pk) -> list:
+    state = read(pk)
+    return state["accounts"] if state else []
+
+
+def update(pk, change) -> dict | None:
+    """
+    Apply `change` to the state of `pk` atomically and return the new state. `change` gets the current
+    state (None when not deployed) and returns the new one, or None to take the strategy down. It is
+    retried on a fresh state whenever another writer got in first, so it must not have side effects.
+    """
+    key = state_key(pk)
+    with get_redis().pipeline() as pipe:
+        while True:
+            try:
+                pipe.watch(key)
+                current = pipe.hget(key, "state")
+                state = change(json.loads(current) if current is not None else None)
+
+                pipe.multi()
+                if state is None:
+                    pipe.hdel(key, "state")
+                    pipe.srem(DEPLOYED_KEY, str(pk))
+                else:
+                    pipe.hset(key, "state", json.dumps(state))
+                    pipe.sadd(DEPLOYED_KEY, str(pk))
+                # the version outlives the state, so a redeployed strategy never repeats one
+                pipe.hincrby(key, "version", 1)
+                new_version = pipe.execute()[-1]
+            except redis.WatchError:
+                continue
+            return None if state is None else {"version": new_version, **state}
+
+
+def deploy(pk, user_params, no_of_strategy=None) -> dict:
+    state = {"no_of_strategy": no_of_strategy, "accounts": [account(user) for user in user_params]}
+    return update(pk, lambda _: state)
+
+
+def add_account(pk, user_param) -> dict | None:
+    """Add an account to a deployed strategy, replacing an earlier entry of the same username."""
+    new = account(user_param)
+
+    def change(state):
+        if state is None:
+            return None
+        others = [row for row in state["accounts"] if row["username"] != new["username"]]
+        return {**state, "accounts": [*others, new]}
+
+    return update(pk, change)
+
+
+def remove_account(pk, username) -> dict | None:
+    """Remove an account, the strategy is taken down with its last one."""
+
+    def change(state):
+        if state is None:
+            return None
+        remaining = [row for row in state["accounts"] if row["username"] != username]
+        return {**state, "accounts": remaining} if remaining else None
+
+    return update(pk, change)
+
+
+def remove_accounts(keep):
+    """Keep only the accounts passing `keep` in every deployed strategy, the strategies stay deployed."""
+    for pk in deployed():
+        update(pk, lambda state: state and {**state, "accounts": [row for row in state["accounts"] if keep(row)]})
+
+
+def remove(pk):
+    update(pk, lambda _: None)
+
+
+async def user_params(pk, current=()) -> list:
+    """
+    user_params of the deployed strategy `pk`, with a user and a broker session per account. Entries of
+    `current` for the same username and broker are reused, so only new accounts hit the database.
+    """
+    live = {(row["user"].username, row["order_obj"].broker_name): row for row in current}
+    params = []
+    for row in accounts(pk):
+        username, broker = row["username"], row["broker"]
+        if (username, broker) in live:
+            user, order_obj = live[username, broker]["user"], live[username, broker]["order_obj"]
+        else:
+            user = await get_user_model().objects.aget(username=username)
+            order_obj = await MultiBroker(username, broker)
+            order_obj.strategy_id = int(pk)
+        params.append(
+            {
+                "user": user,
+                "order_obj": order_obj,
+                **{field: value for field, value in row.items() if field not in ("username", "broker")},
+            }
+        )
+    return params
@@ -0,0 +1,123 @@
+import operator
+
+import numpy as np
+import pandas as pd
+
+LADDERS_KEY = "OPTION_GREEKS_LADDERS"
+
+# columns of the greeks frame a ladder can be searched on
+FIELDS = ("delta", "last_price", "sigma")
+
+OPERATORS = {">=": operator.ge, ">": operator.gt, "<=": operator.le, "<": operator.lt}
+
+
+def envelope(values, end, above):
+    """
+    Running max (`above`) or min of `values` from the `end` side, the tightest monotone bound of them.
+    The first (or last) strike the envelope passes a threshold at is the first (or last) strike passing
+    it in `values` too, so it can be searched with ``np.searchsorted``. Stored ascending, negated when
+    the envelope falls.
+    """
+    filled = np.where(np.isnan(values), -np.inf if above else np.inf, values)
+    accumulate = np.maximum.accumulate if above else np.minimum.accumulate
+    bound = accumulate(filled) if end == "first" else accumulate(filled[::-1])[::-1]
+    return bound if (end == "first") == above else -bound
+
+
+class StrikeLadder:
+    """
+    Legs of one option type sorted by strike, with the delta, last price and sigma arrays in the same
+    order. `first` and `last` find the lowest and highest strike passing a threshold with a binary
+    search, no DataFrame is built for a lookup.
+    """
+
+    def __init__(self, legs: pd.DataFrame):
+        order = np.argsort(legs["strike"].to_numpy(dtype=float), kind="stable")
+        self.strike = legs["strike"].to_numpy(dtype=float)[order]
+        self.tradingsymbol = legs["tradingsymbol"].to_numpy()[order]
+        self.values = {field: legs[field].to_numpy(dtype=float)[order] for field in FIELDS}
+        self.envelopes = {
+            (field, end, above): envelope(values, end, above)
+            for field, values in self.values.items()
+            for end in ("first", "last")
+            for above in (True, False)
+        }
+
+    def __len__(self):
+        return len(self.strike)
+
+    @property
+    def delta(self):
+        return self.values["delta"]
+
+    @property
+    def last_price(self):
+        return self.values["last_price"]
+
+    @property
+    def sigma(self):
+        return self.values["sigma"]
+
+    def bounds(self, above, below):
+        """Index range of the strikes strictly between `above` and `below`, either may be None."""
+        lo = 0 if above is None else int(np.searchsorted(self.strike, above, "right"))
+        hi = len(self) if below is None else int(np.searchsorted(self.strike, below, "left"))
+        return lo, hi
+
+    def search(self, field, op, value, end):
+        above = op[0] == ">"
+        bound = self.envelopes[field, end, above]
+        key = value if (end == "first") == above else -value
+        if end == "first":
+            return int(np.searchsorted(bound, key, "left" if "=" in op else "right"))
+        return int(np.searchsorted(bound, key, "right" if "=" in op else "left")) - 1
+
+    def scan(self, field, op, value, lo, hi):
+        return lo + np.flatnonzero(OPERATORS[op](self.values[field][lo:hi], value))
+
+    def first(self, field, op, value, above=None, below=None) -> int | None:
+        """Index of the lowest strike whose `field` is `op` `value`, among strikes between `above` and `below`."""
+        lo, hi = self.bounds(above, below)
+        idx = self.search(field, op, value, "first")
+        if idx < lo:
+            # a strike left of the range passes, the envelope can't see past it so look in the range
+            hits = self.scan(field, op, value, lo, hi)
+            return int(hits[0]) if len(hits) else None
+        return idx if idx < hi else None
+
+    def last(self, field, op, value, above=None, below=None) -> int | None:
+        """Index of the highest strike whose `field` is `op` `value`, among strikes between `above` and `below`."""
+        lo, hi = self.bounds(above, below)
+        idx = self.search(field, op, value, "last")
+        if idx >= hi:
+            hits = self.scan(field, op, value, lo, hi)
+            return int(hits[-1]) if len(hits) else None
+        return idx if idx >= lo else None
+
+
+class ChainLadders:
+    """CE and PE ladders of the nearest expiry of one greeks snapshot, published by the greeks engine."""
+
+    def __init__(self, timestamp, ladders: dict):
+        self.timestamp = timestamp
+        self.ladders = ladders
+
+    @classmethod
+    def from_frame(cls, instruments: pd.DataFrame):
+        if "expiry" in instruments.columns:
+            instruments = instruments[instruments["expiry"] == instruments["expiry"].min()]
+        timestamp = instruments["timestamp"].iloc[0] if "timestamp" in instruments.columns else None
+        return cls(
+            timestamp,
+            {
+                option_type: StrikeLadder(instruments[instruments["instrument_type"] == option_type])
+                for option_type in ("CE", "PE")
+            },
+        )
+
+    def matches(self, instruments: pd.DataFrame) -> bool:
+        """Whether these ladders were built from the same snapshot as `instruments`."""
+        return self.timestamp is not None and instruments["timestamp"].iloc[0] == self.timestamp
+
+    def __getitem__(self, option_type) -> StrikeLadder:
+        return self.ladders[option_type]
@@ -0,0 +1,104 @@
+import pickle
+
+import pandas as pd
+import redis
+from django.conf import settings
+from django.utils import timezone
+
+SNAPSHOT_COLUMNS = [
+    "timestamp",
+    "kotak_neo_instrument_token",
+    "kotak_sec_instrument_token",
+    "kite_instrument_token",
+    "tradingsymbol",
+    "expiry",
+    "strike",
+    "instrument_type",
+    "last_price",
+    "exchange_timestamp",
+    "last_trade_time",
+    "oi",
+    "bnf_ltp",
+    "atm",
+    "sigma",
+    "delta",
+]
+
+PCR_COLUMNS = [
+    "timestamp",
+    "pe_total_oi",
+    "ce_total_oi",
+    "pcr",
+    "strike",
+    "ce_iv",
+    "pe_iv",
+    "total_iv",
+    "ce_premium",
+    "pe_premium",
+    "total_premium",
+]
+
+_client = None
+
+
+def get_redis():
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(settings.CACHES["default"]["LOCATION"])
+    return _client
+
+
+def to_ms(timestamp):
+    return int(timestamp.timestamp() * 1000)
+
+
+class TimeSeries:
+    """
+    Append-only frames kept in one Redis stream per trading day.
+
+    Every append is a single XADD with the snapshot time as the entry id, so writes cost the same at
+    15:29 as at 9:15 and range reads only load the entries asked for.
+    """
+
+    def __init__(self, name, columns):
+        self.name = name
+        self.columns = columns
+
+    def key(self, day=None):
+        return f"TS_{self.name}_{(day or timezone.localdate()):%Y%m%d}"
+
+    def append(self, timestamp, df):
+        key = self.key(timestamp.date())
+        data = pickle.dumps(df[self.columns].reset_index(drop=True), protocol=pickle.HIGHEST_PROTOCOL)
+
+        pipe = get_redis().pipeline()
+        pipe.xadd(key, {"data": data}, id=f"{to_ms(timestamp)}-0")
+        pipe.expire(key, settings.TIMESERIES_RETENTION_DAYS * 86400)
+        added, _ = pipe.execute(raise_on_error=False)
+        if isinstance(added, redis.ResponseError):
+            # not after the last entry, a second or restarted writer or the clock stepping back, keep the first
+            print(f"{self.name} APPEND SKIPPED {timestamp}: {added}")
+
+    def to_frame(self, entries):
+        frames = [pickle.loads(fields[b"data"]) for _, fields in entries]
+        if not frames:
+            return pd.DataFrame(columns=self.columns)
+        return pd.concat(frames, ignore_index=True)
+
+    def range(self, start=None, end=None, day=None):
+        """Rows appended between `start` and `end` inclusive, the whole day when neither is given."""
+        day = day or (start or end or timezone.localtime()).date()
+        entries = get_redis().xrange(
+            self.key(day),
+            min=to_ms(start) if start else "-",
+            max=to_ms(end) if end else "+",
+        )
+        return self.to_frame(entries)
+
+    def latest(self, count=1, day=None):
+        """Rows of the last `count` appends, oldest first."""
+        return self.to_frame(get_redis().xrevrange(self.key(day), count=count)[::-1])
+
+
+BNF_SNAPSHOT_5SEC = TimeSeries("BNF_SNAPSHOT_5SEC", SNAPSHOT_COLUMNS)
+LIVE_BNF_PCR = TimeSeries("LIVE_BNF_PCR", PCR_COLUMNS)